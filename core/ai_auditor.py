@@ -7,13 +7,23 @@ Extrai número de autorização e data, e audita conforme master_prompt.md.
 from __future__ import annotations
 
 import base64
+import hashlib
 import io
 import json
-from typing import Any, List
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, AsyncIterator, Callable, Iterator, List
 
 from PIL import Image as PILImage
 
-from core.config import get_active_api_key, get_master_prompt
+from core import limitador
+from core.audit_cache import AuditCache, build_cache_key
+from core.config import APP_DATA_DIR, MODELOS_CASCATA, get_active_api_key, get_master_prompt
 
 
 # ─── Resultado da auditoria ─────────────────────────────────────────────────
@@ -25,6 +35,21 @@ class AuditResult:
         self.data: str = raw.get("data", "")
         self.erros: List[str] = raw.get("erros", [])
         self.observacoes: str = raw.get("observacoes", "")
+        # True quando o resultado veio do cache local (sem chamada à API)
+        self.do_cache: bool = False
+        # Métricas da chamada (payload enviado, latências) — não persistidas
+        self.metricas: dict[str, Any] = {}
+        # Confiança por regra [{"regra", "confianca"}] (modo cascata) — não persistida
+        self.confianca: List[dict[str, Any]] = raw.get("confianca") or []
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "aprovado": self.aprovado,
+            "autorizacao": self.autorizacao,
+            "data": self.data,
+            "erros": list(self.erros),
+            "observacoes": self.observacoes,
+        }
 
     def __repr__(self) -> str:
         return (
@@ -34,22 +59,198 @@ class AuditResult:
         )
 
 
-# ─── Helpers ─────────────────────────────────────────────────────────────────
+# ─── Pré-processamento de imagens ───────────────────────────────────────────
+
+# Resolução efetiva de visão por provedor: (lado maior máx., lado menor máx.).
+# Acima disso o próprio provedor reduz a imagem — enviar mais pixels só gasta upload.
+#  - OpenAI (detail=high): cabe em 2048x2048 e depois o lado menor vai a 768 px.
+#  - Anthropic: imagens acima de ~1568 px no lado maior são reduzidas.
+#  - Gemini: trabalha em blocos de 768 px; ~3072 px no lado maior é suficiente.
+VISION_PROFILES: dict[str, tuple[int, int]] = {
+    "openai": (2048, 768),
+    "anthropic": (1568, 1568),
+    "gemini": (3072, 3072),
+    "openrouter": (2048, 1024),
+}
+
+# Orçamento de bytes por imagem após a codificação
+IMAGE_BYTE_BUDGET = 450 * 1024
+
+# Qualidades tentadas (em ordem) até caber no orçamento
+_QUALITY_STEPS = (85, 75, 65, 55, 45)
+
+# Desvio médio entre canais abaixo do qual a página é tratada como sem cor
+_GRAYSCALE_TOLERANCE = 6.0
+
+
+class ImagemPreparada:
+    """Página já redimensionada e codificada, pronta para envio ao provedor."""
+
+    def __init__(self, data: bytes, mime_type: str, size: tuple[int, int]) -> None:
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+
+    @property
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode()
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
 
-def _image_to_base64(img: PILImage.Image, fmt: str = "JPEG") -> str:
-    """Converte imagem PIL para string base64."""
+
+def vision_profile(provider: str, model: str) -> tuple[int, int]:
+    """(lado maior, lado menor) máximos úteis para o provedor/modelo."""
+    # Modelos do OpenRouter trazem o provedor de origem no prefixo (ex: "google/...")
+    if provider == "openrouter":
+        origem = model.split("/", 1)[0]
+        mapa = {"google": "gemini", "openai": "openai", "anthropic": "anthropic"}
+        if origem in mapa:
+            return VISION_PROFILES[mapa[origem]]
+    return VISION_PROFILES.get(provider, VISION_PROFILES["openrouter"])
+
+
+def _is_grayscale(img: PILImage.Image) -> bool:
+    """Detecta páginas sem conteúdo colorido (amostra reduzida, rápido)."""
+    if img.mode in ("L", "1"):
+        return True
+    from PIL import ImageChops, ImageStat
+
+    sample = img.convert("RGB")
+    sample.thumbnail((128, 128))
+    r, g, b = sample.split()
+    diff_rg = ImageStat.Stat(ImageChops.difference(r, g)).mean[0]
+    diff_gb = ImageStat.Stat(ImageChops.difference(g, b)).mean[0]
+    return max(diff_rg, diff_gb) < _GRAYSCALE_TOLERANCE
+
+
+def _fit_size(w: int, h: int, max_long: int, max_short: int) -> tuple[int, int]:
+    scale = min(1.0, max_long / max(w, h), max_short / min(w, h))
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+def _encode(img: PILImage.Image, fmt: str, quality: int) -> bytes:
     buf = io.BytesIO()
-    img.save(buf, format=fmt, quality=85)
-    return base64.b64encode(buf.getvalue()).decode()
+    img.save(buf, format=fmt, quality=quality, optimize=True)
+    return buf.getvalue()
 
 
-def _build_prompt(master_prompt: str, tipo_transacao: str, total_imagens: int) -> str:
-    """Constrói o prompt completo de auditoria."""
-    return f"""
-{master_prompt}
+def preparar_imagem(
+    img: PILImage.Image,
+    provider: str,
+    model: str,
+    byte_budget: int = IMAGE_BYTE_BUDGET,
+    formato: str = "JPEG",
+) -> ImagemPreparada:
+    """
+    Reduz a página para a resolução efetiva do provedor/modelo, converte para
+    tons de cinza quando não há cor e escolhe a maior qualidade que cabe em
+    `byte_budget`. `formato` pode ser "JPEG" ou "WEBP" (cai para JPEG se o
+    Pillow não tiver suporte a WebP).
+    """
+    max_long, max_short = vision_profile(provider, model)
+    new_size = _fit_size(img.width, img.height, max_long, max_short)
+    work = img
+    if new_size != img.size:
+        work = img.resize(new_size, PILImage.LANCZOS)
+
+    work = work.convert("L") if _is_grayscale(work) else work.convert("RGB")
+
+    fmt = formato.upper()
+    data = b""
+    for quality in _QUALITY_STEPS:
+        try:
+            data = _encode(work, fmt, quality)
+        except (KeyError, OSError):
+            fmt = "JPEG"
+            data = _encode(work, fmt, quality)
+        if len(data) <= byte_budget:
+            break
+
+    mime = "image/webp" if fmt == "WEBP" else "image/jpeg"
+    return ImagemPreparada(data, mime, work.size)
+
+
+def preparar_imagens(
+    images: List[PILImage.Image],
+    provider: str,
+    model: str,
+    settings: dict[str, Any] | None = None,
+) -> List[ImagemPreparada]:
+    settings = settings or {}
+    budget = int(settings.get("ai_image_budget_kb", IMAGE_BYTE_BUDGET // 1024)) * 1024
+    formato = settings.get("ai_image_format", "JPEG")
+    return [preparar_imagem(img, provider, model, budget, formato) for img in images]
+
+
+# ─── Prompts ─────────────────────────────────────────────────────────────────
+
+# Formato de resposta exigido da IA (compartilhado por todos os modos de auditoria)
+OUTPUT_SCHEMA = """Responda APENAS com um JSON válido, sem markdown, sem texto extra:
+{
+  "aprovado": true ou false,
+  "autorizacao": "número extraído ou vazio se não encontrado",
+  "data": "data no formato DD-MM-AAAA ou vazio se não encontrada",
+  "erros": ["lista de erros encontrados, vazia se aprovado"],
+  "observacoes": "observações adicionais relevantes"
+}"""
+
+# O mesmo formato em JSON Schema, para a saída estruturada nativa dos provedores
+# (OpenAI json_schema, Gemini response_schema, Anthropic tool use)
+ESQUEMA_AUDITORIA: dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "aprovado": {"type": "boolean"},
+        "autorizacao": {"type": "string"},
+        "data": {"type": "string"},
+        "erros": {"type": "array", "items": {"type": "string"}},
+        "observacoes": {"type": "string"},
+    },
+    "required": ["aprovado", "autorizacao", "data", "erros", "observacoes"],
+    "additionalProperties": False,
+}
+
+# Modo cascata: o modelo rápido também informa a confiança em cada regra
+ESQUEMA_CASCATA: dict[str, Any] = {
+    **ESQUEMA_AUDITORIA,
+    "properties": {
+        **ESQUEMA_AUDITORIA["properties"],
+        "confianca": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"regra": {"type": "string"}, "confianca": {"type": "number"}},
+                "required": ["regra", "confianca"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ESQUEMA_AUDITORIA["required"] + ["confianca"],
+}
+
+INSTRUCAO_CONFIANCA = (
+    'Inclua também no JSON o campo "confianca": uma lista com um item por regra verificada, '
+    'no formato {"regra": "nome curto da regra", "confianca": número de 0 a 1}, indicando o '
+    "quanto a leitura dos documentos permite ter certeza do resultado daquela regra."
+)
+
+# Nome da ferramenta usada para forçar a saída estruturada na Anthropic
+_FERRAMENTA_RESULTADO = "registrar_auditoria"
+
+
+def prompt_de_sistema(master_prompt: str) -> str:
+    """
+    Parte fixa do prompt (regras do master_prompt.md + formato da resposta).
+    Vai como bloco de sistema, antes de tudo que muda por transação, para que os
+    provedores reaproveitem esse prefixo do cache deles entre auditorias.
+    """
+    return f"{master_prompt.strip()}\n\n---\n\n{OUTPUT_SCHEMA}"
 
----
 
+def _build_prompt(tipo_transacao: str, total_imagens: int, contexto: str = "") -> str:
+    """Parte variável do prompt de auditoria (`contexto`: ex. verificações locais já feitas)."""
+    return f"""
 INSTRUÇÕES ADICIONAIS PARA ESTA ANÁLISE:
 
 Você está analisando um dossiê de transação do tipo: **{tipo_transacao}**
@@ -63,177 +264,1432 @@ Leia o Cupom Fiscal e/ou Cupom Vinculado e extraia:
 - Data da transação (formato DD-MM-AAAA)
 
 **TAREFA 2 - AUDITORIA COMPLETA:**
-Analise todos os documentos conforme as regras detalhadas acima.
-
-Responda APENAS com um JSON válido, sem markdown, sem texto extra:
-{{
-  "aprovado": true ou false,
-  "autorizacao": "número extraído ou vazio se não encontrado",
-  "data": "data no formato DD-MM-AAAA ou vazio se não encontrada",
-  "erros": ["lista de erros encontrados, vazia se aprovado"],
-  "observacoes": "observações adicionais relevantes"
-}}
+Analise todos os documentos conforme as regras das instruções de sistema e responda
+no formato JSON indicado nelas.
+{chr(10) + contexto if contexto else ""}
 """.strip()
 
 
+def _reparar_json(texto: str) -> str:
+    """
+    Conserta defeitos comuns do JSON gerado por modelos: aspas tipográficas,
+    vírgula antes de fechar, literais do Python (True/False/None) e objeto
+    truncado (fecha a string, remove a chave pendente e fecha as chaves abertas).
+    """
+    texto = texto.replace("\u201c", '"').replace("\u201d", '"')
+    saida: List[str] = []
+    pilha: List[str] = []
+    em_str = esc = False
+    i = 0
+    while i < len(texto):
+        c = texto[i]
+        if em_str:
+            saida.append(c)
+            if esc:
+                esc = False
+            elif c == "\\":
+                esc = True
+            elif c == '"':
+                em_str = False
+            i += 1
+            continue
+        if c == '"':
+            em_str = True
+        elif c in "{[":
+            pilha.append("}" if c == "{" else "]")
+        elif c in "}]":
+            while saida and saida[-1] in " \t\r\n,":
+                saida.pop()
+            if pilha:
+                pilha.pop()
+        else:
+            m = re.match(r"True|False|None", texto[i:])
+            if m and not (saida and (saida[-1].isalnum() or saida[-1] == "_")):
+                saida.append({"True": "true", "False": "false", "None": "null"}[m.group()])
+                i += m.end()
+                continue
+        saida.append(c)
+        i += 1
+
+    reparado = "".join(saida)
+    if em_str:
+        reparado += '"'
+    reparado = reparado.rstrip()
+    # Chave sem valor no fim ("campo": ) ou vírgula pendente
+    reparado = re.sub(r',?\s*"(?:[^"\\]|\\.)*"\s*:\s*$', "", reparado)
+    reparado = reparado.rstrip().rstrip(",")
+    return reparado + "".join(reversed(pilha))
+
+
 def _parse_json_response(text: str) -> dict[str, Any]:
-    """Extrai e parseia o JSON da resposta da IA."""
-    text = text.strip()
-    if text.startswith("```"):
-        # Remove a primeira e última linha (```json e ```)
-        inner_lines = text.split("\n")
-        inner_lines.pop(0)   # remove ```json
-        if inner_lines and inner_lines[-1].startswith("```"):
-            inner_lines.pop(-1)  # remove ```
-        text = "\n".join(inner_lines)
-    result: dict[str, Any] = json.loads(text)
+    """
+    Extrai e parseia o JSON da resposta da IA, tolerando texto antes/depois do objeto,
+    cercas de markdown e os defeitos tratados por _reparar_json.
+    Levanta json.JSONDecodeError se nenhum objeto puder ser recuperado.
+    """
+    inicio = text.find("{")
+    if inicio < 0:
+        return json.loads(text.strip())  # levanta JSONDecodeError com a mensagem original
+    fim = text.rfind("}")
+    trecho = text[inicio:fim + 1] if fim > inicio else text[inicio:]
+    try:
+        result: dict[str, Any] = json.loads(trecho)
+        return result
+    except json.JSONDecodeError:
+        pass
+    try:
+        # Mais de um objeto (ex: o JSON repetido): vale o primeiro completo
+        result, _ = json.JSONDecoder().raw_decode(text, inicio)
+        return result
+    except json.JSONDecodeError:
+        pass
+    # Cerca de fechamento (```) ou texto depois de um objeto truncado também saem aqui
+    result = json.loads(_reparar_json(re.sub(r"\s*```\s*$", "", text[inicio:].strip())))
     return result
 
 
-# ─── Clientes por provedor ───────────────────────────────────────────────────
+def _tipo_ok(valor: Any, tipo: str) -> bool:
+    if tipo == "boolean":
+        return isinstance(valor, bool)
+    if tipo == "array":
+        return isinstance(valor, list)
+    if tipo == "string":
+        return isinstance(valor, str)
+    return True
 
-def _audit_gemini(
-    images: List[PILImage.Image],
-    prompt: str,
-    api_key: str,
-    model: str,
-) -> dict[str, Any]:
-    import google.generativeai as genai  # type: ignore[import-untyped]
 
-    genai.configure(api_key=api_key)
-    client = genai.GenerativeModel(model)
+def _campos_por_regex(texto: str, esquema: dict[str, Any]) -> dict[str, Any]:
+    """Último recurso: lê campo a campo (quando o objeto inteiro não se recupera)."""
+    campos: dict[str, Any] = {}
+    for nome, prop in esquema.get("properties", {}).items():
+        chave = rf'"{re.escape(nome)}"\s*:\s*'
+        tipo = prop.get("type")
+        if tipo == "boolean":
+            m = re.search(chave + r"(true|false)", texto, re.IGNORECASE)
+            if m:
+                campos[nome] = m.group(1).lower() == "true"
+        elif tipo == "string":
+            m = re.search(chave + r'"((?:[^"\\]|\\.)*)"', texto)
+            if m:
+                campos[nome] = json.loads(f'"{m.group(1)}"')
+        elif tipo == "array":
+            m = re.search(chave + r"\[(.*?)\]", texto, re.DOTALL)
+            if m:
+                campos[nome] = [json.loads(f'"{x}"') for x in re.findall(r'"((?:[^"\\]|\\.)*)"', m.group(1))]
+    return campos
+
+
+def interpretar_resposta(texto: str, esquema: dict[str, Any]) -> tuple[dict[str, Any], List[str]]:
+    """
+    Interpreta a resposta conforme `esquema` sem desistir no primeiro defeito.
+    Retorna (campos válidos, nomes dos campos obrigatórios ausentes ou com tipo errado).
+    """
+    try:
+        dados = _parse_json_response(texto)
+        if not isinstance(dados, dict):
+            dados = {}
+    except json.JSONDecodeError:
+        dados = _campos_por_regex(texto, esquema)
+    propriedades = esquema.get("properties", {})
+    validos = {
+        k: v for k, v in dados.items()
+        if k not in propriedades or _tipo_ok(v, propriedades[k].get("type", ""))
+    }
+    invalidos = [k for k in esquema.get("required", []) if k not in validos]
+    return validos, invalidos
+
+
+def _sub_esquema(esquema: dict[str, Any], campos: List[str]) -> dict[str, Any]:
+    return {
+        **esquema,
+        "properties": {k: v for k, v in esquema["properties"].items() if k in campos},
+        "required": list(campos),
+    }
+
+
+def _prompt_reparo(texto: str, campos: List[str]) -> str:
+    return (
+        "A resposta abaixo deveria ser um JSON, mas os campos "
+        f"{', '.join(campos)} vieram ausentes ou inválidos.\n"
+        "Com base SOMENTE no conteúdo dela, responda APENAS com um JSON contendo esses campos.\n\n"
+        f"RESPOSTA ORIGINAL:\n{texto[:8000]}"
+    )
+
+
+class IncrementalJSONParser:
+    """
+    Parser incremental do objeto JSON de resposta da IA.
+    Recebe o texto em pedaços (streaming) e devolve cada campo de primeiro nível
+    assim que seu valor termina — e cada item de listas (ex: "erros") assim que
+    o item fecha, com o nome "campo[]". Texto antes do primeiro "{" (ex: ```json)
+    é ignorado.
+    """
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._started = False
+        self._done = False
+        self._expect = "key"      # "key" | "colon" | "value"
+        self._key = ""
+        self._key_start = -1
+        self._value_start = -1
+        self._item_start = -1     # início do item atual em lista de 1º nível
+        self.campos: dict[str, Any] = {}
+
+    @property
+    def texto(self) -> str:
+        return self._buf
+
+    @property
+    def completo(self) -> bool:
+        return self._done
+
+    def feed(self, chunk: str) -> List[tuple[str, Any]]:
+        """Adiciona um pedaço de texto e retorna os eventos (campo, valor) concluídos."""
+        self._buf += chunk
+        eventos: List[tuple[str, Any]] = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf) and not self._done:
+            c = buf[i]
+            if not self._started:
+                if c == "{":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._expect == "key" and self._key_start >= 0:
+                        self._key = json.loads(buf[self._key_start:i + 1])
+                        self._key_start = -1
+                        self._expect = "colon"
+                i += 1
+                continue
+
+            if c == '"':
+                self._in_str = True
+                if self._depth == 1 and self._expect == "key":
+                    self._key_start = i
+            elif c == ":" and self._depth == 1 and self._expect == "colon":
+                self._expect = "value"
+                self._value_start = i + 1
+            elif c in "{[":
+                if c == "[" and self._depth == 1 and self._expect == "value":
+                    self._item_start = i + 1
+                self._depth += 1
+            elif c == "," and self._depth == 2 and self._item_start >= 0:
+                self._emitir_item(buf[self._item_start:i], eventos)
+                self._item_start = i + 1
+            elif c in "}]":
+                if c == "]" and self._depth == 2 and self._item_start >= 0:
+                    self._emitir_item(buf[self._item_start:i], eventos)
+                    self._item_start = -1
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emitir_campo(buf[self._value_start:i], eventos)
+                    self._done = True
+            elif c == "," and self._depth == 1 and self._expect == "value":
+                self._emitir_campo(buf[self._value_start:i], eventos)
+            i += 1
+        self._pos = i
+        return eventos
+
+    def _emitir_item(self, texto: str, eventos: List[tuple[str, Any]]) -> None:
+        texto = texto.strip()
+        if not texto:
+            return
+        try:
+            eventos.append((f"{self._key}[]", json.loads(texto)))
+        except json.JSONDecodeError:
+            pass
+
+    def _emitir_campo(self, texto: str, eventos: List[tuple[str, Any]]) -> None:
+        if self._expect != "value":
+            return
+        self._expect = "key"
+        try:
+            valor = json.loads(texto)
+        except json.JSONDecodeError:
+            return
+        self.campos[self._key] = valor
+        eventos.append((self._key, valor))
+
+    def resultado(self) -> dict[str, Any]:
+        """Objeto final (usa o texto completo; levanta JSONDecodeError se inválido)."""
+        return _parse_json_response(self._buf)
+
+
+# ─── Cancelamento ────────────────────────────────────────────────────────────
+
+class AuditoriaCancelada(Exception):
+    """Auditoria interrompida pelo usuário (botão Cancelar)."""
+
+
+class CancelToken:
+    """Sinal de cancelamento compartilhado entre a UI e a thread de auditoria."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._ao_cancelar: List[Callable[[], None]] = []
+        # Chamadas com este token usam um cliente só delas, fechado no cancelamento
+        # (derruba a requisição em andamento); o roteador liga isso nas tentativas.
+        self.cliente_proprio = False
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._event.set()
+            callbacks, self._ao_cancelar = self._ao_cancelar, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def ao_cancelar(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Agenda `callback` para o cancelamento (roda já se cancelado); devolve o desregistro."""
+        with self._lock:
+            if not self._event.is_set():
+                self._ao_cancelar.append(callback)
+
+                def remover() -> None:
+                    with self._lock:
+                        if callback in self._ao_cancelar:
+                            self._ao_cancelar.remove(callback)
+
+                return remover
+        callback()
+        return lambda: None
+
+    @property
+    def cancelado(self) -> bool:
+        return self._event.is_set()
+
+    def verificar(self) -> None:
+        if self._event.is_set():
+            raise AuditoriaCancelada("Auditoria cancelada pelo usuário.")
+
+    def esperar(self, segundos: float) -> None:
+        """Dorme até `segundos` ou até o cancelamento (o que vier primeiro)."""
+        if self._event.wait(segundos):
+            raise AuditoriaCancelada("Auditoria cancelada pelo usuário.")
+
+
+# ─── Registro de clientes (conexões reaproveitadas) ─────────────────────────
+
+DEFAULT_TIMEOUT_S = 120.0
+DEFAULT_MAX_RETRIES = 3
+
+# Validade do cache explícito do prompt de sistema no Gemini (renovado antes de expirar)
+GEMINI_CACHE_TTL_S = 3600
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://github.com/robincorreaross/farmapop_ia",
+    "X-Title": "FarmaPop IA",
+}
+
+
+class ProviderRegistry:
+    """
+    Mantém clientes SDK de longa duração por (provedor, chave de API).
+    Os SDKs da OpenAI/Anthropic usam httpx com pool de conexões, então reaproveitar
+    o cliente evita novo handshake TLS e novo import a cada transação.
+    Clientes assíncronos ficam presos ao event loop em que foram criados.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT_S) -> None:
+        # Vale por requisição (passado em cada chamada): mudar depois também afeta
+        # os clientes já criados
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sync: dict[tuple[str, str], Any] = {}
+        self._async: dict[tuple[str, str, int], Any] = {}
+        # (chave, modelo, hash do prompt de sistema) -> (GenerativeModel, validade do cache)
+        self._gemini_models: dict[tuple[str, str, str], tuple[Any, float]] = {}
+        self._gemini_sem_cache: set[tuple[str, str]] = set()
+        self._gemini_key = ""
+
+    def client(self, provider: str, api_key: str) -> Any:
+        key = (provider, api_key)
+        with self._lock:
+            if key not in self._sync:
+                self._sync[key] = self._create(provider, api_key, assincrono=False)
+            return self._sync[key]
+
+    def cliente_avulso(self, provider: str, api_key: str) -> Any:
+        """Cliente novo, fora do registro: quem pede é responsável por fechá-lo."""
+        return self._create(provider, api_key, assincrono=False)
+
+    def async_client(self, provider: str, api_key: str) -> Any:
+        import asyncio
+
+        key = (provider, api_key, id(asyncio.get_running_loop()))
+        with self._lock:
+            if key not in self._async:
+                self._async[key] = self._create(provider, api_key, assincrono=True)
+            return self._async[key]
+
+    def gemini_model(self, api_key: str, model: str, sistema: str = "") -> Any:
+        import google.generativeai as genai  # type: ignore[import-untyped]
+
+        with self._lock:
+            # genai.configure é global no SDK: só reconfigura quando a chave muda
+            if self._gemini_key != api_key:
+                genai.configure(api_key=api_key)
+                self._gemini_key = api_key
+                self._gemini_models.clear()
+            key = (api_key, model, hashlib.sha256(sistema.encode("utf-8")).hexdigest())
+            item = self._gemini_models.get(key)
+            if item is not None and item[1] > time.time():
+                return item[0]
+        # CachedContent.create é chamada de rede: fora da trava, para não travar as
+        # outras threads (no pior caso duas criam o mesmo cache e vale o último)
+        item = self._criar_gemini(genai, model, sistema, key[2])
+        with self._lock:
+            if self._gemini_key == api_key:
+                self._gemini_models[key] = item
+        return item[0]
+
+    def _criar_gemini(self, genai: Any, model: str, sistema: str, hash_sistema: str) -> tuple[Any, float]:
+        """
+        Modelo Gemini com o prompt de sistema em cache explícito (CachedContent),
+        renovado antes de expirar. Se o cache for recusado (prompt abaixo do mínimo
+        de tokens, modelo sem suporte), usa system_instruction — que ainda aproveita
+        o cache implícito de prefixo dos modelos mais novos.
+        """
+        with self._lock:
+            sem_cache = (model, hash_sistema) in self._gemini_sem_cache
+        if sistema and not sem_cache:
+            try:
+                from google.generativeai import caching  # type: ignore[import-untyped]
+
+                cache = caching.CachedContent.create(
+                    model=model if model.startswith("models/") else f"models/{model}",
+                    system_instruction=sistema,
+                    ttl=timedelta(seconds=GEMINI_CACHE_TTL_S),
+                )
+                modelo = genai.GenerativeModel.from_cached_content(cached_content=cache)
+                return modelo, time.time() + GEMINI_CACHE_TTL_S - 60
+            except Exception as e:
+                print(f"[AIAuditor] gemini: cache de prompt indisponível para {model} ({type(e).__name__})")
+                with self._lock:
+                    self._gemini_sem_cache.add((model, hash_sistema))
+        return genai.GenerativeModel(model, system_instruction=sistema or None), float("inf")
+
+    def _create(self, provider: str, api_key: str, assincrono: bool) -> Any:
+        # Retentativas ficam por nossa conta (backoff com jitter + cancelamento)
+        if provider in ("openai", "openrouter"):
+            from openai import AsyncOpenAI, OpenAI  # type: ignore[import-untyped]
+
+            cls = AsyncOpenAI if assincrono else OpenAI
+            kwargs: dict[str, Any] = {"api_key": api_key, "timeout": self.timeout, "max_retries": 0}
+            if provider == "openrouter":
+                kwargs["base_url"] = OPENROUTER_BASE_URL
+            return cls(**kwargs)
+        if provider == "anthropic":
+            import anthropic  # type: ignore[import-untyped]
+
+            cls_ant = anthropic.AsyncAnthropic if assincrono else anthropic.Anthropic
+            return cls_ant(api_key=api_key, timeout=self.timeout, max_retries=0)
+        raise ValueError(f"Provedor desconhecido: {provider}")
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._sync.values():
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            self._sync.clear()
+            self._async.clear()
+            self._gemini_models.clear()
+            self._gemini_sem_cache.clear()
+            self._gemini_key = ""
+
+
+_registry = ProviderRegistry()
+
+
+def get_registry() -> ProviderRegistry:
+    return _registry
+
+
+# ─── Retentativas ────────────────────────────────────────────────────────────
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+_RETRYABLE_NAMES = (
+    "Timeout", "Connection", "RateLimit", "ResourceExhausted",
+    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "Overloaded",
+)
+
+
+def _status_code(e: Exception) -> int | None:
+    code = getattr(e, "status_code", None) or getattr(e, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def _is_retryable(e: Exception) -> bool:
+    code = _status_code(e)
+    if code is not None:
+        return code in _RETRYABLE_STATUS
+    nome = type(e).__name__
+    return any(n in nome for n in _RETRYABLE_NAMES)
+
+
+def _retry_after(e: Exception) -> float | None:
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(tentativa: int, e: Exception, base: float = 1.0, teto: float = 30.0) -> float:
+    """Full jitter; respeita Retry-After quando o provedor informa."""
+    sugerido = _retry_after(e)
+    if sugerido is not None:
+        return min(teto, sugerido + random.uniform(0, base))
+    return random.uniform(0, min(teto, base * (2 ** tentativa)))
+
 
+# ─── Requisições por provedor ────────────────────────────────────────────────
+
+def _gemini_content(images: List[ImagemPreparada], prompt: str) -> list[Any]:
     content: list[Any] = [prompt]
     for img in images:
-        content.append(img)
+        content.append({"mime_type": img.mime_type, "data": img.data})
+    return content
 
-    response = client.generate_content(content)
-    return _parse_json_response(response.text)
 
+def _esquema_gemini(esquema: dict[str, Any]) -> dict[str, Any]:
+    """O response_schema do Gemini é um subconjunto do OpenAPI: sem additionalProperties."""
+    convertido: dict[str, Any] = {k: v for k, v in esquema.items() if k != "additionalProperties"}
+    if "properties" in convertido:
+        convertido["properties"] = {k: _esquema_gemini(v) for k, v in convertido["properties"].items()}
+    if "items" in convertido:
+        convertido["items"] = _esquema_gemini(convertido["items"])
+    return convertido
 
-def _audit_openai(
-    images: List[PILImage.Image],
+
+def _gemini_config(esquema: dict[str, Any] | None) -> dict[str, Any] | None:
+    if esquema is None:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": _esquema_gemini(esquema)}
+
+
+def _openai_request(
+    provider: str,
+    images: List[ImagemPreparada],
     prompt: str,
-    api_key: str,
     model: str,
+    max_tokens: int,
+    sistema: str = "",
+    esquema: dict[str, Any] | None = None,
 ) -> dict[str, Any]:
-    from openai import OpenAI  # type: ignore[import-untyped]
+    image_messages: list[dict[str, Any]] = []
+    for img in images:
+        image_url: dict[str, Any] = {"url": img.data_url}
+        if provider == "openai":
+            image_url["detail"] = "high"
+        image_messages.append({"type": "image_url", "image_url": image_url})
+
+    # Prefixo fixo primeiro: a OpenAI reaproveita automaticamente prefixos já vistos
+    messages: list[dict[str, Any]] = []
+    if sistema:
+        messages.append({"role": "system", "content": sistema})
+    messages.append({
+        "role": "user",
+        "content": [{"type": "text", "text": prompt}] + image_messages,
+    })
+    request: dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+    }
+    if esquema is not None and provider == "openai":
+        # No OpenRouter o suporte varia por modelo: lá fica só o parser tolerante
+        request["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "resultado", "strict": True, "schema": esquema},
+        }
+    if provider == "openrouter":
+        # OpenRouter usa esses cabeçalhos para ranking; o SDK básico funciona sem eles
+        request["extra_headers"] = OPENROUTER_HEADERS
+    return request
 
-    client = OpenAI(api_key=api_key)
 
-    image_messages: list[dict[str, Any]] = []
+def _anthropic_request(
+    images: List[ImagemPreparada],
+    prompt: str,
+    model: str,
+    max_tokens: int,
+    sistema: str = "",
+    esquema: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    content: list[dict[str, Any]] = []
     for img in images:
-        b64 = _image_to_base64(img)
-        image_messages.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{b64}",
-                "detail": "high",
+        content.append({
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": img.mime_type,
+                "data": img.base64,
             },
         })
+    content.append({"type": "text", "text": prompt})
+    request: dict[str, Any] = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": content}],
+    }
+    if sistema:
+        # Ponto de cache explícito ao fim do bloco fixo (ignorado abaixo do mínimo de tokens)
+        request["system"] = [
+            {"type": "text", "text": sistema, "cache_control": {"type": "ephemeral"}}
+        ]
+    if esquema is not None:
+        # Saída estruturada via tool use: o modelo é obrigado a "chamar" a ferramenta
+        request["tools"] = [{
+            "name": _FERRAMENTA_RESULTADO,
+            "description": "Registra o resultado no formato exigido.",
+            "input_schema": esquema,
+        }]
+        request["tool_choice"] = {"type": "tool", "name": _FERRAMENTA_RESULTADO}
+    return request
+
+
+def _texto_anthropic(message: Any) -> str:
+    """Texto da resposta; com tool use, o JSON dos argumentos da ferramenta."""
+    textos: List[str] = []
+    for bloco in message.content:
+        if getattr(bloco, "type", "") == "tool_use":
+            return json.dumps(bloco.input, ensure_ascii=False)
+        if getattr(bloco, "type", "") == "text":
+            textos.append(bloco.text)
+    return "".join(textos)
+
+
+def _uso(provider: str, response: Any) -> dict[str, int]:
+    """Tokens de entrada da resposta e quantos deles vieram do cache de prefixo do provedor."""
+    if provider == "gemini":
+        meta = getattr(response, "usage_metadata", None)
+        entrada = getattr(meta, "prompt_token_count", 0) or 0
+        lidos = getattr(meta, "cached_content_token_count", 0) or 0
+        gravados = 0
+    elif provider == "anthropic":
+        usage = getattr(response, "usage", None)
+        lidos = getattr(usage, "cache_read_input_tokens", 0) or 0
+        gravados = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        # input_tokens da Anthropic não inclui a parte lida/gravada no cache
+        entrada = (getattr(usage, "input_tokens", 0) or 0) + lidos + gravados
+    else:
+        usage = getattr(response, "usage", None)
+        entrada = getattr(usage, "prompt_tokens", 0) or 0
+        lidos = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+        gravados = 0
+    return {"tokens_entrada": int(entrada), "tokens_cache": int(lidos), "tokens_cache_gravados": int(gravados)}
+
+
+def _traduzir_erro(provider: str, model: str, e: Exception) -> Exception:
+    if provider == "openrouter" and "support image input" in str(e):
+        return ValueError(
+            f"O modelo '{model}' não suporta leitura de imagens (Vision). Por favor, escolha "
+            "outro modelo nas configurações (ex: gemini-2.0-flash ou gpt-4o-mini)."
+        )
+    return e
 
-    messages: list[dict[str, Any]] = [
-        {
-            "role": "user",
-            "content": [{"type": "text", "text": prompt}] + image_messages,
-        }
-    ]
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        max_tokens=2000,
-    )
-    return _parse_json_response(response.choices[0].message.content or "")
+@contextmanager
+def _cliente(provider: str, api_key: str, cancel: CancelToken | None) -> Iterator[Any]:
+    """
+    Cliente compartilhado do registro ou, com cancel.cliente_proprio, um cliente só
+    desta chamada que é fechado no cancelamento: a requisição HTTP em andamento cai
+    na hora em vez de segurar a thread e a vaga do limitador até o timeout.
+    """
+    registry = get_registry()
+    if cancel is None or not cancel.cliente_proprio:
+        yield registry.client(provider, api_key)
+        return
+    client = registry.cliente_avulso(provider, api_key)
+    remover = cancel.ao_cancelar(client.close)
+    try:
+        yield client
+    finally:
+        remover()
+        client.close()
 
 
-def _audit_openrouter(
-    images: List[PILImage.Image],
+def _cancelavel(fn: Callable[[], Any], cancel: CancelToken | None) -> Any:
+    """
+    Executa `fn` (chamada do SDK do Gemini, que não tem cliente para fechar) e, com
+    cancel.cliente_proprio, volta assim que o token for cancelado: a requisição
+    termina sozinha numa thread auxiliar e o resultado é descartado.
+    """
+    if cancel is None or not cancel.cliente_proprio:
+        return fn()
+    pronto = threading.Event()
+    saida: dict[str, Any] = {}
+
+    def run() -> None:
+        try:
+            saida["resultado"] = fn()
+        except BaseException as e:
+            saida["erro"] = e
+        finally:
+            pronto.set()
+
+    remover = cancel.ao_cancelar(pronto.set)
+    threading.Thread(target=run, daemon=True, name="gemini-cancelavel").start()
+    pronto.wait()
+    remover()
+    cancel.verificar()
+    if "erro" in saida:
+        raise saida["erro"]
+    return saida["resultado"]
+
+
+def _guardar_cabecalhos(destino: dict[str, str] | None, resposta_http: Any) -> None:
+    """Copia os cabeçalhos HTTP (cota restante x-ratelimit-*) para o limitador."""
+    headers = getattr(resposta_http, "headers", None)
+    if destino is not None and headers:
+        destino.update({k.lower(): v for k, v in dict(headers).items()})
+
+
+def _enviar(
+    provider: str,
+    images: List[ImagemPreparada],
     prompt: str,
     api_key: str,
     model: str,
-) -> dict[str, Any]:
-    """Usa a API do OpenRouter (OpenAI-compatible) para auditoria."""
-    from openai import OpenAI  # Use o cliente openai para compatibilidade
-    
-    # OpenRouter usa baseUrl diferente
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
+    max_tokens: int,
+    sistema: str = "",
+    uso: dict[str, int] | None = None,
+    esquema: dict[str, Any] | None = None,
+    cancel: CancelToken | None = None,
+    cabecalhos: dict[str, str] | None = None,
+) -> str:
+    """
+    Uma chamada síncrona ao provedor; devolve o texto bruto da resposta.
+    `uso`, se informado, recebe a contagem de tokens (ver _uso); `esquema` ativa a
+    saída estruturada nativa do provedor; `cancel` só importa com cliente_proprio;
+    `cabecalhos` recebe os cabeçalhos HTTP da resposta (OpenAI/Anthropic).
+    """
+    registry = get_registry()
+    if provider == "gemini":
+        client = registry.gemini_model(api_key, model, sistema)
+        response = _cancelavel(lambda: client.generate_content(
+            _gemini_content(images, prompt),
+            generation_config=_gemini_config(esquema),
+            request_options={"timeout": registry.timeout},
+        ), cancel)
+        texto = response.text
+    elif provider in ("openai", "openrouter"):
+        with _cliente(provider, api_key, cancel) as client:
+            bruta = client.chat.completions.with_raw_response.create(
+                timeout=registry.timeout,
+                **_openai_request(provider, images, prompt, model, max_tokens, sistema, esquema),
+            )
+        _guardar_cabecalhos(cabecalhos, bruta)
+        response = bruta.parse()
+        texto = response.choices[0].message.content or ""
+    elif provider == "anthropic":
+        with _cliente(provider, api_key, cancel) as client:
+            bruta = client.messages.with_raw_response.create(
+                timeout=registry.timeout,
+                **_anthropic_request(images, prompt, model, max_tokens, sistema, esquema),
+            )
+        _guardar_cabecalhos(cabecalhos, bruta)
+        response = bruta.parse()
+        texto = _texto_anthropic(response)
+    else:
+        raise ValueError(f"Provedor desconhecido: {provider}")
+    if uso is not None:
+        uso.update(_uso(provider, response))
+    return texto
+
+
+async def _enviar_async(
+    provider: str,
+    images: List[ImagemPreparada],
+    prompt: str,
+    api_key: str,
+    model: str,
+    max_tokens: int,
+    sistema: str = "",
+    uso: dict[str, int] | None = None,
+    esquema: dict[str, Any] | None = None,
+    cabecalhos: dict[str, str] | None = None,
+) -> str:
+    """Versão asyncio de _enviar (cancelável via task.cancel())."""
+    registry = get_registry()
+    if provider == "gemini":
+        client = registry.gemini_model(api_key, model, sistema)
+        response = await client.generate_content_async(
+            _gemini_content(images, prompt),
+            generation_config=_gemini_config(esquema),
+            request_options={"timeout": registry.timeout},
+        )
+        texto = response.text
+    elif provider in ("openai", "openrouter"):
+        client = registry.async_client(provider, api_key)
+        bruta = await client.chat.completions.with_raw_response.create(
+            timeout=registry.timeout,
+            **_openai_request(provider, images, prompt, model, max_tokens, sistema, esquema),
+        )
+        _guardar_cabecalhos(cabecalhos, bruta)
+        response = bruta.parse()
+        texto = response.choices[0].message.content or ""
+    elif provider == "anthropic":
+        client = registry.async_client(provider, api_key)
+        bruta = await client.messages.with_raw_response.create(
+            timeout=registry.timeout,
+            **_anthropic_request(images, prompt, model, max_tokens, sistema, esquema),
+        )
+        _guardar_cabecalhos(cabecalhos, bruta)
+        response = bruta.parse()
+        texto = _texto_anthropic(response)
+    else:
+        raise ValueError(f"Provedor desconhecido: {provider}")
+    if uso is not None:
+        uso.update(_uso(provider, response))
+    return texto
+
+
+def _enviar_stream(
+    provider: str,
+    images: List[ImagemPreparada],
+    prompt: str,
+    api_key: str,
+    model: str,
+    max_tokens: int,
+    sistema: str = "",
+    uso: dict[str, int] | None = None,
+    esquema: dict[str, Any] | None = None,
+    cancel: CancelToken | None = None,
+    cabecalhos: dict[str, str] | None = None,
+) -> Iterator[str]:
+    """Versão em streaming de _enviar: produz o texto da resposta em pedaços."""
+    registry = get_registry()
+    if provider == "gemini":
+        client = registry.gemini_model(api_key, model, sistema)
+        response = _cancelavel(lambda: client.generate_content(
+            _gemini_content(images, prompt),
+            stream=True,
+            generation_config=_gemini_config(esquema),
+            request_options={"timeout": registry.timeout},
+        ), cancel)
+        # Cada pedaço também pode demorar: a espera por ele é abandonada no cancelamento
+        pedacos = iter(response)
+        ultimo = None
+        while True:
+            chunk = _cancelavel(lambda: next(pedacos, None), cancel)
+            if chunk is None:
+                break
+            ultimo = chunk
+            if chunk.parts:
+                yield chunk.text
+        if uso is not None and ultimo is not None:
+            uso.update(_uso(provider, ultimo))
+        return
+    if provider in ("openai", "openrouter"):
+        with _cliente(provider, api_key, cancel) as client:
+            stream = client.chat.completions.create(
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=registry.timeout,
+                **_openai_request(provider, images, prompt, model, max_tokens, sistema, esquema),
+            )
+            _guardar_cabecalhos(cabecalhos, getattr(stream, "response", None))
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+                    if uso is not None and getattr(chunk, "usage", None) is not None:
+                        uso.update(_uso(provider, chunk))
+            finally:
+                stream.close()
+        return
+    if provider == "anthropic":
+        request = _anthropic_request(images, prompt, model, max_tokens, sistema, esquema)
+        request["timeout"] = registry.timeout
+        with _cliente(provider, api_key, cancel) as client, client.messages.stream(**request) as stream:
+            _guardar_cabecalhos(cabecalhos, getattr(stream, "response", None))
+            if esquema is None:
+                yield from stream.text_stream
+            else:
+                # Com tool use o JSON chega em input_json_delta, não em text_stream
+                for evento in stream:
+                    if evento.type == "content_block_delta" and evento.delta.type == "input_json_delta":
+                        yield evento.delta.partial_json
+            if uso is not None:
+                uso.update(_uso(provider, stream.get_final_message()))
+        return
+    raise ValueError(f"Provedor desconhecido: {provider}")
+
+
+@contextmanager
+def _com_limite(
+    provider: str,
+    model: str,
+    api_key: str,
+    images: List[ImagemPreparada],
+    cancel: CancelToken | None,
+    *textos: str,
+) -> Iterator[tuple[dict[str, int], dict[str, str]]]:
+    """
+    Reserva vaga no limitador compartilhado (core.limitador) durante uma chamada.
+    Entrega (uso, cabeçalhos): o uso real corrige a estimativa de tokens e os
+    cabeçalhos da resposta trazem a cota restante informada pelo provedor.
+    """
+    lim = limitador.limitador_para(provider, model, api_key)
+    if lim is None:
+        yield {}, {}
+        return
+    reserva = lim.adquirir(limitador.estimar_tokens(provider, [i.size for i in images], *textos), cancel)
+    uso: dict[str, int] = {}
+    cabecalhos: dict[str, str] = {}
+    erro: BaseException | None = None
+    try:
+        yield uso, cabecalhos
+    except BaseException as e:
+        erro = e
+        raise
+    finally:
+        # finally: GeneratorExit/KeyboardInterrupt também devolvem a vaga na hora
+        lim.liberar(reserva, erro, tokens_reais=uso.get("tokens_entrada", 0), cabecalhos=cabecalhos)
 
-    image_messages: list[dict[str, Any]] = []
-    for img in images:
-        b64 = _image_to_base64(img)
-        image_messages.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{b64}",
-            },
-        })
 
-    messages: list[dict[str, Any]] = [
-        {
-            "role": "user",
-            "content": [{"type": "text", "text": prompt}] + image_messages,
-        }
-    ]
+@asynccontextmanager
+async def _com_limite_async(
+    provider: str,
+    model: str,
+    api_key: str,
+    images: List[ImagemPreparada],
+    *textos: str,
+) -> AsyncIterator[tuple[dict[str, int], dict[str, str]]]:
+    """
+    Versão asyncio de _com_limite. A espera pela vaga roda em thread e é
+    interrompida quando a task é cancelada (sem deixar reserva presa).
+    """
+    import asyncio
+
+    lim = limitador.limitador_para(provider, model, api_key)
+    if lim is None:
+        yield {}, {}
+        return
+    tokens = limitador.estimar_tokens(provider, [i.size for i in images], *textos)
+    cancel = CancelToken()
+    espera = asyncio.ensure_future(asyncio.to_thread(lim.adquirir, tokens, cancel))
+    try:
+        reserva = await asyncio.shield(espera)
+    except asyncio.CancelledError as e:
+        cancel.cancel()
+        try:
+            # A vaga pode ter saído antes de a thread ver o cancelamento: devolve
+            lim.liberar(await espera, e)
+        except AuditoriaCancelada:
+            pass
+        raise
+    uso: dict[str, int] = {}
+    cabecalhos: dict[str, str] = {}
+    try:
+        yield uso, cabecalhos
+    except BaseException as e:
+        # Inclui CancelledError no meio da chamada: a vaga volta na hora
+        lim.liberar(reserva, e)
+        raise
+    lim.liberar(reserva, tokens_reais=uso.get("tokens_entrada", 0), cabecalhos=cabecalhos)
 
-    # OpenRouter às vezes exige cabeçalhos extras para ranking, mas o SDK básico funciona
+
+def _reparar_campos(
+    provider: str,
+    texto: str,
+    dados: dict[str, Any],
+    invalidos: List[str],
+    esquema: dict[str, Any],
+    api_key: str,
+    model: str,
+) -> dict[str, Any]:
+    """
+    Pede de novo só os campos que vieram ausentes/inválidos, numa chamada apenas de
+    texto (sem reenviar as imagens). Campos que continuarem faltando ficam com o
+    padrão do AuditResult; só levanta JSONDecodeError se nada for aproveitável.
+    """
+    print(f"[AIAuditor] {provider}: resposta com campo(s) inválido(s) {invalidos}, pedindo só esses")
+    sub = _sub_esquema(esquema, invalidos)
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            extra_headers={
-                "HTTP-Referer": "https://github.com/robincorreaross/farmapop_ia",
-                "X-Title": "FarmaPop IA",
-            },
-        )
-        return _parse_json_response(response.choices[0].message.content or "")
+        resposta = _enviar(provider, [], _prompt_reparo(texto, invalidos), api_key, model, 1000, esquema=sub)
+        dados.update(interpretar_resposta(resposta, sub)[0])
     except Exception as e:
-        err_msg = str(e)
-        if "support image input" in err_msg:
-            raise ValueError(f"O modelo '{model}' não suporta leitura de imagens (Vision). Por favor, escolha outro modelo nas configurações (ex: gemini-2.0-flash ou gpt-4o-mini).")
-        raise
+        print(f"[AIAuditor] {provider}: reparo falhou ({type(e).__name__})")
+    if not dados:
+        raise json.JSONDecodeError("Nenhum campo válido na resposta", texto, 0)
+    return dados
 
 
-def _audit_anthropic(
-    images: List[PILImage.Image],
+def _interpretar_ou_reparar(
+    provider: str,
+    texto: str,
+    esquema: dict[str, Any] | None,
+    api_key: str,
+    model: str,
+) -> dict[str, Any]:
+    if esquema is None:
+        return _parse_json_response(texto)
+    dados, invalidos = interpretar_resposta(texto, esquema)
+    if invalidos:
+        dados = _reparar_campos(provider, texto, dados, invalidos, esquema, api_key, model)
+    return dados
+
+
+def chamar_provedor_stream(
+    provider: str,
+    images: List[ImagemPreparada],
     prompt: str,
     api_key: str,
     model: str,
+    on_campo: Callable[[str, Any], None],
+    cancel: CancelToken | None = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    max_tokens: int = 2000,
+    sistema: str = "",
+    uso: dict[str, int] | None = None,
+    esquema: dict[str, Any] | None = None,
 ) -> dict[str, Any]:
-    import anthropic  # type: ignore[import-untyped]
+    """
+    Como chamar_provedor, mas em streaming: `on_campo(campo, valor)` é chamado
+    assim que cada campo do JSON fica completo (e "erros[]" a cada erro).
+    Só retenta se a falha ocorrer antes do primeiro pedaço de texto.
+    """
+    for tentativa in range(max_retries + 1):
+        if cancel is not None:
+            cancel.verificar()
+        parser = IncrementalJSONParser()
+        recebeu = False
+        try:
+            limite = _com_limite(provider, model, api_key, images, cancel, prompt, sistema)
+            with limite as (uso_chamada, cab):
+                for pedaco in _enviar_stream(
+                    provider, images, prompt, api_key, model, max_tokens, sistema, uso_chamada, esquema,
+                    cancel, cab,
+                ):
+                    recebeu = True
+                    if cancel is not None:
+                        cancel.verificar()
+                    for campo, valor in parser.feed(pedaco):
+                        on_campo(campo, valor)
+            if uso is not None:
+                uso.update(uso_chamada)
+            break
+        except AuditoriaCancelada:
+            raise
+        except Exception as e:
+            if cancel is not None:
+                cancel.verificar()  # erro provocado pelo fechamento do cliente no cancelamento
+            if recebeu or tentativa >= max_retries or not _is_retryable(e):
+                raise _traduzir_erro(provider, model, e) from e
+            espera = _backoff(tentativa, e)
+            print(f"[AIAuditor] {provider}: {type(e).__name__}, nova tentativa em {espera:.1f}s")
+            if cancel is not None:
+                cancel.esperar(espera)
+            else:
+                time.sleep(espera)
+    if cancel is not None:
+        cancel.verificar()
+    return _interpretar_ou_reparar(provider, parser.texto, esquema, api_key, model)
+
+
+def chamar_provedor(
+    provider: str,
+    images: List[ImagemPreparada],
+    prompt: str,
+    api_key: str,
+    model: str,
+    cancel: CancelToken | None = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    max_tokens: int = 2000,
+    sistema: str = "",
+    uso: dict[str, int] | None = None,
+    esquema: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """
+    Envia prompt + imagens (pode ser vazia) ao provedor e devolve o JSON da resposta.
+    Erros transitórios (429/5xx/timeout) são retentados com backoff exponencial e jitter.
+    `sistema` é o bloco fixo (cacheável pelo provedor); `uso` recebe a contagem de tokens.
+    Com `esquema`, pede saída estruturada e, se ainda vier algum campo defeituoso,
+    repete só esses campos (sem as imagens) em vez da chamada inteira.
+    """
+    for tentativa in range(max_retries + 1):
+        if cancel is not None:
+            cancel.verificar()
+        try:
+            limite = _com_limite(provider, model, api_key, images, cancel, prompt, sistema)
+            with limite as (uso_chamada, cab):
+                text = _enviar(
+                    provider, images, prompt, api_key, model, max_tokens, sistema, uso_chamada, esquema,
+                    cancel, cab,
+                )
+            if uso is not None:
+                uso.update(uso_chamada)
+            break
+        except AuditoriaCancelada:
+            raise
+        except Exception as e:
+            if cancel is not None:
+                cancel.verificar()  # erro provocado pelo fechamento do cliente no cancelamento
+            if tentativa >= max_retries or not _is_retryable(e):
+                raise _traduzir_erro(provider, model, e) from e
+            espera = _backoff(tentativa, e)
+            print(f"[AIAuditor] {provider}: {type(e).__name__}, nova tentativa em {espera:.1f}s")
+            if cancel is not None:
+                cancel.esperar(espera)
+            else:
+                time.sleep(espera)
+    if cancel is not None:
+        cancel.verificar()
+    return _interpretar_ou_reparar(provider, text, esquema, api_key, model)
+
+
+async def chamar_provedor_async(
+    provider: str,
+    images: List[ImagemPreparada],
+    prompt: str,
+    api_key: str,
+    model: str,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    max_tokens: int = 2000,
+    sistema: str = "",
+    uso: dict[str, int] | None = None,
+    esquema: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Versão asyncio de chamar_provedor (cancelamento via asyncio.CancelledError)."""
+    import asyncio
+
+    for tentativa in range(max_retries + 1):
+        try:
+            limite = _com_limite_async(provider, model, api_key, images, prompt, sistema)
+            async with limite as (uso_chamada, cab):
+                text = await _enviar_async(
+                    provider, images, prompt, api_key, model, max_tokens, sistema, uso_chamada, esquema, cab
+                )
+            if uso is not None:
+                uso.update(uso_chamada)
+            break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if tentativa >= max_retries or not _is_retryable(e):
+                raise _traduzir_erro(provider, model, e) from e
+            await asyncio.sleep(_backoff(tentativa, e))
+    # O reparo é uma chamada curta e só de texto: roda em thread para não bloquear o loop
+    return await asyncio.to_thread(_interpretar_ou_reparar, provider, text, esquema, api_key, model)
 
-    client = anthropic.Anthropic(api_key=api_key)
 
-    content: list[dict[str, Any]] = []
-    for img in images:
-        b64 = _image_to_base64(img)
-        content.append({
-            "type": "image",
-            "source": {
-                "type": "base64",
-                "media_type": "image/jpeg",
-                "data": b64,
-            },
-        })
-    content.append({"type": "text", "text": prompt})
+# ─── Função principal ────────────────────────────────────────────────────────
+
+@dataclass
+class _Auditoria:
+    """Estado de uma auditoria entre a preparação e a chamada ao provedor."""
+    provider: str
+    model: str
+    api_key: str
+    sistema: str
+    prompt: str
+    tipo_transacao: str
+    max_retries: int
+    cache: AuditCache | None = None
+    cache_key: str = ""
+
+
+def _iniciar_auditoria(
+    images: List[PILImage.Image],
+    tipo_transacao: str,
+    settings: dict[str, Any],
+    usar_cache: bool,
+    contexto: str = "",
+) -> tuple[_Auditoria, AuditResult | None]:
+    """Valida a configuração, monta o prompt e consulta o cache."""
+    provider: str = settings.get("ai_provider", "gemini")
+    model: str = settings.get("ai_model", "gemini-2.0-flash")
+    api_key: str = get_active_api_key(settings)
 
-    response = client.messages.create(
+    if not api_key:
+        raise ValueError(f"Chave de API não configurada para o provedor '{provider}'.")
+
+    if not images:
+        raise ValueError("Nenhuma imagem para auditar.")
+
+    get_registry().timeout = float(settings.get("ai_timeout_s", DEFAULT_TIMEOUT_S))
+    limitador.configurar(settings)
+
+    master_prompt = get_master_prompt()
+    ctx = _Auditoria(
+        provider=provider,
         model=model,
-        max_tokens=2000,
-        messages=[{"role": "user", "content": content}],
+        api_key=api_key,
+        sistema=prompt_de_sistema(master_prompt),
+        prompt=_build_prompt(tipo_transacao, len(images), contexto),
+        tipo_transacao=tipo_transacao,
+        max_retries=int(settings.get("ai_max_retries", DEFAULT_MAX_RETRIES)),
     )
-    return _parse_json_response(response.content[0].text)  # type: ignore[union-attr]
+
+    if settings.get("audit_cache_enabled", True):
+        ctx.cache = AuditCache.from_settings(settings)
+        chave_prompt = f"{master_prompt}\n{contexto}" if contexto else master_prompt
+        ctx.cache_key = build_cache_key(images, tipo_transacao, chave_prompt, provider, model)
+        if usar_cache:
+            cached = ctx.cache.get(ctx.cache_key)
+            if cached is not None:
+                result = AuditResult(cached)
+                result.do_cache = True
+                return ctx, result
+    return ctx, None
+
+
+def _concluir_auditoria(
+    ctx: _Auditoria,
+    raw: dict[str, Any],
+    preparadas: List[ImagemPreparada],
+    t0: float,
+    t1: float,
+    t2: float,
+    uso: dict[str, int] | None = None,
+    cancel: CancelToken | None = None,
+) -> AuditResult:
+    result = AuditResult(raw)
+    result.metricas = {
+        "imagens": len(preparadas),
+        "payload_bytes": sum(len(p.data) for p in preparadas),
+        "preprocess_s": round(t1 - t0, 3),
+        "latencia_s": round(t2 - t1, 3),
+        **(uso or {}),
+    }
+    cache_txt = ""
+    if result.metricas.get("tokens_entrada"):
+        cache_txt = (
+            f", prompt em cache {result.metricas['tokens_cache']}/"
+            f"{result.metricas['tokens_entrada']} tokens"
+        )
+    print(
+        f"[AIAuditor] {ctx.provider}/{ctx.model}: {result.metricas['imagens']} imagem(ns), "
+        f"{result.metricas['payload_bytes'] / 1024:.0f} KB, "
+        f"preparo {result.metricas['preprocess_s']}s, API {result.metricas['latencia_s']}s{cache_txt}"
+    )
+    # Tentativa que perdeu a corrida no roteador: o resultado é descartado, não cacheado
+    if ctx.cache is not None and not (cancel is not None and cancel.cancelado):
+        ctx.cache.put(
+            ctx.cache_key,
+            result.to_dict(),
+            meta={"provider": ctx.provider, "model": ctx.model, "tipo": ctx.tipo_transacao},
+        )
+    return result
 
 
-# ─── Função principal ────────────────────────────────────────────────────────
+# ─── Cascata de modelos ──────────────────────────────────────────────────────
+#
+# Um modelo rápido/barato audita primeiro e informa a confiança por regra; só os
+# dossiês reprovados, de baixa confiança ou em que ele falhou vão para o premium.
+# O resultado final é cacheado sob a cascata inteira (nunca o do modelo rápido
+# sozinho, que pode ter sido substituído pelo premium).
+
+DEFAULT_CONFIANCA_MINIMA = 0.8
+CASCATA_STATS_FILE = APP_DATA_DIR / "cascata_stats.json"
+# Evento de streaming enviado a on_campo quando a cascata escala: os campos que o
+# modelo rápido já mostrou devem ser descartados (os do premium vêm em seguida)
+CAMPO_REINICIAR = "reiniciar"
+
+
+def modelos_cascata(settings: dict[str, Any]) -> tuple[str, str] | None:
+    """(modelo rápido, modelo premium) se o modo cascata estiver ativo e fizer sentido."""
+    if not settings.get("ai_cascata", False):
+        return None
+    provider = settings.get("ai_provider", "gemini")
+    rapido, premium = MODELOS_CASCATA.get(provider, ("", ""))
+    rapido = settings.get("ai_modelo_rapido") or rapido
+    premium = settings.get("ai_modelo_premium") or premium
+    if not rapido or not premium or rapido == premium:
+        return None
+    return rapido, premium
+
+
+def _preparadas_para(
+    preparadas: List[ImagemPreparada] | None, provider: str, de: str, para: str
+) -> List[ImagemPreparada] | None:
+    """
+    Páginas codificadas para o modelo `de` servem para `para` só se o perfil de visão
+    for o mesmo (no OpenRouter ele depende do prefixo do modelo); senão, None faz
+    _auditar_modelo prepará-las de novo.
+    """
+    if preparadas is None or vision_profile(provider, de) != vision_profile(provider, para):
+        return None
+    return preparadas
+
+
+def _motivo_escalar(result: AuditResult, limiar: float) -> str:
+    """Por que o dossiê deve ir para o premium ("" = resultado do rápido basta)."""
+    if not result.aprovado:
+        return "reprovado"
+    valores = [
+        c.get("confianca") for c in result.confianca
+        if isinstance(c, dict) and isinstance(c.get("confianca"), (int, float))
+    ]
+    if not valores:
+        return "sem_confianca"
+    if min(valores) < limiar:
+        return "baixa_confianca"
+    return ""
+
+
+class EstatisticasCascata:
+    """Taxa de escalonamento e latências por nível, para calibrar o limiar de confiança."""
+
+    def __init__(self, arquivo=CASCATA_STATS_FILE) -> None:
+        self.arquivo = arquivo
+        self._lock = threading.Lock()
+
+    def _ler(self) -> dict[str, Any]:
+        try:
+            dados = json.loads(self.arquivo.read_text(encoding="utf-8"))
+            if isinstance(dados, dict):
+                return dados
+        except (OSError, ValueError):
+            pass
+        return {"total": 0, "escalados": 0, "motivos": {}, "discordancias": 0,
+                "rapido_s": 0.0, "premium_s": 0.0}
+
+    def registrar(self, info: dict[str, Any]) -> None:
+        with self._lock:
+            dados = self._ler()
+            dados["total"] += 1
+            dados["rapido_s"] += info.get("rapido_s", 0.0)
+            if info.get("motivo"):
+                dados["escalados"] += 1
+                dados["motivos"][info["motivo"]] = dados["motivos"].get(info["motivo"], 0) + 1
+                dados["premium_s"] += info.get("premium_s", 0.0)
+                # Premium mudou o veredito: o rápido teria errado (o escalonamento valeu)
+                dados["discordancias"] += 1 if info.get("discordou") else 0
+            try:
+                self.arquivo.write_text(json.dumps(dados, indent=2), encoding="utf-8")
+            except OSError:
+                pass
+
+    def resumo(self) -> dict[str, Any]:
+        with self._lock:
+            dados = self._ler()
+        total, escalados = dados["total"], dados["escalados"]
+        return {
+            **dados,
+            "taxa_escalonamento": round(escalados / total, 3) if total else 0.0,
+            "rapido_medio_s": round(dados["rapido_s"] / total, 2) if total else 0.0,
+            "premium_medio_s": round(dados["premium_s"] / escalados, 2) if escalados else 0.0,
+        }
+
+
+estatisticas_cascata = EstatisticasCascata()
+
+
+def _auditar_em_cascata(
+    images: List[PILImage.Image],
+    tipo_transacao: str,
+    settings: dict[str, Any],
+    usar_cache: bool,
+    cancel: CancelToken | None,
+    on_campo: Callable[[str, Any], None] | None,
+    preparadas: List[ImagemPreparada] | None,
+    contexto: str,
+    rapido: str,
+    premium: str,
+) -> AuditResult:
+    provider: str = settings.get("ai_provider", "gemini")
+    cache: AuditCache | None = None
+    chave = ""
+    if settings.get("audit_cache_enabled", True) and images:
+        cache = AuditCache.from_settings(settings)
+        master_prompt = get_master_prompt()
+        chave_prompt = f"{master_prompt}\n{contexto}" if contexto else master_prompt
+        chave = build_cache_key(images, tipo_transacao, chave_prompt, provider, f"cascata:{rapido}>{premium}")
+        if usar_cache:
+            cached = cache.get(chave)
+            if cached is not None:
+                result = AuditResult(cached)
+                result.do_cache = True
+                return result
+
+    limiar = float(settings.get("ai_cascata_confianca", DEFAULT_CONFIANCA_MINIMA))
+    info: dict[str, Any] = {"rapido": rapido, "premium": premium, "limiar": limiar}
+    contexto_rapido = f"{contexto}\n\n{INSTRUCAO_CONFIANCA}" if contexto else INSTRUCAO_CONFIANCA
+    # `preparadas` vem codificada para ai_model (pipeline da digitalização)
+    modelo_preparadas = settings.get("ai_model", "")
+
+    t0 = time.perf_counter()
+    rapido_result: AuditResult | None = None
+    try:
+        # Sem cache por nível (nem leitura nem gravação): vale o veredito da cascata inteira
+        rapido_result = _auditar_modelo(
+            images, tipo_transacao, {**settings, "ai_model": rapido, "audit_cache_enabled": False}, False,
+            cancel, on_campo, _preparadas_para(preparadas, provider, modelo_preparadas, rapido),
+            contexto_rapido, ESQUEMA_CASCATA,
+        )
+        info["motivo"] = _motivo_escalar(rapido_result, limiar)
+        info["confianca_min"] = min(
+            (c["confianca"] for c in rapido_result.confianca
+             if isinstance(c, dict) and isinstance(c.get("confianca"), (int, float))),
+            default=None,
+        )
+    except RuntimeError as e:
+        info["motivo"] = "falha"
+        print(f"[AIAuditor] cascata: {rapido} falhou ({e}), indo para {premium}")
+    info["rapido_s"] = round(time.perf_counter() - t0, 3)
+
+    result = rapido_result
+    if info["motivo"]:
+        print(f"[AIAuditor] cascata: escalando para {premium} ({info['motivo']})")
+        t1 = time.perf_counter()
+        if on_campo is not None:
+            on_campo(CAMPO_REINICIAR, None)
+        result = _auditar_modelo(
+            images, tipo_transacao, {**settings, "ai_model": premium, "audit_cache_enabled": False}, False,
+            cancel, on_campo, _preparadas_para(preparadas, provider, modelo_preparadas, premium), contexto,
+        )
+        info["premium_s"] = round(time.perf_counter() - t1, 3)
+        info["discordou"] = rapido_result is not None and rapido_result.aprovado != result.aprovado
+
+    assert result is not None
+    if cancel is not None:
+        cancel.verificar()  # perdeu a corrida no roteador: nem estatística nem cache
+    estatisticas_cascata.registrar(info)
+    result.metricas["cascata"] = info
+    if cache is not None:
+        cache.put(chave, result.to_dict(), meta={
+            "provider": provider, "model": f"{rapido}>{premium}", "tipo": tipo_transacao,
+        })
+    return result
+
 
 def auditar_transacao(
     images: List[PILImage.Image],
     tipo_transacao: str,
     settings: dict[str, Any],
+    usar_cache: bool = True,
+    cancel: CancelToken | None = None,
+    on_campo: Callable[[str, Any], None] | None = None,
+    preparadas: List[ImagemPreparada] | None = None,
+    contexto: str = "",
 ) -> AuditResult:
     """
     Audita o dossiê de uma transação usando a IA configurada.
@@ -242,38 +1698,113 @@ def auditar_transacao(
         images: Lista de todas as imagens digitalizadas (em ordem).
         tipo_transacao: Nome do tipo (ex: "Próprio Paciente").
         settings: Configurações carregadas (provedor, modelo, chave).
+        usar_cache: Se False, ignora o cache local e força nova chamada à IA
+            (o resultado novo ainda é gravado no cache).
+        cancel: Token opcional; ao ser cancelado levanta AuditoriaCancelada
+            no próximo ponto de verificação (antes/entre tentativas).
+        on_campo: Callback opcional; ativa o streaming e recebe (campo, valor)
+            assim que "autorizacao", "data", cada item de "erros[]" etc. chegam.
+        preparadas: Páginas já codificadas (ex: pelo pipeline em background);
+            se omitido, as imagens são preparadas aqui.
+        contexto: Texto extra para o prompt (ex: RelatorioRegras.texto_prompt()).
 
     Returns:
         AuditResult com resultado da análise.
-    """
-    provider: str = settings.get("ai_provider", "gemini")
-    model: str = settings.get("ai_model", "gemini-2.0-flash")
-    api_key: str = get_active_api_key(settings)
 
-    if not api_key:
-        raise ValueError(f"Chave de API não configurada para o provedor '{provider}'.")
+    Com settings["ai_cascata"], audita primeiro com o modelo rápido e só repete no
+    premium os dossiês reprovados ou de baixa confiança (ver _auditar_em_cascata).
+    Nesse modo settings["ai_model"] é ignorado: valem ai_modelo_rapido/ai_modelo_premium
+    (ou o par de MODELOS_CASCATA do provedor), e on_campo recebe CAMPO_REINICIAR
+    quando o premium assume.
+    """
+    modelos = modelos_cascata(settings)
+    if modelos is not None:
+        return _auditar_em_cascata(
+            images, tipo_transacao, settings, usar_cache, cancel, on_campo, preparadas, contexto, *modelos
+        )
+    return _auditar_modelo(
+        images, tipo_transacao, settings, usar_cache, cancel, on_campo, preparadas, contexto
+    )
 
-    if not images:
-        raise ValueError("Nenhuma imagem para auditar.")
 
-    master_prompt = get_master_prompt()
-    prompt = _build_prompt(master_prompt, tipo_transacao, len(images))
+def _auditar_modelo(
+    images: List[PILImage.Image],
+    tipo_transacao: str,
+    settings: dict[str, Any],
+    usar_cache: bool,
+    cancel: CancelToken | None,
+    on_campo: Callable[[str, Any], None] | None,
+    preparadas: List[ImagemPreparada] | None,
+    contexto: str,
+    esquema: dict[str, Any] = ESQUEMA_AUDITORIA,
+) -> AuditResult:
+    """Uma auditoria com o modelo de settings["ai_model"] (corpo de auditar_transacao)."""
+    ctx, cached = _iniciar_auditoria(images, tipo_transacao, settings, usar_cache, contexto)
+    if cached is not None:
+        return cached
 
     try:
-        raw: dict[str, Any]
-        if provider == "gemini":
-            raw = _audit_gemini(images, prompt, api_key, model)
-        elif provider == "openai":
-            raw = _audit_openai(images, prompt, api_key, model)
-        elif provider == "anthropic":
-            raw = _audit_anthropic(images, prompt, api_key, model)
-        elif provider == "openrouter":
-            raw = _audit_openrouter(images, prompt, api_key, model)
+        t0 = time.perf_counter()
+        if preparadas is None:
+            preparadas = preparar_imagens(images, ctx.provider, ctx.model, settings)
+        t1 = time.perf_counter()
+        uso: dict[str, int] = {}
+        if on_campo is not None and settings.get("ai_streaming", True):
+            raw = chamar_provedor_stream(
+                ctx.provider, preparadas, ctx.prompt, ctx.api_key, ctx.model,
+                on_campo=on_campo, cancel=cancel, max_retries=ctx.max_retries,
+                sistema=ctx.sistema, uso=uso, esquema=esquema,
+            )
         else:
-            raise ValueError(f"Provedor desconhecido: {provider}")
+            raw = chamar_provedor(
+                ctx.provider, preparadas, ctx.prompt, ctx.api_key, ctx.model,
+                cancel=cancel, max_retries=ctx.max_retries, sistema=ctx.sistema, uso=uso,
+                esquema=esquema,
+            )
+        t2 = time.perf_counter()
+        return _concluir_auditoria(ctx, raw, preparadas, t0, t1, t2, uso, cancel)
+
+    except AuditoriaCancelada:
+        raise
+    except json.JSONDecodeError as e:
+        raise RuntimeError(
+            f"A IA retornou uma resposta inválida (não é JSON). Detalhes: {e}"
+        ) from e
+    except Exception as e:
+        raise RuntimeError(f"Erro durante a auditoria: {e}") from e
 
-        return AuditResult(raw)
 
+async def auditar_transacao_async(
+    images: List[PILImage.Image],
+    tipo_transacao: str,
+    settings: dict[str, Any],
+    usar_cache: bool = True,
+    contexto: str = "",
+) -> AuditResult:
+    """
+    Versão asyncio de auditar_transacao (mesmos erros).
+    O pré-processamento das imagens roda em thread para não bloquear o loop.
+    """
+    import asyncio
+
+    ctx, cached = _iniciar_auditoria(images, tipo_transacao, settings, usar_cache, contexto)
+    if cached is not None:
+        return cached
+
+    try:
+        t0 = time.perf_counter()
+        preparadas = await asyncio.to_thread(preparar_imagens, images, ctx.provider, ctx.model, settings)
+        t1 = time.perf_counter()
+        uso: dict[str, int] = {}
+        raw = await chamar_provedor_async(
+            ctx.provider, preparadas, ctx.prompt, ctx.api_key, ctx.model,
+            max_retries=ctx.max_retries, sistema=ctx.sistema, uso=uso, esquema=ESQUEMA_AUDITORIA,
+        )
+        t2 = time.perf_counter()
+        return _concluir_auditoria(ctx, raw, preparadas, t0, t1, t2, uso)
+
+    except asyncio.CancelledError:
+        raise
     except json.JSONDecodeError as e:
         raise RuntimeError(
             f"A IA retornou uma resposta inválida (não é JSON). Detalhes: {e}"
@@ -294,42 +1825,169 @@ def testar_conexao(settings: dict[str, Any]) -> bool:
     if not api_key:
         raise ValueError("Nenhuma chave de API configurada.")
 
-    test_prompt = "Responda apenas: OK"
+    # Usa o mesmo cliente (e pool de conexões) das auditorias
+    _enviar(provider, [], "Responda apenas: OK", api_key, model, max_tokens=5)
+    return True
 
-    if provider == "gemini":
-        import google.generativeai as genai  # type: ignore[import-untyped]
-        genai.configure(api_key=api_key)
-        client = genai.GenerativeModel(model)
-        client.generate_content(test_prompt)
 
-    elif provider == "openai":
-        from openai import OpenAI  # type: ignore[import-untyped]
-        client_oai = OpenAI(api_key=api_key)
-        client_oai.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": test_prompt}],
-            max_tokens=5,
+# ─── Modo batch (APIs de lote) ───────────────────────────────────────────────
+#
+# OpenAI e Anthropic aceitam muitas requisições em um único job assíncrono, mais
+# barato e com cota separada da de tempo real. O resultado fica pronto em minutos
+# ou horas (até 24h): serve para reauditorias retroativas, não para o balcão.
+
+BATCH_PROVIDERS = ("openai", "anthropic")
+BATCH_MAX_TOKENS = 2000
+
+
+def _cliente_lote(provider: str, api_key: str, base_url: str = "") -> Any:
+    """Cliente do provedor; `base_url` aponta para outro servidor (ex: tools/servidor_lote_falso.py)."""
+    if provider not in BATCH_PROVIDERS:
+        raise ValueError(
+            f"O provedor '{provider}' não oferece API de lote. Use OpenAI ou Anthropic."
         )
+    if not base_url:
+        return get_registry().client(provider, api_key)
 
-    elif provider == "anthropic":
-        import anthropic  # type: ignore[import-untyped]
-        client_ant = anthropic.Anthropic(api_key=api_key)
-        client_ant.messages.create(
-            model=model,
-            max_tokens=5,
-            messages=[{"role": "user", "content": test_prompt}],
+    base_url = base_url.rstrip("/")
+    if provider == "openai":
+        from openai import OpenAI  # type: ignore[import-untyped]
+
+        if not base_url.endswith("/v1"):
+            base_url += "/v1"
+        return OpenAI(api_key=api_key, base_url=base_url, max_retries=2)
+
+    import anthropic  # type: ignore[import-untyped]
+
+    return anthropic.Anthropic(api_key=api_key, base_url=base_url, max_retries=2)
+
+
+def requisicao_lote(
+    preparadas: List[ImagemPreparada],
+    tipo_transacao: str,
+    settings: dict[str, Any],
+    master_prompt: str | None = None,
+) -> dict[str, Any]:
+    """Corpo da requisição de auditoria de um dossiê, no formato do job de lote do provedor."""
+    provider: str = settings.get("ai_provider", "gemini")
+    model: str = settings.get("ai_model", "gemini-2.0-flash")
+    if provider not in BATCH_PROVIDERS:
+        raise ValueError(
+            f"O provedor '{provider}' não oferece API de lote. Use OpenAI ou Anthropic."
         )
+    if master_prompt is None:
+        master_prompt = get_master_prompt()
+    sistema = prompt_de_sistema(master_prompt)
+    prompt = _build_prompt(tipo_transacao, len(preparadas))
+    if provider == "openai":
+        return _openai_request(provider, preparadas, prompt, model, BATCH_MAX_TOKENS, sistema, ESQUEMA_AUDITORIA)
+    return _anthropic_request(preparadas, prompt, model, BATCH_MAX_TOKENS, sistema, ESQUEMA_AUDITORIA)
+
 
-    elif provider == "openrouter":
-        from openai import OpenAI
-        client_or = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key
+def enviar_lote(
+    provider: str,
+    api_key: str,
+    requisicoes: List[tuple[str, dict[str, Any]]],
+    base_url: str = "",
+) -> str:
+    """
+    Cria um job de lote com as requisições (custom_id, corpo) e retorna o id do job.
+    custom_id deve ser único no job e conter só letras, números, "-" e "_".
+    """
+    if not requisicoes:
+        raise ValueError("Nenhuma requisição para enviar.")
+    client = _cliente_lote(provider, api_key, base_url)
+
+    if provider == "openai":
+        linhas = [
+            json.dumps(
+                {"custom_id": cid, "method": "POST", "url": "/v1/chat/completions", "body": corpo},
+                ensure_ascii=False,
+            )
+            for cid, corpo in requisicoes
+        ]
+        arquivo = client.files.create(
+            file=("auditoria_lote.jsonl", "\n".join(linhas).encode("utf-8")),
+            purpose="batch",
         )
-        client_or.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": test_prompt}],
-            max_tokens=5,
+        job = client.batches.create(
+            input_file_id=arquivo.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
         )
+        return job.id
 
-    return True
+    job = client.messages.batches.create(
+        requests=[{"custom_id": cid, "params": corpo} for cid, corpo in requisicoes]
+    )
+    return job.id
+
+
+def consultar_lote(provider: str, api_key: str, job_id: str, base_url: str = "") -> str:
+    """Estado do job: "em_andamento", "concluido" ou "falhou"."""
+    client = _cliente_lote(provider, api_key, base_url)
+    if provider == "openai":
+        status = client.batches.retrieve(job_id).status
+        # Um job expirado ainda entrega os resultados que ficaram prontos
+        if status in ("completed", "expired"):
+            return "concluido"
+        if status in ("failed", "cancelled"):
+            return "falhou"
+        return "em_andamento"
+
+    job = client.messages.batches.retrieve(job_id)
+    return "concluido" if job.processing_status == "ended" else "em_andamento"
+
+
+def _resultado_lote(custom_id: str, texto: str) -> tuple[str, dict[str, Any] | None, str]:
+    """
+    Interpreta a resposta como no tempo real (interpretar_resposta). Sem chamada de
+    reparo: campos defeituosos ficam com o padrão do AuditResult.
+    """
+    dados, invalidos = interpretar_resposta(texto, ESQUEMA_AUDITORIA)
+    if not dados:
+        return custom_id, None, "A IA retornou uma resposta inválida (nenhum campo do JSON aproveitável)."
+    if invalidos:
+        print(f"[AIAuditor] lote: {custom_id} com campo(s) inválido(s) {invalidos}")
+    return custom_id, AuditResult(dados).to_dict(), ""
+
+
+def resultados_lote(
+    provider: str,
+    api_key: str,
+    job_id: str,
+    base_url: str = "",
+) -> Iterator[tuple[str, dict[str, Any] | None, str]]:
+    """
+    Produz (custom_id, resultado, erro) para cada requisição do job concluído.
+    `resultado` vem no formato de AuditResult.to_dict(); em caso de falha é None e
+    `erro` traz a mensagem.
+    """
+    client = _cliente_lote(provider, api_key, base_url)
+
+    if provider == "openai":
+        job = client.batches.retrieve(job_id)
+        for file_id in (job.output_file_id, job.error_file_id):
+            if not file_id:
+                continue
+            for linha in client.files.content(file_id).text.splitlines():
+                if not linha.strip():
+                    continue
+                item = json.loads(linha)
+                custom_id = item.get("custom_id", "")
+                resposta = item.get("response") or {}
+                corpo = resposta.get("body") or {}
+                if item.get("error") or resposta.get("status_code") != 200:
+                    erro = (item.get("error") or corpo.get("error") or {}).get("message")
+                    yield custom_id, None, erro or f"HTTP {resposta.get('status_code')}"
+                    continue
+                yield _resultado_lote(custom_id, corpo["choices"][0]["message"]["content"] or "")
+        return
+
+    for item in client.messages.batches.results(job_id):
+        resultado = item.result
+        if resultado.type != "succeeded":
+            erro = getattr(resultado, "error", None)
+            yield item.custom_id, None, str(erro) if erro else resultado.type
+            continue
+        yield _resultado_lote(item.custom_id, _texto_anthropic(resultado.message))
@@ -0,0 +1,163 @@
+"""
+audit_cache.py - Cache persistente (em disco) dos resultados de auditoria IA.
+
+Cada entrada é um JSON endereçado pelo conteúdo: SHA256 de
+(bytes normalizados das imagens, tipo da transação, master_prompt, provedor, modelo).
+Reauditar o mesmo dossiê devolve o resultado salvo sem chamar a API.
+
+Eviction: entradas mais antigas que `max_age_days` são descartadas e, se o
+diretório passar de `max_bytes`, as menos usadas recentemente são removidas.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+from PIL import Image
+
+from core.config import APP_DATA_DIR
+
+
+CACHE_DIR = APP_DATA_DIR / "audit_cache"
+
+# Limites padrão (sobrescritos pelas settings)
+DEFAULT_MAX_MB = 50
+DEFAULT_MAX_DAYS = 90
+
+
+def hash_image(img: Image.Image) -> str:
+    """
+    Retorna o SHA256 dos pixels normalizados (RGB) da imagem.
+    Inclui as dimensões para diferenciar imagens com o mesmo buffer.
+    """
+    rgb = img if img.mode == "RGB" else img.convert("RGB")
+    h = hashlib.sha256()
+    h.update(f"{rgb.width}x{rgb.height}|".encode())
+    h.update(rgb.tobytes())
+    return h.hexdigest()
+
+
+def build_cache_key(
+    images: List[Image.Image],
+    tipo_transacao: str,
+    master_prompt: str,
+    provider: str,
+    model: str,
+) -> str:
+    """Monta a chave de cache a partir de tudo que influencia a resposta da IA."""
+    h = hashlib.sha256()
+    for part in (tipo_transacao, master_prompt, provider, model):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    for img in images:
+        h.update(hash_image(img).encode())
+    return h.hexdigest()
+
+
+class AuditCache:
+    """Cache de resultados de auditoria em arquivos JSON (um por chave)."""
+
+    def __init__(
+        self,
+        cache_dir: Path = CACHE_DIR,
+        max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+        max_age_days: int = DEFAULT_MAX_DAYS,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_days * 86400
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings: dict[str, Any]) -> "AuditCache":
+        max_mb = int(settings.get("audit_cache_max_mb", DEFAULT_MAX_MB))
+        max_days = int(settings.get("audit_cache_max_days", DEFAULT_MAX_DAYS))
+        return cls(max_bytes=max_mb * 1024 * 1024, max_age_days=max_days)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        """Retorna o resultado bruto salvo ou None (ausente, expirado ou corrompido)."""
+        path = self._path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+
+        if self.max_age_s > 0 and time.time() - stat.st_mtime > self.max_age_s:
+            self._remove(path)
+            return None
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry: dict[str, Any] = json.load(f)
+        except Exception:
+            self._remove(path)
+            return None
+
+        # Marca acesso (atime nem sempre é confiável no Windows)
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+        return entry.get("result")
+
+    def put(self, key: str, result: dict[str, Any], meta: Optional[dict[str, Any]] = None) -> None:
+        """Grava o resultado de forma atômica e aplica a política de eviction."""
+        entry = {"created": time.time(), "meta": meta or {}, "result": result}
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[AuditCache] Falha ao gravar cache: {e}")
+            self._remove(tmp)
+            return
+        self.evict()
+
+    def invalidate(self, key: str) -> None:
+        self._remove(self._path(key))
+
+    def clear(self) -> None:
+        for path in self.cache_dir.glob("*.json"):
+            self._remove(path)
+
+    def evict(self) -> None:
+        """Remove entradas expiradas e, se necessário, as menos usadas até caber em max_bytes."""
+        now = time.time()
+        entries: list[tuple[float, int, Path]] = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age_s > 0 and now - stat.st_mtime > self.max_age_s:
+                self._remove(path)
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes <= 0 or total <= self.max_bytes:
+            return
+
+        entries.sort()  # menos recentemente usados primeiro
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,128 @@
+"""
+audit_pipeline.py - Pré-processamento da auditoria em background durante a digitalização.
+
+Assim que uma etapa é concluída (Transaction.avancar_etapa), suas páginas já são
+codificadas para o provedor e — no modo "duas_fases" — extraídas pela IA. Quando a
+ResultScreen abre, resta apenas a chamada final (consolidação ou auditoria completa).
+A extração pela IA não roda com o limite diário de auditorias da licença atingido.
+Com o OCR local ligado, a etapa do cupom também já passa pelo core.ocr_local.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core import ocr_local
+from core.ai_auditor import CancelToken, ImagemPreparada, preparar_imagens
+from core.audit_cache import AuditCache
+from core.step_extractor import extrair_etapa
+from core.transaction import ScanStep, Transaction
+
+
+class PipelineAuditoria:
+    """
+    Trabalho em background por etapa de uma transação. `dentro_do_limite` diz se o
+    limite diário de auditorias ainda permite chamar a IA (None = sem limite).
+    """
+
+    def __init__(
+        self,
+        transacao: Transaction,
+        settings: dict[str, Any],
+        max_workers: int = 2,
+        dentro_do_limite: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        self.transacao = transacao
+        self.settings = settings
+        self._dentro_do_limite = dentro_do_limite
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        # etapa.id -> (ids das páginas no momento do envio, futuro)
+        self._preparadas: Dict[str, Tuple[List[str], Future]] = {}
+        self._extracoes: Dict[str, Future] = {}
+        self._ocr: Optional[Tuple[List[str], Future]] = None
+        self._cancel = CancelToken()
+        transacao.on_etapa_concluida(self._on_etapa_concluida)
+
+    @property
+    def _provider_model(self) -> Tuple[str, str]:
+        return (
+            self.settings.get("ai_provider", "gemini"),
+            self.settings.get("ai_model", "gemini-2.0-flash"),
+        )
+
+    def _on_etapa_concluida(self, etapa: ScanStep) -> None:
+        if self._cancel.cancelado or not etapa.tem_imagens:
+            return
+        # Snapshot: se o usuário voltar e alterar a etapa, o novo envio substitui este
+        imagens = etapa.imagens.copia()
+        provider, model = self._provider_model
+
+        if etapa.id == ocr_local.ETAPA_CUPOM and self.settings.get("ocr_local"):
+            self._ocr = (imagens.ids, self._pool.submit(ocr_local.extrair, imagens))
+
+        if self.settings.get("audit_mode") == "duas_fases":
+            if not self.settings.get("audit_cache_enabled", True):
+                return  # Sem cache, o resultado da extração não teria como ser reaproveitado
+            if self._dentro_do_limite is not None and not self._dentro_do_limite():
+                return  # A ResultScreen vai bloquear a auditoria: seria chamada à API fora da cota
+            snapshot = ScanStep(
+                id=etapa.id, titulo=etapa.titulo, descricao=etapa.descricao, imagens=imagens
+            )
+            cache = AuditCache.from_settings(self.settings)
+            self._extracoes[etapa.id] = self._pool.submit(
+                extrair_etapa, snapshot, self.settings, cache, True, self._cancel
+            )
+        else:
+            self._preparadas[etapa.id] = (
+                imagens.ids,
+                self._pool.submit(preparar_imagens, imagens, provider, model, self.settings),
+            )
+
+    def aguardar(self, cancel: Optional[CancelToken] = None, timeout: float = 0.5) -> None:
+        """Espera o trabalho pendente terminar (verificando o cancelamento periodicamente)."""
+        pendentes = [f for _, f in self._preparadas.values()] + list(self._extracoes.values())
+        while pendentes:
+            if cancel is not None:
+                cancel.verificar()
+            _, nao_feitos = wait(pendentes, timeout=timeout)
+            pendentes = list(nao_feitos)
+
+    def imagens_preparadas(self) -> Optional[List[ImagemPreparada]]:
+        """
+        Retorna as páginas já codificadas de todas as etapas, em ordem, ou None se
+        alguma etapa ainda não foi processada ou mudou desde o envio.
+        """
+        resultado: List[ImagemPreparada] = []
+        for etapa in self.transacao.etapas:
+            if not etapa.tem_imagens:
+                continue
+            item = self._preparadas.get(etapa.id)
+            if item is None:
+                return None
+            enviadas, futuro = item
+            if enviadas != etapa.imagens.ids or not futuro.done():
+                return None
+            try:
+                resultado.extend(futuro.result())
+            except Exception:
+                return None
+        return resultado or None
+
+    def resultado_ocr(self, timeout: Optional[float] = None) -> Optional[ocr_local.ResultadoOCR]:
+        """OCR local do cupom feito em background; None se não rodou, falhou ou o cupom mudou."""
+        if self._ocr is None:
+            return None
+        enviadas, futuro = self._ocr
+        etapa = next((e for e in self.transacao.etapas if e.id == ocr_local.ETAPA_CUPOM), None)
+        if etapa is None or enviadas != etapa.imagens.ids:
+            return None
+        try:
+            return futuro.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def encerrar(self) -> None:
+        """Cancela o trabalho pendente (ex: transação descartada)."""
+        self._cancel.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
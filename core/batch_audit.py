@@ -0,0 +1,545 @@
+"""
+batch_audit.py - Motor de auditoria retroativa em lote (pastas de PDFs já gerados).
+
+- Rasteriza os PDFs em um pool de processos (core.pdf_converter).
+- Audita com concorrência limitada e limite de requisições por minuto.
+- Grava cada resultado em um relatório SQLite assim que fica pronto; uma execução
+  interrompida continua de onde parou (PDFs já auditados e inalterados são pulados).
+- Modo batch (executar_batch): envia os PDFs como jobs da API de lote do provedor
+  (OpenAI/Anthropic), mais barato e fora da cota usada no balcão.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from core.ai_auditor import (
+    BATCH_PROVIDERS,
+    AuditoriaCancelada,
+    CancelToken,
+    auditar_transacao,
+    consultar_lote,
+    enviar_lote,
+    preparar_imagens,
+    requisicao_lote,
+    resultados_lote,
+    vision_profile,
+)
+from core.audit_cache import AuditCache, build_cache_key
+from core.config import get_active_api_key, get_master_prompt
+from core.pdf_converter import pdf_to_images
+
+
+RELATORIO_PADRAO = "auditoria_lote.sqlite"
+TIPO_RETROATIVA = "Auditoria Retroativa (PDF)"
+
+# Limites por job de lote (os provedores aceitam ~200 MB e dezenas de milhares de requisições)
+BATCH_MAX_BYTES = 100 * 1024 * 1024
+BATCH_MAX_REQUISICOES = 10_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resultados (
+    pdf TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    status TEXT NOT NULL,
+    aprovado INTEGER,
+    autorizacao TEXT,
+    data TEXT,
+    erros TEXT,
+    observacoes TEXT,
+    mensagem TEXT,
+    atualizado_em TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs_provedor (
+    job_id TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL,
+    criado_em TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS itens_job (
+    custom_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    pdf TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    cache_key TEXT NOT NULL
+);
+"""
+
+
+class LimitadorRPM:
+    """Espaça o início das requisições para não passar de `rpm` por minuto."""
+
+    def __init__(self, rpm: int) -> None:
+        self.intervalo = 60.0 / rpm if rpm > 0 else 0.0
+        self._lock = threading.Lock()
+        self._proximo = 0.0
+
+    def aguardar(self, cancel: Optional[CancelToken] = None) -> None:
+        if self.intervalo <= 0:
+            return
+        with self._lock:
+            agora = time.monotonic()
+            inicio = max(agora, self._proximo)
+            self._proximo = inicio + self.intervalo
+        espera = inicio - agora
+        if espera > 0:
+            if cancel is not None:
+                cancel.esperar(espera)
+            else:
+                time.sleep(espera)
+
+
+@dataclass
+class ResumoLote:
+    total: int = 0
+    pulados: int = 0
+    aprovados: int = 0
+    reprovados: int = 0
+    falhas: int = 0
+    interrompido: bool = False
+
+    @property
+    def feitos(self) -> int:
+        return self.pulados + self.aprovados + self.reprovados + self.falhas
+
+
+class RelatorioLote:
+    """Relatório SQLite com checkpoint por PDF."""
+
+    def __init__(self, caminho: Path) -> None:
+        self.caminho = caminho
+        self._conn = sqlite3.connect(str(caminho))
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def ja_auditado(self, pdf: Path, mtime: float) -> bool:
+        row = self._conn.execute(
+            "SELECT mtime, status FROM resultados WHERE pdf = ?", (str(pdf),)
+        ).fetchone()
+        return row is not None and row[1] == "ok" and abs(row[0] - mtime) < 1e-3
+
+    def gravar(self, pdf: Path, mtime: float, status: str, dados: Optional[Dict[str, Any]] = None, mensagem: str = "") -> None:
+        dados = dados or {}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                str(pdf),
+                mtime,
+                status,
+                None if "aprovado" not in dados else int(bool(dados["aprovado"])),
+                dados.get("autorizacao", ""),
+                dados.get("data", ""),
+                json.dumps(dados.get("erros", []), ensure_ascii=False),
+                dados.get("observacoes", ""),
+                mensagem,
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+        self._conn.commit()
+
+    def exportar_csv(self, destino: Path) -> Path:
+        cursor = self._conn.execute(
+            "SELECT pdf, status, aprovado, autorizacao, data, erros, observacoes, mensagem, atualizado_em "
+            "FROM resultados ORDER BY pdf"
+        )
+        with open(destino, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow([d[0] for d in cursor.description])
+            writer.writerows(cursor)
+        return destino
+
+    # ── Jobs da API de lote ─────────────────────────────────────────────────
+
+    def registrar_job(
+        self, job_id: str, provider: str, model: str, itens: List[tuple[str, Path, float, str]]
+    ) -> None:
+        """Registra um job enviado e seus itens (custom_id, pdf, mtime, cache_key)."""
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs_provedor VALUES (?, ?, ?, 'em_andamento', ?)",
+                (job_id, provider, model, datetime.now().isoformat(timespec="seconds")),
+            )
+            self._conn.executemany(
+                "INSERT INTO itens_job VALUES (?, ?, ?, ?, ?)",
+                [(cid, job_id, str(pdf), mtime, key) for cid, pdf, mtime, key in itens],
+            )
+
+    def jobs_pendentes(self) -> List[tuple[str, str, str]]:
+        """(job_id, provider, model) dos jobs ainda não coletados."""
+        return self._conn.execute(
+            "SELECT job_id, provider, model FROM jobs_provedor "
+            "WHERE status = 'em_andamento' ORDER BY criado_em"
+        ).fetchall()
+
+    def itens_job(self, job_id: str) -> Dict[str, tuple[Path, float, str]]:
+        rows = self._conn.execute(
+            "SELECT custom_id, pdf, mtime, cache_key FROM itens_job WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return {cid: (Path(pdf), mtime, key) for cid, pdf, mtime, key in rows}
+
+    def pdfs_em_job(self) -> Set[str]:
+        """PDFs aguardando resultado em algum job pendente (não devem ser reenviados)."""
+        rows = self._conn.execute(
+            "SELECT i.pdf FROM itens_job i JOIN jobs_provedor j ON i.job_id = j.job_id "
+            "WHERE j.status = 'em_andamento'"
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def concluir_job(self, job_id: str, status: str) -> None:
+        self._conn.execute("UPDATE jobs_provedor SET status = ? WHERE job_id = ?", (status, job_id))
+        self._conn.commit()
+
+    def fechar(self) -> None:
+        self._conn.close()
+
+
+class AuditoriaEmLote:
+    """
+    Audita todos os PDFs de uma pasta.
+
+    Args:
+        pasta: Pasta com os PDFs (ex: output_folder).
+        settings: Configurações (provedor, modelo, chave).
+        relatorio: Caminho do SQLite (padrão: <pasta>/auditoria_lote.sqlite).
+        recursivo: Inclui subpastas.
+        max_concorrencia: Auditorias simultâneas na IA.
+        rpm: Máximo de requisições por minuto (0 = sem limite).
+        processos: Processos de rasterização.
+    """
+
+    def __init__(
+        self,
+        pasta: Path,
+        settings: dict[str, Any],
+        relatorio: Optional[Path] = None,
+        recursivo: bool = False,
+        max_concorrencia: int = 3,
+        rpm: int = 20,
+        processos: int = 2,
+    ) -> None:
+        self.pasta = Path(pasta)
+        self.settings = settings
+        self.relatorio_path = relatorio or self.pasta / RELATORIO_PADRAO
+        self.recursivo = recursivo
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.processos = max(1, processos)
+        self.limitador = LimitadorRPM(rpm)
+        # Não adianta rasterizar acima da resolução que o provedor aproveita
+        self.max_dim = vision_profile(
+            settings.get("ai_provider", "gemini"), settings.get("ai_model", "gemini-2.0-flash")
+        )
+
+    def listar_pdfs(self) -> List[Path]:
+        padrao = "**/*.pdf" if self.recursivo else "*.pdf"
+        return sorted(p for p in self.pasta.glob(padrao) if p.is_file())
+
+    def _fila(
+        self, relatorio: RelatorioLote, resumo: ResumoLote, ignorar: Optional[Set[str]] = None
+    ) -> List[tuple[Path, float]]:
+        """PDFs a auditar (novos ou alterados); os já auditados contam como pulados."""
+        fila: List[tuple[Path, float]] = []
+        for pdf in self.listar_pdfs():
+            if pdf.resolve() == self.relatorio_path.resolve():
+                continue
+            if ignorar and str(pdf) in ignorar:
+                continue
+            mtime = pdf.stat().st_mtime
+            if relatorio.ja_auditado(pdf, mtime):
+                resumo.pulados += 1
+            else:
+                fila.append((pdf, mtime))
+        return fila
+
+    def _auditar(self, pdf: Path, images: List[Any], cancel: CancelToken) -> Dict[str, Any]:
+        self.limitador.aguardar(cancel)
+        result = auditar_transacao(
+            images=images,
+            tipo_transacao=TIPO_RETROATIVA,
+            settings=self.settings,
+            cancel=cancel,
+        )
+        return result.to_dict()
+
+    def executar(
+        self,
+        on_progresso: Optional[Callable[[int, int, Path, str], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        antes_de_auditar: Optional[Callable[[], bool]] = None,
+    ) -> ResumoLote:
+        """
+        Processa a pasta. `on_progresso(feitos, total, pdf, status)` é chamado a cada PDF.
+        `antes_de_auditar()` pode retornar False para interromper (ex: limite diário).
+        """
+        cancel = cancel or CancelToken()
+        relatorio = RelatorioLote(self.relatorio_path)
+        resumo = ResumoLote()
+
+        fila = self._fila(relatorio, resumo)
+        resumo.total = len(fila) + resumo.pulados
+        feitos = resumo.pulados
+
+        def notificar(pdf: Path, status: str) -> None:
+            if on_progresso is not None:
+                on_progresso(feitos, resumo.total, pdf, status)
+
+        # Limita quantos PDFs ficam rasterizados em memória aguardando a IA
+        max_em_voo = self.max_concorrencia * 2
+        rasterizando: Dict[Future, tuple[Path, float]] = {}
+        auditando: Dict[Future, tuple[Path, float]] = {}
+
+        with ProcessPoolExecutor(max_workers=self.processos) as procs, \
+                ThreadPoolExecutor(max_workers=self.max_concorrencia) as threads:
+            try:
+                while fila or rasterizando or auditando:
+                    while fila and not cancel.cancelado and len(rasterizando) + len(auditando) < max_em_voo:
+                        pdf, mtime = fila.pop(0)
+                        rasterizando[procs.submit(pdf_to_images, str(pdf), max_dim=self.max_dim)] = (pdf, mtime)
+
+                    if not rasterizando and not auditando:
+                        break
+
+                    prontos, _ = wait(list(rasterizando) + list(auditando), return_when=FIRST_COMPLETED)
+                    for fut in prontos:
+                        if fut in rasterizando:
+                            pdf, mtime = rasterizando.pop(fut)
+                            try:
+                                images = fut.result()
+                                if not images:
+                                    raise ValueError("Não foi possível extrair imagens deste PDF.")
+                            except Exception as e:
+                                relatorio.gravar(pdf, mtime, "falha", mensagem=f"Conversão: {e}")
+                                resumo.falhas += 1
+                                feitos += 1
+                                notificar(pdf, "falha")
+                                continue
+                            if cancel.cancelado:
+                                continue
+                            if antes_de_auditar is not None and not antes_de_auditar():
+                                cancel.cancel()
+                                continue
+                            auditando[threads.submit(self._auditar, pdf, images, cancel)] = (pdf, mtime)
+                        else:
+                            pdf, mtime = auditando.pop(fut)
+                            try:
+                                dados = fut.result()
+                            except AuditoriaCancelada:
+                                continue
+                            except Exception as e:
+                                relatorio.gravar(pdf, mtime, "falha", mensagem=str(e))
+                                resumo.falhas += 1
+                                feitos += 1
+                                notificar(pdf, "falha")
+                                continue
+                            relatorio.gravar(pdf, mtime, "ok", dados)
+                            if dados.get("aprovado"):
+                                resumo.aprovados += 1
+                            else:
+                                resumo.reprovados += 1
+                            feitos += 1
+                            notificar(pdf, "aprovado" if dados.get("aprovado") else "reprovado")
+
+                    if cancel.cancelado:
+                        fila.clear()
+            finally:
+                resumo.interrompido = cancel.cancelado
+                relatorio.fechar()
+        return resumo
+
+    # ── Modo batch (API de lote do provedor) ────────────────────────────────
+
+    def _rasterizar(
+        self, fila: List[tuple[Path, float]], cancel: CancelToken
+    ) -> Iterator[tuple[Path, float, Any]]:
+        """Rasteriza em ordem com poucos PDFs em memória; produz (pdf, mtime, imagens ou exceção)."""
+        pendentes: deque = deque()
+        proximo = 0
+        with ProcessPoolExecutor(max_workers=self.processos) as procs:
+            while (proximo < len(fila) or pendentes) and not cancel.cancelado:
+                while proximo < len(fila) and len(pendentes) < self.processos * 2:
+                    pdf, mtime = fila[proximo]
+                    proximo += 1
+                    pendentes.append((pdf, mtime, procs.submit(pdf_to_images, str(pdf), max_dim=self.max_dim)))
+                pdf, mtime, fut = pendentes.popleft()
+                try:
+                    yield pdf, mtime, fut.result()
+                except Exception as e:
+                    yield pdf, mtime, e
+            for _, _, fut in pendentes:
+                fut.cancel()
+
+    def executar_batch(
+        self,
+        on_progresso: Optional[Callable[[int, int, Path, str], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        antes_de_auditar: Optional[Callable[[], bool]] = None,
+        base_url: str = "",
+        intervalo_s: float = 60.0,
+    ) -> ResumoLote:
+        """
+        Audita a pasta pela API de lote do provedor (OpenAI/Anthropic).
+
+        Os PDFs pendentes são enviados em um ou mais jobs, que depois são consultados a
+        cada `intervalo_s` até terminarem. Se a execução for interrompida, os jobs seguem
+        no provedor e a próxima execução retoma a espera em vez de reenviar os PDFs.
+        `base_url` aponta para outro servidor (ex: tools/servidor_lote_falso.py).
+        """
+        provider: str = self.settings.get("ai_provider", "gemini")
+        model: str = self.settings.get("ai_model", "gemini-2.0-flash")
+        api_key = get_active_api_key(self.settings)
+        if provider not in BATCH_PROVIDERS:
+            raise ValueError(f"O provedor '{provider}' não oferece API de lote. Use OpenAI ou Anthropic.")
+        if not api_key:
+            raise ValueError(f"Chave de API não configurada para o provedor '{provider}'.")
+
+        cancel = cancel or CancelToken()
+        relatorio = RelatorioLote(self.relatorio_path)
+        resumo = ResumoLote()
+        cache: Optional[AuditCache] = None
+        if self.settings.get("audit_cache_enabled", True):
+            cache = AuditCache.from_settings(self.settings)
+
+        def registrar(pdf: Path, mtime: float, dados: Optional[Dict[str, Any]], erro: str) -> None:
+            if dados is None:
+                relatorio.gravar(pdf, mtime, "falha", mensagem=erro)
+                resumo.falhas += 1
+                status = "falha"
+            else:
+                relatorio.gravar(pdf, mtime, "ok", dados)
+                if dados.get("aprovado"):
+                    resumo.aprovados += 1
+                    status = "aprovado"
+                else:
+                    resumo.reprovados += 1
+                    status = "reprovado"
+            if on_progresso is not None:
+                on_progresso(resumo.feitos, resumo.total, pdf, status)
+
+        try:
+            em_job = relatorio.pdfs_em_job()
+            fila = self._fila(relatorio, resumo, ignorar=em_job)
+            resumo.total = resumo.pulados + len(em_job) + len(fila)
+
+            self._enviar_jobs(
+                fila, relatorio, cache, cancel, antes_de_auditar, registrar,
+                provider, model, api_key, base_url,
+            )
+            self._aguardar_jobs(relatorio, cache, cancel, registrar, base_url, intervalo_s)
+        finally:
+            resumo.interrompido = cancel.cancelado or bool(relatorio.jobs_pendentes())
+            relatorio.fechar()
+        return resumo
+
+    def _enviar_jobs(
+        self,
+        fila: List[tuple[Path, float]],
+        relatorio: RelatorioLote,
+        cache: Optional[AuditCache],
+        cancel: CancelToken,
+        antes_de_auditar: Optional[Callable[[], bool]],
+        registrar: Callable[[Path, float, Optional[Dict[str, Any]], str], None],
+        provider: str,
+        model: str,
+        api_key: str,
+        base_url: str,
+    ) -> None:
+        master_prompt = get_master_prompt()
+        requisicoes: List[tuple[str, Dict[str, Any]]] = []
+        itens: List[tuple[str, Path, float, str]] = []
+        tamanho = 0
+
+        def enviar() -> None:
+            nonlocal requisicoes, itens, tamanho
+            job_id = enviar_lote(provider, api_key, requisicoes, base_url)
+            relatorio.registrar_job(job_id, provider, model, itens)
+            print(f"[AuditoriaEmLote] Job {job_id} enviado: {len(requisicoes)} PDF(s), {tamanho / 1024 / 1024:.1f} MB")
+            requisicoes, itens, tamanho = [], [], 0
+
+        for pdf, mtime, images in self._rasterizar(fila, cancel):
+            if isinstance(images, Exception) or not images:
+                erro = images or "Não foi possível extrair imagens deste PDF."
+                registrar(pdf, mtime, None, f"Conversão: {erro}")
+                continue
+
+            # Mesma chave de auditar_transacao: o cache vale para os dois modos
+            key = build_cache_key(images, TIPO_RETROATIVA, master_prompt, provider, model)
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                registrar(pdf, mtime, cached, "")
+                continue
+
+            if antes_de_auditar is not None and not antes_de_auditar():
+                cancel.cancel()
+                break
+
+            try:
+                preparadas = preparar_imagens(images, provider, model, self.settings)
+                corpo = requisicao_lote(preparadas, TIPO_RETROATIVA, self.settings, master_prompt)
+            except Exception as e:
+                registrar(pdf, mtime, None, str(e))
+                continue
+
+            # base64 ocupa ~4/3 dos bytes; a folga cobre o prompt e o envelope JSON
+            tamanho_req = sum(len(p.data) for p in preparadas) * 4 // 3 + 16 * 1024
+            if requisicoes and (
+                tamanho + tamanho_req > BATCH_MAX_BYTES or len(requisicoes) >= BATCH_MAX_REQUISICOES
+            ):
+                enviar()
+            custom_id = f"pdf-{uuid.uuid4().hex}"
+            requisicoes.append((custom_id, corpo))
+            itens.append((custom_id, pdf, mtime, key))
+            tamanho += tamanho_req
+
+        # O que já foi preparado é enviado mesmo se a execução foi interrompida
+        if requisicoes:
+            enviar()
+
+    def _aguardar_jobs(
+        self,
+        relatorio: RelatorioLote,
+        cache: Optional[AuditCache],
+        cancel: CancelToken,
+        registrar: Callable[[Path, float, Optional[Dict[str, Any]], str], None],
+        base_url: str,
+        intervalo_s: float,
+    ) -> None:
+        api_keys: Dict[str, str] = self.settings.get("api_keys", {})
+        while not cancel.cancelado:
+            for job_id, provider, model in relatorio.jobs_pendentes():
+                api_key = api_keys.get(provider, "")
+                estado = consultar_lote(provider, api_key, job_id, base_url)
+                if estado == "em_andamento":
+                    continue
+
+                itens = relatorio.itens_job(job_id)
+                if estado == "concluido":
+                    for custom_id, dados, erro in resultados_lote(provider, api_key, job_id, base_url):
+                        item = itens.pop(custom_id, None)
+                        if item is None:
+                            continue
+                        pdf, mtime, key = item
+                        if dados is not None and cache is not None:
+                            cache.put(key, dados, meta={"provider": provider, "model": model, "tipo": TIPO_RETROATIVA})
+                        registrar(pdf, mtime, dados, erro)
+                # Itens sem resposta (job falhou/expirou) voltam para a fila na próxima execução
+                for pdf, mtime, _ in itens.values():
+                    registrar(pdf, mtime, None, f"Sem resultado no job {job_id} ({estado}).")
+                relatorio.concluir_job(job_id, estado)
+
+            if not relatorio.jobs_pendentes():
+                return
+            try:
+                cancel.esperar(intervalo_s)
+            except AuditoriaCancelada:
+                return
@@ -0,0 +1,279 @@
+"""
+blob_store.py - Armazenamento endereçado por conteúdo das imagens de documentos (RG/CNH).
+
+Cada JPEG fica uma única vez em CPFs/.blobs/<sha[:2]>/<sha256>.jpg. As páginas
+visíveis da pasta CPFs (CPFs/52/99/<cpf>_pagN.jpg) são hardlinks para o blob, então
+o cliente que volta todo mês (mesmo documento reaproveitado) e o mesmo documento
+salvo para mais de um CPF (ex: responsável/procurador) não ocupam espaço de novo.
+
+Chave: SHA256 dos bytes (igualdade exata) ou SHA256 dos pixels decodificados
+(audit_cache.hash_image), que reconhece a mesma imagem recodificada (bytes
+diferentes, pixels idênticos). O hash perceptual (dHash) NÃO decide reaproveitamento:
+documentos do mesmo modelo (RGs de pessoas diferentes) colidem nele. Ele só aponta
+candidatos a revisão no relatório.
+
+Um blob sem nenhum hardlink além dele mesmo (st_nlink == 1) não é usado por
+nenhuma página e é apagado por coletar(). Os PDFs continuam autocontidos: gerar_pdf
+embute os mesmos bytes do blob e só anota a referência (para o relatório).
+
+Sem suporte a hardlinks no volume (alguns compartilhamentos de rede), o store fica
+inativo e as páginas são gravadas como arquivos comuns, como antes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from PIL import Image
+
+from core.audit_cache import hash_image
+from core.config import APP_DATA_DIR
+
+
+DB_PATH = APP_DATA_DIR / "blob_store.sqlite"
+BLOBS_DIR = ".blobs"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    raiz TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    dhash INTEGER NOT NULL,
+    largura INTEGER NOT NULL,
+    altura INTEGER NOT NULL,
+    tamanho INTEGER NOT NULL,
+    criado_em REAL NOT NULL,
+    pixels TEXT,
+    PRIMARY KEY (raiz, sha256)
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_dhash ON blobs (raiz, dhash, largura, altura);
+CREATE TABLE IF NOT EXISTS pdfs (
+    raiz TEXT NOT NULL,
+    pdf TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (raiz, pdf, sha256)
+);
+"""
+
+
+def dhash(img: Image.Image) -> int:
+    """Hash perceptual (difference hash, 64 bits): gradiente horizontal de uma miniatura 9x8."""
+    g = img.convert("L").resize((9, 8), Image.LANCZOS)
+    px = g.tobytes()  # modo "L": um byte por pixel, em ordem de linha
+    valor = 0
+    for linha in range(8):
+        for col in range(8):
+            valor = (valor << 1) | (px[linha * 9 + col] > px[linha * 9 + col + 1])
+    # SQLite guarda INTEGER com sinal (64 bits)
+    return valor - (1 << 64) if valor >= (1 << 63) else valor
+
+
+def distancia(a: int, b: int) -> int:
+    """Distância de Hamming entre dois dHash."""
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+@dataclass
+class RelatorioDedup:
+    blobs: int = 0
+    bytes_fisicos: int = 0  # ocupado de fato pelos blobs
+    paginas: int = 0  # páginas da pasta CPFs que apontam para algum blob
+    bytes_logicos: int = 0  # o que essas páginas ocupariam como arquivos separados
+    orfaos: int = 0  # blobs sem página (apagados no próximo coletar())
+    semelhantes: int = 0  # blobs distintos com o mesmo dHash e tamanho (só informativo)
+    pdfs: int = 0
+    paginas_pdf: int = 0  # páginas de PDFs cujos bytes são de um blob
+
+    @property
+    def economizados(self) -> int:
+        return max(self.bytes_logicos - self.bytes_fisicos, 0)
+
+    def texto(self) -> str:
+        mb = 1024 * 1024
+        return (
+            f"Blobs: {self.blobs} ({self.bytes_fisicos / mb:.1f} MB em disco)\n"
+            f"Páginas na pasta CPFs: {self.paginas} ({self.bytes_logicos / mb:.1f} MB sem deduplicação)\n"
+            f"Espaço economizado: {self.economizados / mb:.1f} MB\n"
+            f"Blobs órfãos: {self.orfaos}\n"
+            f"Blobs parecidos (mesmo dHash, pixels diferentes; não deduplicados): {self.semelhantes}\n"
+            f"PDFs com documentos do store: {self.pdfs} ({self.paginas_pdf} página(s), autocontidos)"
+        )
+
+
+class BlobStore:
+    """Blobs de uma pasta CPFs (`raiz`)."""
+
+    def __init__(self, raiz: Path, caminho: Path = DB_PATH) -> None:
+        self.raiz = Path(raiz)
+        self.diretorio = self.raiz / BLOBS_DIR
+        self._chave = str(self.raiz.resolve())
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(caminho), check_same_thread=False, timeout=30)
+        self._conn.executescript(_SCHEMA)
+        colunas = {r[1] for r in self._conn.execute("PRAGMA table_info(blobs)")}
+        if "pixels" not in colunas:
+            self._conn.execute("ALTER TABLE blobs ADD COLUMN pixels TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_pixels ON blobs (raiz, pixels)")
+        self._conn.commit()
+        self._lock = threading.RLock()
+        self._ativo: Optional[bool] = None
+
+    @property
+    def ativo(self) -> bool:
+        """True se o volume da pasta CPFs aceita hardlinks (testado uma vez)."""
+        if self._ativo is None:
+            self._ativo = self._testar_hardlink()
+        return self._ativo
+
+    def _testar_hardlink(self) -> bool:
+        try:
+            self.diretorio.mkdir(parents=True, exist_ok=True)
+            a = self.diretorio / f".teste-{uuid.uuid4().hex}"
+            b = a.with_suffix(".link")
+            a.write_bytes(b"")
+            try:
+                os.link(a, b)
+                ok = os.stat(a).st_nlink == 2
+                b.unlink()
+            finally:
+                a.unlink()
+            return ok
+        except OSError:
+            return False
+
+    def caminho(self, sha256: str) -> Path:
+        return self.diretorio / sha256[:2] / f"{sha256}.jpg"
+
+    # ── Gravação ──────────────────────────────────────────────────────────────
+
+    def guardar(self, img: Image.Image, data: bytes) -> str:
+        """
+        Guarda o JPEG `data` (pixels de `img`) e devolve o SHA256 do blob a usar:
+        o dele mesmo, ou o de um blob com exatamente os mesmos pixels já guardado.
+        """
+        sha = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if self._existe(sha):
+                return sha
+            pixels = hash_image(img)
+            row = self._conn.execute(
+                "SELECT sha256 FROM blobs WHERE raiz = ? AND pixels = ?", (self._chave, pixels)
+            ).fetchone()
+            if row is not None and self._existe(row[0]):
+                return row[0]  # mesma imagem, outra codificação
+            h = dhash(img)
+
+            destino = self.caminho(sha)
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            tmp = destino.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, destino)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._chave, sha, h, img.width, img.height, len(data), time.time(), pixels),
+            )
+            self._conn.commit()
+        return sha
+
+    def vincular(self, sha256: str, destino: Path) -> None:
+        """Cria a página `destino` como hardlink do blob (cópia, se o link falhar)."""
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        tmp = destino.with_name(f".{destino.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            os.link(self.caminho(sha256), tmp)
+        except OSError:
+            shutil.copyfile(self.caminho(sha256), tmp)
+        os.replace(tmp, destino)
+
+    def coletar(self, shas: Optional[Iterable[str]] = None) -> int:
+        """Apaga blobs que nenhuma página usa mais (todos, se `shas` for None). Retorna quantos."""
+        with self._lock:
+            if shas is None:
+                shas = [r[0] for r in self._conn.execute("SELECT sha256 FROM blobs WHERE raiz = ?", (self._chave,))]
+            apagados = 0
+            for sha in set(shas):
+                path = self.caminho(sha)
+                try:
+                    if os.stat(path).st_nlink > 1:
+                        continue
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                self._conn.execute("DELETE FROM blobs WHERE raiz = ? AND sha256 = ?", (self._chave, sha))
+                apagados += 1
+            self._conn.commit()
+        return apagados
+
+    # ── PDFs ──────────────────────────────────────────────────────────────────
+
+    def registrar_pdf(self, pdf: Path, paginas: Iterable[bytes]) -> int:
+        """Anota quais páginas do PDF são blobs do store. Retorna quantas."""
+        with self._lock:
+            shas = {hashlib.sha256(d).hexdigest() for d in paginas}
+            conhecidos = [s for s in shas if self._existe(s)]
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO pdfs VALUES (?, ?, ?)", [(self._chave, str(pdf), s) for s in conhecidos]
+            )
+            self._conn.commit()
+        return len(conhecidos)
+
+    # ── Relatório ─────────────────────────────────────────────────────────────
+
+    def relatorio(self) -> RelatorioDedup:
+        rel = RelatorioDedup()
+        with self._lock:
+            blobs = self._conn.execute(
+                "SELECT sha256, tamanho FROM blobs WHERE raiz = ?", (self._chave,)
+            ).fetchall()
+            pdfs = self._conn.execute(
+                "SELECT COUNT(DISTINCT pdf), COUNT(*) FROM pdfs WHERE raiz = ?", (self._chave,)
+            ).fetchone()
+            grupos = self._conn.execute(
+                "SELECT COUNT(*) FROM blobs WHERE raiz = ? GROUP BY dhash, largura, altura HAVING COUNT(*) > 1",
+                (self._chave,),
+            ).fetchall()
+        rel.semelhantes = sum(n for (n,) in grupos)
+        for sha, tamanho in blobs:
+            try:
+                links = os.stat(self.caminho(sha)).st_nlink
+            except OSError:
+                continue
+            rel.blobs += 1
+            rel.bytes_fisicos += tamanho
+            rel.paginas += links - 1
+            rel.bytes_logicos += tamanho * (links - 1)
+            rel.orfaos += links == 1
+        rel.pdfs, rel.paginas_pdf = pdfs
+        return rel
+
+    def _existe(self, sha256: str) -> bool:
+        return (
+            self._conn.execute(
+                "SELECT 1 FROM blobs WHERE raiz = ? AND sha256 = ?", (self._chave, sha256)
+            ).fetchone()
+            is not None
+            and self.caminho(sha256).exists()
+        )
+
+
+_stores: Dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def store_para(raiz: Path) -> BlobStore:
+    """BlobStore (compartilhado no processo) da pasta CPFs `raiz`."""
+    chave = str(Path(raiz).resolve())
+    with _stores_lock:
+        if chave not in _stores:
+            _stores[chave] = BlobStore(Path(raiz))
+        return _stores[chave]
@@ -79,6 +79,13 @@ AVAILABLE_MODELS = {
     ],
 }
 
+# Modo cascata: (modelo rápido, modelo premium) por provedor
+MODELOS_CASCATA = {
+    "gemini": ("gemini-2.0-flash", "gemini-1.5-pro"),
+    "openai": ("gpt-4o-mini", "gpt-4o"),
+    "anthropic": ("claude-3-5-haiku-20241022", "claude-3-5-sonnet-20241022"),
+}
+
 # Configurações padrão
 DEFAULT_SETTINGS: dict[str, Any] = {
     "ai_provider": "gemini",
@@ -92,6 +99,40 @@ DEFAULT_SETTINGS: dict[str, Any] = {
     "output_folder": str(Path.home() / "Documents" / "FarmaPop"),
     "scanner_name": "",
     "license_key": "",
+    # "completo" = um único prompt com todas as imagens; "duas_fases" = extração por etapa + consolidação
+    "audit_mode": "completo",
+    # Cache local de resultados de auditoria (reauditorias do mesmo dossiê)
+    "audit_cache_enabled": True,
+    "audit_cache_max_mb": 50,
+    "audit_cache_max_days": 90,
+    # Imagens enviadas à IA: orçamento por página (KB) e formato (JPEG ou WEBP)
+    "ai_image_budget_kb": 450,
+    "ai_image_format": "JPEG",
+    # Chamadas à IA: timeout por requisição e retentativas em erros transitórios
+    "ai_timeout_s": 120,
+    "ai_max_retries": 3,
+    # Recebe a resposta em streaming (campos aparecem na tela conforme chegam)
+    "ai_streaming": True,
+    # OCR local (offline) da autorização/data no cupom: confere a IA e preenche o modo manual
+    "ocr_local": False,
+    # Failover entre provedores com chave salva (core/roteador.py): se o primário falhar
+    # ou passar de ai_hedge_s sem responder, outro provedor é disparado
+    "ai_failover": False,
+    "ai_hedge_s": 20,
+    # Último modelo escolhido em cada provedor (usado quando ele não é o configurado)
+    "ai_modelos": {},
+    # Limite de requisições/tokens por minuto compartilhado entre os terminais da máquina
+    # (core/limitador.py), por provedor: {provedor: [rpm, tpm]}; ausente ou 0 = padrão
+    # do provedor (LIMITES_PADRAO; Gemini sem limite)
+    "ai_limitador": True,
+    "ai_limites": {},
+    # Cascata: modelo rápido primeiro, premium só para reprovados/baixa confiança
+    # (vazio = MODELOS_CASCATA do provedor; OpenRouter exige informar os dois).
+    # Com a cascata ligada, ai_model é ignorado na auditoria completa.
+    "ai_cascata": False,
+    "ai_modelo_rapido": "",
+    "ai_modelo_premium": "",
+    "ai_cascata_confianca": 0.8,
 }
 
 
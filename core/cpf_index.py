@@ -0,0 +1,373 @@
+"""
+cpf_index.py - Índice SQLite da pasta CPFs (CPF normalizado → páginas em ordem).
+
+Em vez de um glob na pasta a cada busca, cada consulta é um SELECT por CPF. O
+índice guarda tamanho, mtime e SHA256 de cada página e fica em APP_DATA_DIR (não
+na pasta CPFs, que pode estar em um compartilhamento de rede onde o SQLite não
+trava arquivos direito).
+
+Layout em shards: as páginas ficam em CPFs/<2 primeiros dígitos>/<2 seguintes>/
+(ex: CPFs/52/99/529.982.247-25_pag1.jpg), para nenhuma pasta ter centenas de
+milhares de arquivos. O layout antigo (tudo direto em CPFs/) continua sendo lido
+enquanto core.cpf_migracao move os arquivos.
+
+Reconciliação incremental, por pasta: uma pasta só é relida quando o mtime dela
+muda (arquivo criado, apagado ou renomeado por outra máquina ou à mão), ou quando
+uma página indexada some. Uma busca só olha a raiz (layout antigo) e o shard do
+CPF. O SHA256 de arquivos que o app não gravou é calculado sob demanda.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.config import APP_DATA_DIR
+
+
+INDICE_PATH = APP_DATA_DIR / "cpf_index.sqlite"
+
+# Versão do esquema; o índice é só um cache da pasta, então é recriado se mudar
+_VERSAO = 2
+
+# Shards: NIVEIS pastas com DIGITOS dígitos do CPF cada (100 x 100 pastas)
+SHARD_NIVEIS = 2
+SHARD_DIGITOS = 2
+
+# Pasta da raiz no índice (layout antigo, sem shard)
+RAIZ = "."
+
+CPF_DIGITOS = 11
+
+# CPF_pagN.jpg (atual) ou CPF.jpg (padrão antigo, tratado como página 0)
+_NOME_PAGINA = re.compile(r"^(?P<cpf>[\d.\-]+?)(?:_pag(?P<pag>\d+))?\.jpe?g$", re.IGNORECASE)
+_NOME_SHARD = re.compile(r"^\d{%d}$" % SHARD_DIGITOS)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS paginas (
+    raiz TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    pasta TEXT NOT NULL,
+    cpf TEXT NOT NULL,
+    pagina INTEGER NOT NULL,
+    tamanho INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT,
+    PRIMARY KEY (raiz, arquivo)
+);
+CREATE INDEX IF NOT EXISTS idx_paginas_cpf ON paginas (raiz, cpf, pagina);
+CREATE INDEX IF NOT EXISTS idx_paginas_pasta ON paginas (raiz, pasta);
+CREATE TABLE IF NOT EXISTS pastas (
+    raiz TEXT NOT NULL,
+    pasta TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (raiz, pasta)
+);
+"""
+
+
+def normalizar_cpf(cpf: str) -> str:
+    """Só os dígitos do CPF (com ou sem máscara)."""
+    return "".join(c for c in cpf if c.isdigit())
+
+
+def interpretar_nome(nome: str) -> Optional[Tuple[str, int]]:
+    """(CPF normalizado, número da página) de um nome de arquivo da pasta CPFs, ou None."""
+    m = _NOME_PAGINA.match(nome)
+    if not m:
+        return None
+    cpf = normalizar_cpf(m.group("cpf"))
+    if len(cpf) != CPF_DIGITOS:
+        return None
+    return cpf, int(m.group("pag") or 0)
+
+
+def pasta_shard(cpf: str) -> str:
+    """
+    Pasta (relativa à raiz CPFs) onde ficam as páginas do CPF, ex: '52/99'.
+    Levanta ValueError se o CPF não tiver 11 dígitos: com menos, o caminho sairia
+    vazio ("/") e apontaria para a raiz do disco.
+    """
+    nums = normalizar_cpf(cpf)
+    if len(nums) < CPF_DIGITOS:
+        raise ValueError(f"CPF inválido (esperados {CPF_DIGITOS} dígitos): '{cpf}'")
+    return "/".join(nums[i * SHARD_DIGITOS:(i + 1) * SHARD_DIGITOS] for i in range(SHARD_NIVEIS))
+
+
+def sha256_arquivo(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+@dataclass(frozen=True)
+class PaginaCPF:
+    arquivo: str  # relativo à raiz
+    pasta: str
+    pagina: int
+    tamanho: int
+    mtime: float
+    sha256: Optional[str]
+
+
+class IndiceCPF:
+    """Índice das páginas de uma pasta CPFs (uma `raiz`)."""
+
+    def __init__(self, raiz: Path, caminho: Path = INDICE_PATH) -> None:
+        self.raiz = Path(raiz)
+        self._chave = str(self.raiz.resolve())
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(caminho), check_same_thread=False, timeout=30)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != _VERSAO:
+            self._conn.executescript("DROP TABLE IF EXISTS paginas; DROP TABLE IF EXISTS pastas;")
+            self._conn.execute(f"PRAGMA user_version = {_VERSAO}")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        # Também serializa gravações e a migração de um mesmo CPF dentro do processo
+        self.lock = threading.RLock()
+
+    # ── Consultas ─────────────────────────────────────────────────────────────
+
+    def paginas(self, cpf: str) -> List[PaginaCPF]:
+        """
+        Páginas do CPF em ordem numérica (pag2 antes de pag10), das duas formas de
+        layout; se a mesma página existir nas duas, vale a do shard.
+        """
+        cpf = normalizar_cpf(cpf)
+        if not cpf:
+            return []
+        # Nome curto demais para ser CPF só pode estar na raiz (layout antigo)
+        pastas = (RAIZ, pasta_shard(cpf)) if len(cpf) >= CPF_DIGITOS else (RAIZ,)
+        with self.lock:
+            for pasta in pastas:
+                self.reconciliar_se_mudou(pasta)
+            paginas = self._consultar(cpf)
+            # Alguém apagou uma página sem mexer no mtime da pasta (ex: cópia de rede atrasada)
+            if any(not (self.raiz / p.arquivo).exists() for p in paginas):
+                for pasta in pastas:
+                    self.reconciliar_pasta(pasta)
+                paginas = self._consultar(cpf)
+
+        por_numero: Dict[int, PaginaCPF] = {}
+        for p in paginas:
+            if p.pagina not in por_numero or p.pasta != RAIZ:
+                por_numero[p.pagina] = p
+        return [por_numero[n] for n in sorted(por_numero)]
+
+    def caminhos(self, cpf: str) -> List[Path]:
+        return [self.raiz / p.arquivo for p in self.paginas(cpf)]
+
+    def todas(self, cpf: str) -> List[PaginaCPF]:
+        """Todas as páginas indexadas do CPF, inclusive cópias antigas nos dois layouts."""
+        with self.lock:
+            self.paginas(cpf)
+            return self._consultar(normalizar_cpf(cpf))
+
+    def todos_caminhos(self, cpf: str) -> List[Path]:
+        return [self.raiz / p.arquivo for p in self.todas(cpf)]
+
+    def todas_paginas(self) -> List[PaginaCPF]:
+        """Todas as páginas da pasta (reconcilia antes)."""
+        with self.lock:
+            self.reconciliar()
+            rows = self._conn.execute(
+                "SELECT arquivo, pasta, pagina, tamanho, mtime, sha256 FROM paginas WHERE raiz = ? ORDER BY arquivo",
+                (self._chave,),
+            ).fetchall()
+        return [PaginaCPF(*r) for r in rows]
+
+    def sha256(self, cpf: str) -> List[str]:
+        """SHA256 de cada página do CPF (calculado e guardado na primeira vez)."""
+        resultado = []
+        with self.lock:
+            for p in self.paginas(cpf):
+                h = p.sha256
+                if h is None:
+                    h = sha256_arquivo(self.raiz / p.arquivo)
+                    self._conn.execute(
+                        "UPDATE paginas SET sha256 = ? WHERE raiz = ? AND arquivo = ?",
+                        (h, self._chave, p.arquivo),
+                    )
+                    self._conn.commit()
+                resultado.append(h)
+        return resultado
+
+    def _consultar(self, cpf: str) -> List[PaginaCPF]:
+        rows = self._conn.execute(
+            "SELECT arquivo, pasta, pagina, tamanho, mtime, sha256 FROM paginas "
+            "WHERE raiz = ? AND cpf = ? ORDER BY pagina, arquivo",
+            (self._chave, cpf),
+        ).fetchall()
+        return [PaginaCPF(*r) for r in rows]
+
+    # ── Atualização pelo próprio app ──────────────────────────────────────────
+
+    def registrar(self, path: Path, sha256: Optional[str] = None) -> None:
+        """Anota uma página recém-gravada pelo app (sem reler a pasta)."""
+        info = interpretar_nome(path.name)
+        if info is None:
+            return
+        st = path.stat()
+        arquivo = self._relativo(path)
+        with self.lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO paginas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._chave, arquivo, _pasta_de(arquivo), info[0], info[1], st.st_size, st.st_mtime, sha256),
+            )
+            self._conn.commit()
+
+    def remover(self, path: Path) -> None:
+        with self.lock:
+            self._conn.execute(
+                "DELETE FROM paginas WHERE raiz = ? AND arquivo = ?", (self._chave, self._relativo(path))
+            )
+            self._conn.commit()
+
+    def mover(self, origem: Path, destino: Path) -> None:
+        """Atualiza o índice após mover uma página (mantém o SHA256 já calculado)."""
+        with self.lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM paginas WHERE raiz = ? AND arquivo = ?", (self._chave, self._relativo(origem))
+            ).fetchone()
+            self.remover(origem)
+            self.registrar(destino, sha256=row[0] if row else None)
+
+    def mtime_pasta(self, pasta: Path) -> Optional[float]:
+        try:
+            return pasta.stat().st_mtime
+        except OSError:
+            return None
+
+    def marcar_pasta_atual(self, pasta: Path, mtime_anterior: Optional[float]) -> None:
+        """
+        Depois de gravar/apagar arquivos, aceita o novo mtime da pasta sem reler, desde
+        que o índice estivesse em dia antes (`mtime_anterior` = mtime de antes das gravações).
+        """
+        with self.lock:
+            rel = self._relativo(pasta)
+            if mtime_anterior is None or self._mtime_indexado(rel) != mtime_anterior:
+                return
+            mtime = self.mtime_pasta(pasta)
+            if mtime is not None:
+                self._gravar_mtime(rel, mtime)
+                self._conn.commit()
+
+    # ── Reconciliação com a pasta ─────────────────────────────────────────────
+
+    def reconciliar_se_mudou(self, pasta: str = RAIZ) -> bool:
+        """Relê a pasta só se o mtime dela mudou desde a última reconciliação."""
+        with self.lock:
+            mtime = self.mtime_pasta(self.raiz / pasta)
+            if self._mtime_indexado(pasta) == mtime:
+                return False
+            self.reconciliar_pasta(pasta)
+            return True
+
+    def reconciliar_pasta(self, pasta: str = RAIZ) -> Tuple[int, int]:
+        """
+        Compara uma pasta (sem subpastas) com o índice e aplica só as diferenças.
+        Retorna (páginas novas/alteradas, páginas removidas).
+        """
+        with self.lock:
+            diretorio = self.raiz / pasta
+            mtime_pasta = self.mtime_pasta(diretorio)
+            indexadas: Dict[str, Tuple[int, float]] = {
+                arquivo: (tamanho, mtime)
+                for arquivo, tamanho, mtime in self._conn.execute(
+                    "SELECT arquivo, tamanho, mtime FROM paginas WHERE raiz = ? AND pasta = ?",
+                    (self._chave, pasta),
+                )
+            }
+            alteradas, vistas = [], set()
+            try:
+                entradas = list(os.scandir(diretorio))
+            except OSError:
+                entradas = []
+            for entrada in entradas:
+                info = interpretar_nome(entrada.name)
+                if info is None or not entrada.is_file():
+                    continue
+                arquivo = entrada.name if pasta == RAIZ else f"{pasta}/{entrada.name}"
+                vistas.add(arquivo)
+                st = entrada.stat()
+                if indexadas.get(arquivo) != (st.st_size, st.st_mtime):
+                    alteradas.append(
+                        (self._chave, arquivo, pasta, info[0], info[1], st.st_size, st.st_mtime, None)
+                    )
+            removidas = [(self._chave, a) for a in indexadas if a not in vistas]
+
+            self._conn.executemany("INSERT OR REPLACE INTO paginas VALUES (?, ?, ?, ?, ?, ?, ?, ?)", alteradas)
+            self._conn.executemany("DELETE FROM paginas WHERE raiz = ? AND arquivo = ?", removidas)
+            if mtime_pasta is None:
+                self._conn.execute("DELETE FROM pastas WHERE raiz = ? AND pasta = ?", (self._chave, pasta))
+            else:
+                self._gravar_mtime(pasta, mtime_pasta)
+            self._conn.commit()
+        return len(alteradas), len(removidas)
+
+    def reconciliar(self) -> Tuple[int, int]:
+        """Reconcilia a raiz e todos os shards (só as pastas cujo mtime mudou)."""
+        novas = removidas = 0
+        for pasta in [RAIZ, *self.pastas_shard()]:
+            with self.lock:
+                if self._mtime_indexado(pasta) == self.mtime_pasta(self.raiz / pasta):
+                    continue
+                n, r = self.reconciliar_pasta(pasta)
+            novas, removidas = novas + n, removidas + r
+        return novas, removidas
+
+    def pastas_shard(self) -> Iterator[str]:
+        """Pastas de shard existentes no disco (ex: '52/99')."""
+
+        def descer(base: Path, rel: str, nivel: int) -> Iterator[str]:
+            if nivel == SHARD_NIVEIS:
+                yield rel
+                return
+            try:
+                nomes = sorted(e.name for e in os.scandir(base) if e.is_dir() and _NOME_SHARD.match(e.name))
+            except OSError:
+                return
+            for nome in nomes:
+                yield from descer(base / nome, f"{rel}/{nome}" if rel else nome, nivel + 1)
+
+        return descer(self.raiz, "", 0)
+
+    # ── Internos ──────────────────────────────────────────────────────────────
+
+    def _relativo(self, path: Path) -> str:
+        return Path(os.path.relpath(path, self.raiz)).as_posix()
+
+    def _mtime_indexado(self, pasta: str) -> Optional[float]:
+        row = self._conn.execute(
+            "SELECT mtime FROM pastas WHERE raiz = ? AND pasta = ?", (self._chave, pasta)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _gravar_mtime(self, pasta: str, mtime: float) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO pastas VALUES (?, ?, ?)", (self._chave, pasta, mtime))
+
+
+def _pasta_de(arquivo: str) -> str:
+    pasta = arquivo.rpartition("/")[0]
+    return pasta or RAIZ
+
+
+_indices: Dict[str, IndiceCPF] = {}
+_indices_lock = threading.Lock()
+
+
+def indice_para(raiz: Path) -> IndiceCPF:
+    """Índice (compartilhado no processo) da pasta CPFs `raiz`."""
+    chave = str(Path(raiz).resolve())
+    with _indices_lock:
+        if chave not in _indices:
+            _indices[chave] = IndiceCPF(Path(raiz))
+        return _indices[chave]
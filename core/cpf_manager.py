@@ -1,16 +1,26 @@
 """
 cpf_manager.py - Gerenciador de documentos salvos por CPF (Suporte a múltiplas páginas).
+
+As buscas passam pelo índice SQLite de core.cpf_index (sem glob na pasta a cada consulta).
+Páginas novas vão para o layout em shards; o layout antigo (plano) continua sendo
+lido até core.cpf_migracao terminar de movê-lo. Cada página é um hardlink para um
+blob de core.blob_store (o mesmo documento salvo de novo não ocupa espaço).
 """
 
 from __future__ import annotations
 
+import hashlib
+import io
 import os
-import glob
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, List, Optional
 
 from PIL import Image
 
+from core.blob_store import RelatorioDedup, store_para
+from core.cpf_index import indice_para, pasta_shard
+from core.jpeg_passthrough import jpeg_bytes
+
 
 def validate_cpf(cpf: str) -> bool:
     """
@@ -64,30 +74,12 @@ def get_cpfs_dir(settings: dict) -> Path:
 
 def find_all_documents_by_cpf(cpf: str, settings: dict) -> List[Path]:
     """
-    Procura todos os documentos salvos com o CPF especificado (padrão _pagX).
-    Retorna uma lista de Paths ordenada por página.
+    Procura todos os documentos salvos com o CPF especificado (padrão _pagX, com ou sem máscara).
+    Retorna uma lista de Paths ordenada numericamente por página (_pag2 antes de _pag10).
     """
     if not cpf:
         return []
-        
-    cpfs_dir = get_cpfs_dir(settings)
-    # Busca por padrões de página: CPF_pag1.jpg, CPF_pag2.jpg...
-    pattern = str(cpfs_dir / f"{cpf}_pag*.jpg")
-    files = glob.glob(pattern)
-    
-    # Adiciona busca pelo padrão antigo (sem _pag) para retrocompatibilidade
-    legacy_file = cpfs_dir / f"{cpf}.jpg"
-    if legacy_file.exists():
-        files.append(str(legacy_file))
-        
-    if not files:
-        return []
-        
-    # Ordena os arquivos. 
-    # Para _pag1, _pag2 etc, a ordenação alfabética simples pode falhar se passar de 9 páginas,
-    # mas para este caso deve ser suficiente ou podemos melhorar a ordenação.
-    files.sort()
-    return [Path(f) for f in files]
+    return indice_para(get_cpfs_dir(settings)).caminhos(cpf)
 
 
 def find_document_by_cpf(cpf: str, settings: dict) -> Optional[Path]:
@@ -102,32 +94,94 @@ def find_document_by_cpf(cpf: str, settings: dict) -> Optional[Path]:
 
 def save_cpf_documents(cpf: str, images: List[Image.Image], settings: dict) -> List[Path]:
     """
-    Salva uma lista de imagens (Documento de Identidade) na pasta de CPFs.
-    Limpa versões antigas antes de salvar.
+    Salva uma lista de imagens (Documento de Identidade) na pasta de CPFs, já no
+    layout em shards (CPFs/52/99/...). Limpa versões antigas (dos dois layouts) antes de salvar.
+    Levanta ValueError (sem apagar nada) se o CPF não tiver 11 dígitos.
     """
     cpfs_dir = get_cpfs_dir(settings)
-    
-    # 1. Limpa arquivos antigos para evitar sobras (ex: se antes tinha 3 págs e agora tem 2)
-    old_files = find_all_documents_by_cpf(cpf, settings)
-    for f in old_files:
-        try:
-            f.unlink()
-        except Exception:
-            pass
-            
-    # 2. Salva as novas páginas
-    saved_paths = []
-    for i, img in enumerate(images, 1):
-        file_path = cpfs_dir / f"{cpf}_pag{i}.jpg"
-        img.save(str(file_path), format="JPEG", quality=90)
-        saved_paths.append(file_path)
-        
+    indice = indice_para(cpfs_dir)
+    blobs = store_para(cpfs_dir)
+    shard_dir = cpfs_dir / pasta_shard(cpf)
+
+    # O lock do índice impede a migração de mover uma página antiga deste CPF no meio da gravação
+    with indice.lock:
+        # 1. Limpa arquivos antigos para evitar sobras (ex: se antes tinha 3 págs e agora tem 2)
+        antigas = indice.todas(cpf)
+        old_files = [cpfs_dir / p.arquivo for p in antigas]
+        mtimes = {d: indice.mtime_pasta(d) for d in (cpfs_dir, shard_dir)}
+        for f in old_files:
+            try:
+                f.unlink()
+            except Exception:
+                pass
+            indice.remover(f)
+
+        # 2. Salva as novas páginas
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        saved_paths = []
+        for i, img in enumerate(images, 1):
+            file_path = shard_dir / f"{cpf}_pag{i}.jpg"
+            # Sem recodificar quando a página ainda é o JPEG original
+            data = jpeg_bytes(img, quality=90)
+            if blobs.ativo:
+                sha = blobs.guardar(img, data)
+                blobs.vincular(sha, file_path)
+            else:
+                sha = hashlib.sha256(data).hexdigest()
+                file_path.write_bytes(data)
+            indice.registrar(file_path, sha256=sha)
+            saved_paths.append(file_path)
+
+        # Blobs das páginas antigas que ficaram sem uso (as reaproveitadas continuam)
+        if blobs.ativo:
+            blobs.coletar(p.sha256 for p in antigas if p.sha256)
+
+        # As mudanças nas pastas já estão no índice: não precisa reler na próxima busca
+        for d, mtime in mtimes.items():
+            indice.marcar_pasta_atual(d, mtime)
     return saved_paths
 
 
 def save_cpf_document(cpf: str, image: Image.Image, settings: dict) -> Path:
     """
     Legacy helper para salvar apenas uma imagem.
+    Quem chama não passa pela validação da ScanScreen: o CPF é conferido aqui
+    (ValueError se inválido) antes de virar caminho em pasta_shard.
     """
+    if not validate_cpf(cpf):
+        raise ValueError(f"CPF inválido: '{cpf}'")
     paths = save_cpf_documents(cpf, [image], settings)
     return paths[0]
+
+
+def deduplicar_cpfs(
+    settings: dict, on_progresso: Optional[Callable[[int, int], None]] = None
+) -> RelatorioDedup:
+    """
+    Converte as páginas já existentes na pasta CPFs em hardlinks para blobs
+    (arquivos idênticos passam a ocupar espaço uma vez só) e devolve o relatório.
+    """
+    cpfs_dir = get_cpfs_dir(settings)
+    indice = indice_para(cpfs_dir)
+    blobs = store_para(cpfs_dir)
+    if not blobs.ativo:
+        return blobs.relatorio()
+
+    paginas = indice.todas_paginas()
+    for i, pagina in enumerate(paginas, 1):
+        path = cpfs_dir / pagina.arquivo
+        with indice.lock:
+            try:
+                if os.stat(path).st_nlink > 1:
+                    continue  # já é um blob
+                data = path.read_bytes()
+                with Image.open(io.BytesIO(data)) as img:
+                    sha = blobs.guardar(img, data)
+                blobs.vincular(sha, path)
+                indice.registrar(path, sha256=sha)
+            except (OSError, ValueError) as e:
+                print(f"[CPFs] Falha ao deduplicar {pagina.arquivo}: {e}")
+            finally:
+                if on_progresso is not None:
+                    on_progresso(i, len(paginas))
+    return blobs.relatorio()
@@ -0,0 +1,103 @@
+"""
+cpf_migracao.py - Move a pasta CPFs do layout antigo (plano) para o layout em shards.
+
+Roda em background, um arquivo por vez, sem parar o app: cada página é movida com
+os.replace (mesmo volume, operação atômica) e o índice é atualizado na hora. Enquanto
+isso as buscas leem os dois layouts (core.cpf_index.IndiceCPF.paginas), então um
+CPF nunca "some" no meio da migração.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from core.cpf_index import CPF_DIGITOS, IndiceCPF, indice_para, interpretar_nome, pasta_shard
+
+# Pausa entre arquivos, para não competir com o uso normal (rede/antivírus)
+PAUSA_S = 0.01
+
+_em_andamento: set[str] = set()
+_em_andamento_lock = threading.Lock()
+
+
+def migrar_layout(
+    indice: IndiceCPF,
+    cancel: Optional[threading.Event] = None,
+    on_progresso: Optional[Callable[[int, int], None]] = None,
+    pausa_s: float = PAUSA_S,
+) -> int:
+    """
+    Move as páginas da raiz para os shards. Retorna quantas foram movidas.
+    Pode ser interrompida (`cancel`) e retomada depois: o que já foi movido fica movido.
+    """
+    try:
+        # Arquivos com menos de 11 dígitos no nome não são de um CPF: ficam na raiz
+        nomes = [
+            e.name for e in os.scandir(indice.raiz)
+            if e.is_file() and len((interpretar_nome(e.name) or ("",))[0]) >= CPF_DIGITOS
+        ]
+    except OSError:
+        return 0
+
+    movidas = 0
+    for i, nome in enumerate(nomes, 1):
+        if cancel is not None and cancel.is_set():
+            break
+        origem = indice.raiz / nome
+        info = interpretar_nome(nome)
+        assert info is not None
+        destino_dir = indice.raiz / pasta_shard(info[0])
+
+        # Mesmo lock da gravação (save_cpf_documents): o CPF não muda durante o move
+        with indice.lock:
+            if not origem.exists():
+                continue  # apagado/regravado enquanto isso
+            destino_dir.mkdir(parents=True, exist_ok=True)
+            destino = destino_dir / nome
+            try:
+                if destino.exists():
+                    # Já existe uma versão no shard (mais nova): a da raiz é sobra
+                    origem.unlink()
+                    indice.remover(origem)
+                else:
+                    os.replace(origem, destino)
+                    indice.mover(origem, destino)
+                movidas += 1
+            except OSError as e:
+                print(f"[CPFs] Falha ao migrar {nome}: {e}")
+
+        if on_progresso is not None:
+            on_progresso(i, len(nomes))
+        if pausa_s:
+            time.sleep(pausa_s)
+
+    indice.reconciliar_pasta()
+    return movidas
+
+
+def iniciar_migracao(cpfs_dir: Path, cancel: Optional[threading.Event] = None) -> Optional[threading.Thread]:
+    """Dispara migrar_layout em uma thread daemon (uma por pasta CPFs). None se já está rodando."""
+    chave = str(Path(cpfs_dir).resolve())
+    with _em_andamento_lock:
+        if chave in _em_andamento:
+            return None
+        _em_andamento.add(chave)
+
+    def run() -> None:
+        try:
+            movidas = migrar_layout(indice_para(Path(cpfs_dir)), cancel=cancel)
+            if movidas:
+                print(f"[CPFs] {movidas} página(s) migradas para o layout em shards.")
+        except Exception as e:
+            print(f"[CPFs] Migração interrompida: {e}")
+        finally:
+            with _em_andamento_lock:
+                _em_andamento.discard(chave)
+
+    thread = threading.Thread(target=run, daemon=True, name="migracao-cpfs")
+    thread.start()
+    return thread
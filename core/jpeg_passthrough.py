@@ -0,0 +1,91 @@
+"""
+jpeg_passthrough.py - Guarda os bytes JPEG originais de cada página (scanner WIA, arquivo .jpg).
+
+Enquanto a imagem PIL não for alterada, o PDF final e a pasta CPFs gravam esses
+bytes diretamente (DCT pass-through), sem decodificar/recodificar e sem perda de
+geração. Rotação, recorte ou redimensionamento criam um novo objeto Image, que não
+tem bytes originais e volta a ser recodificado normalmente.
+"""
+
+from __future__ import annotations
+
+import io
+import threading
+import weakref
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+# id(imagem) -> (referência fraca, bytes JPEG, tamanho no momento do registro).
+# Image define __eq__ e não é hashable, por isso não dá para usar WeakKeyDictionary.
+_originais: Dict[int, Tuple["weakref.ref[Image.Image]", bytes, Tuple[int, int]]] = {}
+_lock = threading.Lock()
+
+
+def anexar_jpeg(img: Image.Image, data: bytes) -> None:
+    """Associa à imagem os bytes JPEG de onde ela foi decodificada."""
+    chave = id(img)
+
+    def _remover(ref: "weakref.ref[Image.Image]") -> None:
+        with _lock:
+            item = _originais.get(chave)
+            if item is not None and item[0] is ref:
+                del _originais[chave]
+
+    with _lock:
+        _originais[chave] = (weakref.ref(img, _remover), data, img.size)
+
+
+def jpeg_original(img: Image.Image) -> Optional[bytes]:
+    """Bytes JPEG originais da imagem, ou None se ela não veio de um JPEG (ou mudou)."""
+    with _lock:
+        item = _originais.get(id(img))
+    if item is None or item[0]() is not img or item[2] != img.size:
+        return None
+    return item[1]
+
+
+def preservar(origem: Image.Image, nova: Image.Image) -> Image.Image:
+    """Repassa os bytes originais para `nova` (cópia/conversão sem alterar os pixels)."""
+    data = jpeg_original(origem)
+    if data is not None and nova.size == origem.size:
+        anexar_jpeg(nova, data)
+    return nova
+
+
+def abrir_imagem(data: bytes) -> Image.Image:
+    """
+    Decodifica uma imagem (RGB) guardando os bytes originais quando for um JPEG
+    em tons de cinza ou RGB. JPEGs CMYK sempre são recodificados.
+    """
+    src = Image.open(io.BytesIO(data))
+    formato, modo = src.format, src.mode
+    img = src.convert("RGB")
+    if formato == "JPEG" and modo in ("L", "RGB"):
+        anexar_jpeg(img, data)
+    return img
+
+
+def abrir_arquivo(path: str | Path) -> Image.Image:
+    """Como abrir_imagem, lendo de um arquivo."""
+    return abrir_imagem(Path(path).read_bytes())
+
+
+def jpeg_bytes(img: Image.Image, quality: int = 85) -> bytes:
+    """Bytes JPEG da imagem: os originais, se houver; senão, uma nova codificação."""
+    data = jpeg_original(img)
+    if data is not None:
+        return data
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def salvar_jpeg(img: Image.Image, destino: str | Path, quality: int = 90) -> None:
+    """Grava a imagem como .jpg sem recodificar quando os bytes originais existem."""
+    data = jpeg_original(img)
+    if data is not None:
+        Path(destino).write_bytes(data)
+    else:
+        img.save(str(destino), format="JPEG", quality=quality)
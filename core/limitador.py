@@ -0,0 +1,355 @@
+"""
+limitador.py - Limite de requisições e tokens por minuto para os provedores de IA.
+
+Um balde de tokens por (provedor, modelo, chave de API), com o estado em
+APP_DATA_DIR/limites/<hash>.json protegido por trava de arquivo (fcntl/msvcrt):
+vários terminais da mesma máquina e a auditoria em lote dividem a mesma cota em
+vez de cada um descobrir o limite levando 429.
+
+    - Requisições: balde de `rpm` fichas, reabastecido continuamente.
+    - Tokens: balde de `tpm`, debitado pela estimativa (imagens + texto) e corrigido
+      pelo uso real informado na resposta.
+    - Concorrência adaptativa (AIMD): o número de chamadas simultâneas sobe devagar a
+      cada sucesso e cai pela metade a cada 429; Retry-After e os cabeçalhos de
+      limite restante (x-ratelimit-*, anthropic-ratelimit-*) pausam/esvaziam o balde
+      — os das respostas de sucesso também, antes de o 429 chegar.
+
+A chave de API nunca é gravada: o nome do arquivo é um hash.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import APP_DATA_DIR
+
+LIMITES_DIR = APP_DATA_DIR / "limites"
+
+# (requisições/min, tokens de entrada/min) por provedor; 0 = sem limite.
+# Valores dos planos pagos iniciais — quem tem cota maior ajusta ai_limites. O
+# Gemini fica sem limite padrão: o plano gratuito (15 RPM) travaria quem paga, e a
+# cota paga varia demais entre modelos; quem precisa configura ai_limites.
+LIMITES_PADRAO: Dict[str, Tuple[int, int]] = {
+    "gemini": (0, 0),
+    "openai": (500, 30_000),
+    "anthropic": (50, 40_000),
+    "openrouter": (20, 0),
+}
+
+CONCORRENCIA_INICIAL = 4.0
+CONCORRENCIA_MAXIMA = 16.0
+# Reserva de uma chamada que nunca foi liberada (processo morto) expira após (s)
+DURACAO_MAX_RESERVA_S = 300.0
+# Pausa após 429 quando o provedor não diz quanto esperar (s)
+PAUSA_PADRAO_S = 5.0
+# Intervalo máximo entre reavaliações enquanto espera (s)
+_PASSO_ESPERA_S = 1.0
+
+
+# ─── Estimativa de tokens ────────────────────────────────────────────────────
+
+def tokens_imagem(provider: str, largura: int, altura: int) -> int:
+    """Tokens de entrada de uma imagem segundo a regra publicada de cada provedor."""
+    if provider == "anthropic":
+        return math.ceil(largura * altura / 750)
+    if provider == "gemini":
+        return 258 * max(1, math.ceil(largura / 768)) * max(1, math.ceil(altura / 768))
+    # OpenAI (detail=high) e, por aproximação, OpenRouter: 85 + 170 por bloco de 512 px
+    return 85 + 170 * math.ceil(largura / 512) * math.ceil(altura / 512)
+
+
+def estimar_tokens(provider: str, tamanhos: List[Tuple[int, int]], *textos: str) -> int:
+    """Tokens de entrada de uma chamada (~4 caracteres por token de texto)."""
+    texto = sum(len(t) for t in textos) // 4
+    return texto + sum(tokens_imagem(provider, w, h) for w, h in tamanhos)
+
+
+# ─── Trava entre processos ───────────────────────────────────────────────────
+
+class _TravaArquivo:
+    """Trava exclusiva em um arquivo (vale entre processos e entre threads)."""
+
+    def __init__(self, caminho: Path) -> None:
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._f: Any = None
+
+    def __enter__(self) -> "_TravaArquivo":
+        self._lock.acquire()
+        try:
+            self._f = open(self.caminho, "a+b")
+            if os.name == "nt":
+                import msvcrt
+
+                self._f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # LK_LOCK desiste após ~10s; tenta de novo
+            else:
+                import fcntl
+
+                fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            if self._f is not None:
+                self._f.close()
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        try:
+            if os.name == "nt":
+                import msvcrt
+
+                self._f.seek(0)
+                msvcrt.locking(self._f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._f.close()
+            self._lock.release()
+
+
+# ─── Cabeçalhos de limite ────────────────────────────────────────────────────
+
+def _duracao(texto: str) -> Optional[float]:
+    """Converte "20", "1.5s", "6m0s", "250ms" em segundos."""
+    texto = texto.strip()
+    try:
+        return float(texto)
+    except ValueError:
+        pass
+    partes = re.findall(r"([\d.]+)(ms|h|m|s)", texto)
+    if not partes:
+        return None
+    fator = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(n) * fator[u] for n, u in partes)
+
+
+def _cabecalhos(erro: BaseException) -> Dict[str, str]:
+    atual: Optional[BaseException] = erro
+    while atual is not None:
+        headers = getattr(getattr(atual, "response", None), "headers", None)
+        if headers:
+            return {k.lower(): v for k, v in dict(headers).items()}
+        atual = atual.__cause__
+    return {}
+
+
+def _limitado(erro: BaseException) -> bool:
+    atual: Optional[BaseException] = erro
+    while atual is not None:
+        code = getattr(atual, "status_code", None) or getattr(atual, "code", None)
+        if code == 429 or type(atual).__name__ in ("RateLimitError", "ResourceExhausted"):
+            return True
+        atual = atual.__cause__
+    return False
+
+
+def _ler_limites(headers: Dict[str, str]) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """(pausa em s, requisições restantes, tokens restantes) informados pelo provedor."""
+    pausas = [_duracao(headers[h]) for h in (
+        "retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens",
+    ) if h in headers]
+    pausa = max((p for p in pausas if p is not None), default=None)
+
+    def numero(*nomes: str) -> Optional[float]:
+        for nome in nomes:
+            try:
+                return float(headers[nome])
+            except (KeyError, ValueError):
+                continue
+        return None
+
+    restantes_req = numero("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining")
+    restantes_tok = numero(
+        "x-ratelimit-remaining-tokens", "anthropic-ratelimit-input-tokens-remaining",
+        "anthropic-ratelimit-tokens-remaining",
+    )
+    return pausa, restantes_req, restantes_tok
+
+
+def _esgotado_por(headers: Dict[str, str]) -> Optional[float]:
+    """Segundos até a cota renovar, quando uma resposta de sucesso diz que ela acabou."""
+    _, restantes_req, restantes_tok = _ler_limites(headers)
+    resets = []
+    if restantes_req is not None and restantes_req < 1:
+        resets.append(headers.get("x-ratelimit-reset-requests"))
+    if restantes_tok is not None and restantes_tok <= 0:
+        resets.append(headers.get("x-ratelimit-reset-tokens"))
+    pausas = [_duracao(r) for r in resets if r]
+    return max((p for p in pausas if p is not None), default=None)
+
+
+# ─── Limitador ───────────────────────────────────────────────────────────────
+
+@dataclass
+class Reserva:
+    id: str
+    tokens: int
+
+
+class Limitador:
+    """Balde de requisições/tokens e concorrência de um (provedor, modelo, chave)."""
+
+    def __init__(self, caminho: Path, rpm: int, tpm: int) -> None:
+        self.caminho = caminho
+        self.rpm = rpm
+        self.tpm = tpm
+        self._trava = _TravaArquivo(caminho.with_suffix(".lock"))
+
+    def _ler(self) -> Dict[str, Any]:
+        try:
+            estado = json.loads(self.caminho.read_text(encoding="utf-8"))
+            if isinstance(estado, dict):
+                return estado
+        except (OSError, ValueError):
+            pass
+        return {
+            "req": float(self.rpm), "tok": float(self.tpm), "t": time.time(),
+            "limite": CONCORRENCIA_INICIAL, "pausa_ate": 0.0, "reservas": {},
+        }
+
+    def _gravar(self, estado: Dict[str, Any]) -> None:
+        self.caminho.write_text(json.dumps(estado), encoding="utf-8")
+
+    def _reabastecer(self, estado: Dict[str, Any], agora: float) -> None:
+        decorrido = max(0.0, agora - estado["t"])
+        estado["req"] = min(float(self.rpm), estado["req"] + decorrido * self.rpm / 60)
+        estado["tok"] = min(float(self.tpm), estado["tok"] + decorrido * self.tpm / 60)
+        estado["t"] = agora
+        estado["reservas"] = {k: v for k, v in estado["reservas"].items() if v > agora}
+
+    def adquirir(self, tokens: int, cancel: Any = None) -> Reserva:
+        """
+        Espera ficha de requisição, tokens e vaga de concorrência; devolve a reserva
+        a ser passada para liberar(). `cancel` (CancelToken) interrompe a espera.
+        """
+        necessario = min(tokens, self.tpm) if self.tpm else 0
+        while True:
+            with self._trava:
+                estado = self._ler()
+                agora = time.time()
+                self._reabastecer(estado, agora)
+                if estado["pausa_ate"] > agora:
+                    espera = estado["pausa_ate"] - agora
+                elif len(estado["reservas"]) >= int(estado["limite"]):
+                    espera = 0.25
+                elif self.rpm and estado["req"] < 1:
+                    espera = (1 - estado["req"]) * 60 / self.rpm
+                elif self.tpm and estado["tok"] < necessario:
+                    espera = (necessario - estado["tok"]) * 60 / self.tpm
+                else:
+                    reserva = Reserva(uuid.uuid4().hex, necessario)
+                    estado["req"] -= 1 if self.rpm else 0
+                    estado["tok"] -= necessario
+                    estado["reservas"][reserva.id] = agora + DURACAO_MAX_RESERVA_S
+                    self._gravar(estado)
+                    return reserva
+                self._gravar(estado)
+            espera = min(espera, _PASSO_ESPERA_S)
+            if cancel is not None:
+                cancel.esperar(espera)
+            else:
+                time.sleep(espera)
+
+    def liberar(
+        self,
+        reserva: Reserva,
+        erro: Optional[BaseException] = None,
+        tokens_reais: int = 0,
+        cabecalhos: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """
+        Devolve a vaga e ajusta a concorrência/balde conforme o desfecho da chamada.
+        `cabecalhos` (da resposta de sucesso, em minúsculas) trazem a cota restante.
+        """
+        with self._trava:
+            estado = self._ler()
+            agora = time.time()
+            self._reabastecer(estado, agora)
+            estado["reservas"].pop(reserva.id, None)
+            if erro is None:
+                estado["limite"] = min(CONCORRENCIA_MAXIMA, estado["limite"] + 1 / estado["limite"])
+                if tokens_reais and self.tpm:
+                    estado["tok"] -= tokens_reais - reserva.tokens
+                if cabecalhos:
+                    self._aplicar_restantes(estado, cabecalhos)
+                    pausa = _esgotado_por(cabecalhos)
+                    if pausa:
+                        estado["pausa_ate"] = max(estado["pausa_ate"], agora + pausa)
+            elif _limitado(erro):
+                estado["limite"] = max(1.0, estado["limite"] / 2)
+                headers = _cabecalhos(erro)
+                pausa = _ler_limites(headers)[0]
+                estado["pausa_ate"] = max(estado["pausa_ate"], agora + (pausa or PAUSA_PADRAO_S))
+                self._aplicar_restantes(estado, headers)
+                print(
+                    f"[Limitador] 429: concorrência {estado['limite']:.1f}, "
+                    f"pausa {estado['pausa_ate'] - agora:.1f}s"
+                )
+            self._gravar(estado)
+
+    @staticmethod
+    def _aplicar_restantes(estado: Dict[str, Any], headers: Dict[str, str]) -> None:
+        """O provedor sabe a cota que sobrou (inclusive a gasta por outras máquinas)."""
+        _, restantes_req, restantes_tok = _ler_limites(headers)
+        if restantes_req is not None:
+            estado["req"] = min(estado["req"], restantes_req)
+        if restantes_tok is not None:
+            estado["tok"] = min(estado["tok"], restantes_tok)
+
+
+_limitadores: Dict[Tuple[str, str, str, int, int], Limitador] = {}
+_ajustes: Dict[str, Any] = {"ativo": True, "limites": {}}
+_lock = threading.Lock()
+
+
+def configurar(settings: dict[str, Any]) -> None:
+    """
+    Aplica ai_limitador e ai_limites ({provedor: [rpm, tpm]}, 0 = padrão do
+    provedor). A cota é por provedor: o failover usa planos diferentes.
+    """
+    _ajustes["ativo"] = bool(settings.get("ai_limitador", True))
+    limites: Dict[str, Tuple[int, int]] = {}
+    for provider, valores in (settings.get("ai_limites") or {}).items():
+        try:
+            rpm, tpm = valores
+            limites[provider] = (int(rpm or 0), int(tpm or 0))
+        except (TypeError, ValueError):
+            continue
+    _ajustes["limites"] = limites
+
+
+def limitador_para(provider: str, model: str, api_key: str) -> Optional[Limitador]:
+    """Limitador compartilhado da combinação; None se desligado ou provedor sem limites."""
+    if not _ajustes["ativo"]:
+        return None
+    rpm_padrao, tpm_padrao = LIMITES_PADRAO.get(provider, (0, 0))
+    rpm, tpm = _ajustes["limites"].get(provider, (0, 0))
+    rpm = rpm or rpm_padrao
+    tpm = tpm or tpm_padrao
+    if not rpm and not tpm:
+        return None
+    nome = hashlib.sha256(f"{provider}|{model}|{api_key}".encode("utf-8")).hexdigest()[:24]
+    chave = (provider, model, nome, rpm, tpm)
+    with _lock:
+        if chave not in _limitadores:
+            LIMITES_DIR.mkdir(parents=True, exist_ok=True)
+            _limitadores[chave] = Limitador(LIMITES_DIR / f"{nome}.json", rpm, tpm)
+        return _limitadores[chave]
@@ -0,0 +1,320 @@
+"""
+ocr_local.py - Extração offline de autorização e data do cupom vinculado (sem IA na nuvem).
+
+Roda nas páginas da etapa "cupom": binariza (Otsu), separa as regiões com texto
+(ex: cupom fiscal e cupom vinculado lado a lado no vidro do scanner), passa cada
+região por um OCR local em CPU e procura os padrões fixos:
+
+    autorização  111.222.333.444.555   (perto de "AUTORIZAÇÃO")
+    data         DD/MM/AAAA            (perto de "DATA"/"EMISSÃO"), devolvida como DD-MM-AAAA
+
+Motores suportados (dependências opcionais, o primeiro instalado é usado):
+    - RapidOCR (pip install rapidocr_onnxruntime): modelos ONNX, sem binários externos.
+    - Tesseract (pip install pytesseract + instalador do Tesseract com o idioma "por").
+
+O resultado é cruzado com o da IA (cruzar) ou usado sozinho para preencher o
+formulário manual quando a IA não está disponível ou o limite diário acabou.
+"""
+
+from __future__ import annotations
+
+import io
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# Etapa da transação com o cupom fiscal + cupom vinculado
+ETAPA_CUPOM = "cupom"
+
+# Lado maior mínimo para o OCR (cupons digitalizados pequenos são ampliados)
+_LADO_MIN = 1600
+# Coluna/linha "vazia": fração de pixels de tinta abaixo disso
+_TINTA_MIN = 0.004
+# Vão mínimo (fração da largura) para separar duas regiões
+_VAO_MIN = 0.02
+# Confiança mínima para o OCR preencher um campo que a IA deixou em branco (o valor
+# vai para o nome do PDF); abaixo disso ele só vira sugestão nas observações
+CONFIANCA_PREENCHER = 0.85
+
+_RE_AUTORIZACAO = re.compile(r"(?<!\d)(\d{3})[.,\s]?(\d{3})[.,\s]?(\d{3})[.,\s]?(\d{3})[.,\s]?(\d{3})(?!\d)")
+_RE_DATA = re.compile(r"(?<!\d)(\d{2})[/.\-](\d{2})[/.\-](\d{4}|\d{2})(?!\d)")
+_RE_CHAVE_AUTORIZACAO = re.compile(r"AUTORIZ", re.IGNORECASE)
+_RE_CHAVE_DATA = re.compile(r"DATA|EMISS", re.IGNORECASE)
+# Confusões comuns do OCR em campos numéricos
+_DIGITOS = str.maketrans({"O": "0", "o": "0", "D": "0", "I": "1", "l": "1", "|": "1", "S": "5", "B": "8", "Z": "2"})
+
+Linha = Tuple[str, float]  # (texto, confiança 0-1)
+
+
+@dataclass
+class ResultadoOCR:
+    autorizacao: str = ""
+    data: str = ""
+    confianca_autorizacao: float = 0.0
+    confianca_data: float = 0.0
+    motor: str = ""
+    linhas: List[Linha] = field(default_factory=list, repr=False)
+
+    @property
+    def vazio(self) -> bool:
+        return not self.autorizacao and not self.data
+
+
+# ─── Motores de OCR ──────────────────────────────────────────────────────────
+
+_motor: Optional[Tuple[str, Callable[[Image.Image, Image.Image], List[Linha]]]] = None
+_motor_lock = threading.Lock()
+
+
+def _carregar_rapidocr() -> Callable[[Image.Image, Image.Image], List[Linha]]:
+    from rapidocr_onnxruntime import RapidOCR
+
+    engine = RapidOCR()
+
+    def ler(cinza: Image.Image, binaria: Image.Image) -> List[Linha]:
+        buf = io.BytesIO()
+        cinza.save(buf, format="PNG")
+        resultado, _ = engine(buf.getvalue())
+        return [(texto, float(conf)) for _, texto, conf in (resultado or [])]
+
+    return ler
+
+
+def _carregar_tesseract() -> Callable[[Image.Image, Image.Image], List[Linha]]:
+    import pytesseract
+
+    pytesseract.get_tesseract_version()  # levanta erro se o executável não estiver instalado
+
+    def ler(cinza: Image.Image, binaria: Image.Image) -> List[Linha]:
+        dados = pytesseract.image_to_data(binaria, lang="por", output_type=pytesseract.Output.DICT)
+        linhas: dict[Tuple[int, int, int], List[Tuple[str, float]]] = {}
+        for i, texto in enumerate(dados["text"]):
+            if not texto.strip():
+                continue
+            chave = (dados["block_num"][i], dados["par_num"][i], dados["line_num"][i])
+            linhas.setdefault(chave, []).append((texto, max(float(dados["conf"][i]), 0.0) / 100))
+        return [
+            (" ".join(t for t, _ in palavras), min(c for _, c in palavras))
+            for _, palavras in sorted(linhas.items())
+        ]
+
+    return ler
+
+
+def _obter_motor() -> Tuple[str, Callable[[Image.Image, Image.Image], List[Linha]]]:
+    global _motor
+    with _motor_lock:
+        if _motor is None:
+            for nome, carregar in (("rapidocr", _carregar_rapidocr), ("tesseract", _carregar_tesseract)):
+                try:
+                    _motor = (nome, carregar())
+                    break
+                except Exception:
+                    continue
+            else:
+                raise ImportError(
+                    "Nenhum OCR local instalado. Instale com: pip install rapidocr_onnxruntime "
+                    "(ou pytesseract + Tesseract com o idioma português)."
+                )
+        return _motor
+
+
+def disponivel() -> bool:
+    """True se algum motor de OCR local pode ser carregado."""
+    try:
+        _obter_motor()
+        return True
+    except ImportError:
+        return False
+
+
+# ─── Pré-processamento ───────────────────────────────────────────────────────
+
+def _limiar_otsu(cinza: Image.Image) -> int:
+    hist = cinza.histogram()
+    total = sum(hist)
+    soma_total = sum(i * h for i, h in enumerate(hist))
+    soma_fundo = peso_fundo = 0
+    melhor, limiar = -1.0, 127
+    for t, h in enumerate(hist):
+        peso_fundo += h
+        if peso_fundo == 0:
+            continue
+        peso_frente = total - peso_fundo
+        if peso_frente == 0:
+            break
+        soma_fundo += t * h
+        media_fundo = soma_fundo / peso_fundo
+        media_frente = (soma_total - soma_fundo) / peso_frente
+        variancia = peso_fundo * peso_frente * (media_fundo - media_frente) ** 2
+        if variancia > melhor:
+            melhor, limiar = variancia, t
+    return limiar
+
+
+def preprocessar(img: Image.Image) -> Tuple[Image.Image, Image.Image]:
+    """(cinza com contraste ajustado, binária com tinta preta), ampliadas se a página for pequena."""
+    cinza = ImageOps.autocontrast(img.convert("L"), cutoff=1)
+    lado = max(cinza.size)
+    if lado < _LADO_MIN:
+        escala = _LADO_MIN / lado
+        cinza = cinza.resize((round(cinza.width * escala), round(cinza.height * escala)), Image.LANCZOS)
+    limiar = _limiar_otsu(cinza)
+    binaria = cinza.point(lambda p: 255 if p > limiar else 0, mode="L")
+    return cinza, binaria
+
+
+def _faixas_com_tinta(perfil: List[int], vao_min: int) -> List[Tuple[int, int]]:
+    """Intervalos [ini, fim) com tinta, separados por vãos de pelo menos `vao_min`."""
+    corte = 255 * _TINTA_MIN
+    faixas: List[Tuple[int, int]] = []
+    ini = None
+    vazio = 0
+    for i, v in enumerate(perfil):
+        if v > corte:
+            if ini is None:
+                ini = i
+            vazio = 0
+        elif ini is not None:
+            vazio += 1
+            if vazio >= vao_min:
+                faixas.append((ini, i - vazio + 1))
+                ini, vazio = None, 0
+    if ini is not None:
+        faixas.append((ini, len(perfil) - vazio))
+    return faixas
+
+
+def detectar_regioes(binaria: Image.Image) -> List[Tuple[int, int, int, int]]:
+    """
+    Caixas (x0, y0, x1, y1) das regiões com texto: colunas separadas por vãos
+    verticais em branco, cada uma recortada nas linhas com tinta.
+    """
+    tinta = ImageOps.invert(binaria)
+    largura, altura = tinta.size
+    colunas = list(tinta.resize((largura, 1), Image.BOX).getdata())
+    regioes = []
+    for x0, x1 in _faixas_com_tinta(colunas, max(8, int(largura * _VAO_MIN))):
+        if x1 - x0 < largura * 0.05:
+            continue
+        faixa = tinta.crop((x0, 0, x1, altura))
+        linhas = list(faixa.resize((1, altura), Image.BOX).getdata())
+        ys = _faixas_com_tinta(linhas, max(8, int(altura * 0.05)))
+        if ys:
+            regioes.append((x0, ys[0][0], x1, ys[-1][1]))
+    return regioes or [(0, 0, largura, altura)]
+
+
+# ─── Extração dos campos ─────────────────────────────────────────────────────
+
+def _perto(linhas: List[Linha], i: int, chave: "re.Pattern[str]") -> bool:
+    return any(chave.search(linhas[j][0]) for j in range(max(0, i - 1), i + 1))
+
+
+def _data_valida(d: str, m: str, a: str) -> Optional[str]:
+    if len(a) == 2:
+        a = f"20{a}"
+    try:
+        datetime(int(a), int(m), int(d))
+    except ValueError:
+        return None
+    return f"{d}-{m}-{a}"
+
+
+def extrair_campos(linhas: List[Linha]) -> ResultadoOCR:
+    """Procura autorização e data nas linhas lidas (prioriza as próximas das palavras-chave)."""
+    resultado = ResultadoOCR(linhas=list(linhas))
+    datas: Counter[str] = Counter()
+    for i, (texto, conf) in enumerate(linhas):
+        numerico = texto.translate(_DIGITOS) if sum(c.isdigit() for c in texto) >= 6 else texto
+
+        for m in _RE_AUTORIZACAO.finditer(numerico):
+            score = conf * (1.0 if _perto(linhas, i, _RE_CHAVE_AUTORIZACAO) else 0.6)
+            if score > resultado.confianca_autorizacao:
+                resultado.autorizacao = ".".join(m.groups())
+                resultado.confianca_autorizacao = score
+
+        for m in _RE_DATA.finditer(numerico):
+            data = _data_valida(*m.groups())
+            if data is None:
+                continue
+            datas[data] += 1
+            score = conf * (1.0 if _perto(linhas, i, _RE_CHAVE_DATA) else 0.5)
+            if score > resultado.confianca_data:
+                resultado.data = data
+                resultado.confianca_data = score
+
+    # Sem palavra-chave, a data que mais se repete (cupom fiscal e vinculado) é a da compra
+    if datas and resultado.confianca_data < 0.5:
+        resultado.data = datas.most_common(1)[0][0]
+    return resultado
+
+
+def extrair(imagens: Iterable[Image.Image]) -> ResultadoOCR:
+    """Roda o OCR local nas páginas do cupom e extrai autorização e data."""
+    nome, ler = _obter_motor()
+    linhas: List[Linha] = []
+    for img in imagens:
+        cinza, binaria = preprocessar(img)
+        for caixa in detectar_regioes(binaria):
+            linhas.extend(ler(cinza.crop(caixa), binaria.crop(caixa)))
+    resultado = extrair_campos(linhas)
+    resultado.motor = nome
+    return resultado
+
+
+def extrair_da_transacao(transacao: Any) -> Optional[ResultadoOCR]:
+    """Extrai das páginas da etapa do cupom; None se a transação não tem essa etapa/páginas."""
+    etapa = next((e for e in getattr(transacao, "etapas", []) if e.id == ETAPA_CUPOM), None)
+    if etapa is None or not etapa.tem_imagens:
+        return None
+    return extrair(etapa.imagens)
+
+
+# ─── Cruzamento com a IA ─────────────────────────────────────────────────────
+
+def _digitos(s: str) -> str:
+    return "".join(c for c in s if c.isdigit())
+
+
+def cruzar(result: Any, ocr: Optional[ResultadoOCR]) -> List[str]:
+    """
+    Confere o AuditResult da IA com o OCR local e anota nas observações quando os
+    dois discordam. Campos que a IA deixou em branco só são completados com leitura
+    de confiança >= CONFIANCA_PREENCHER, e ficam marcados (observações e
+    metricas["ocr"]["preenchidos"]); abaixo disso o valor é só sugerido.
+    Retorna as divergências.
+    """
+    if ocr is None or ocr.vazio:
+        return []
+    divergencias = []
+    avisos = []
+    preenchidos = []
+    for campo, conf in (("autorizacao", ocr.confianca_autorizacao), ("data", ocr.confianca_data)):
+        lido = getattr(ocr, campo)
+        if not lido:
+            continue
+        atual = getattr(result, campo)
+        nome = "Autorização" if campo == "autorizacao" else "Data"
+        if not atual and conf >= CONFIANCA_PREENCHER:
+            setattr(result, campo, lido)
+            preenchidos.append(campo)
+            avisos.append(f"ℹ️ {nome} {lido} preenchida pelo OCR local (confiança {conf:.0%}). Confira no cupom.")
+        elif not atual:
+            avisos.append(f"ℹ️ {nome} não lida pela IA; OCR local sugere {lido} (confiança {conf:.0%}, não preenchida).")
+        elif _digitos(atual) != _digitos(lido):
+            divergencias.append(f"{nome}: IA leu {atual}, OCR local leu {lido} (confiança {conf:.0%}). Confira no cupom.")
+    avisos += [f"⚠️ {d}" for d in divergencias]
+    if avisos:
+        obs = " ".join(avisos)
+        result.observacoes = f"{result.observacoes}\n{obs}".strip() if result.observacoes else obs
+    result.metricas["ocr"] = {
+        "motor": ocr.motor, "autorizacao": ocr.autorizacao, "data": ocr.data, "divergencias": divergencias,
+        "preenchidos": preenchidos,
+    }
+    return divergencias
@@ -0,0 +1,502 @@
+"""
+page_store.py - Armazenamento em disco das páginas digitalizadas de uma transação.
+
+Cada página capturada é gravada na hora em uma pasta da sessão
+(APP_DATA_DIR/sessoes/<id>/): os bytes JPEG originais quando ela veio de um JPEG,
+senão PNG sem perda. É decodificada só quando alguém a usa, com um LRU
+pequeno de páginas decodificadas. A memória fica limitada independentemente do
+número de páginas.
+
+Tudo o que acontece na sessão (páginas adicionadas/removidas, troca de etapa,
+CPF digitado) é anotado em um diário append-only (journal.jsonl, uma linha JSON
+por evento, com fsync). Se o app cair, PageStore.abrir() reproduz o diário e a
+transação volta ao mesmo ponto sem reprocessar nenhuma imagem.
+
+Cada página ganha um hash perceptual (dHash) na captura, indexado por faixas de
+8 bits: achar páginas quase iguais na transação (mesma folha escaneada duas vezes,
+cupom de novo na etapa da receita) custa O(1) por página nova.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Union, overload
+
+from PIL import Image
+
+from core.blob_store import dhash, distancia
+from core.config import APP_DATA_DIR
+from core.jpeg_passthrough import abrir_imagem, jpeg_original
+
+
+SESSOES_DIR = APP_DATA_DIR / "sessoes"
+JOURNAL = "journal.jsonl"
+
+# Páginas decodificadas mantidas em memória por sessão
+DEFAULT_MAX_DECODIFICADAS = 4
+
+# Sessão sem páginas mexida há menos que isto (s) pode estar começando agora (outra
+# janela do app, ou a transação aberta enquanto a limpeza roda): não é removida
+SESSAO_VAZIA_RECENTE_S = 24 * 3600
+
+# Compressão do PNG das páginas que não vieram de um JPEG: a sessão é temporária,
+# então gravar rápido vale mais que o tamanho do arquivo
+_PNG_COMPRESSAO = 1
+
+# Distância de Hamming (de 64 bits) até a qual duas páginas são consideradas iguais.
+# Baixo de propósito: formulários do mesmo modelo com outro conteúdo também ficam a
+# poucos bits; a mesma folha escaneada de novo difere só pelo ruído do scanner.
+# Com 8 faixas de 8 bits, qualquer par a até 7 bits divide ao menos uma faixa idêntica.
+LIMIAR_DUPLICATA = 3
+# Entre etapas diferentes o limiar é ainda mais estrito: lá o par típico é de documentos
+# distintos com o mesmo modelo (ex: duas receitas), e só a folha repetida fica tão perto
+LIMIAR_OUTRA_ETAPA = 1
+_FAIXAS = 8
+
+
+class Pagina:
+    """Referência leve a uma página gravada no disco."""
+
+    __slots__ = ("id", "store", "size")
+
+    def __init__(self, id: str, store: "PageStore", size: tuple[int, int] = (0, 0)) -> None:
+        self.id = id
+        self.store = store
+        self.size = size
+
+    @property
+    def arquivo(self) -> Path:
+        return self.store.diretorio / f"{self.id}{self.store.extensao(self.id)}"
+
+    def imagem(self) -> Image.Image:
+        """Imagem decodificada (do LRU ou do disco)."""
+        return self.store.imagem(self)
+
+    def dados(self) -> bytes:
+        """Bytes da página (JPEG original ou PNG), sem decodificar."""
+        return self.arquivo.read_bytes()
+
+    def __repr__(self) -> str:
+        return f"Pagina({self.id!r})"
+
+
+class Duplicata(NamedTuple):
+    """Página da transação parecida com uma recém-adicionada."""
+    etapa_id: str
+    pagina: "Pagina"
+    distancia: int
+
+
+def _faixas(h: int) -> List[tuple[int, int]]:
+    h &= (1 << 64) - 1
+    return [(i, (h >> (8 * i)) & 0xFF) for i in range(_FAIXAS)]
+
+
+class PageStore:
+    """
+    Páginas de uma sessão (transação) gravadas em disco, com LRU de decodificadas
+    e diário de eventos para recuperação.
+
+    `meta` (ex: tipo da transação) vai no primeiro evento do diário; `estado` guarda
+    o que a transação anota (etapa atual, CPFs) e é reconstruído por abrir().
+    """
+
+    def __init__(
+        self,
+        diretorio: Optional[Path] = None,
+        max_decodificadas: int = DEFAULT_MAX_DECODIFICADAS,
+    ) -> None:
+        self.diretorio = diretorio or SESSOES_DIR / uuid.uuid4().hex
+        self.max_decodificadas = max(1, max_decodificadas)
+        self.meta: Dict[str, Any] = {}
+        self.estado: Dict[str, Any] = {
+            "etapa_atual_index": 0, "cpfs": {}, "finalizada": False, "iniciada_em": time.time(),
+        }
+        self._lock = threading.RLock()
+        self._lru: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._etapas: Dict[str, List[str]] = {}
+        # Página -> etapa, mantido junto com _etapas pelo diário
+        self._etapa_de: Dict[str, str] = {}
+        self._tamanhos: Dict[str, tuple[int, int]] = {}
+        # Extensão do arquivo de cada página (".jpg" se ausente)
+        self._extensoes: Dict[str, str] = {}
+        # (id, tamanho) -> miniatura; pequenas, ficam para a sessão toda
+        self._miniaturas: Dict[tuple[str, tuple[int, int]], Image.Image] = {}
+        # Hash perceptual por página e índice (faixa, valor) -> páginas anotadas na transação
+        self._hashes: Dict[str, int] = {}
+        self._faixas: Dict[tuple[int, int], Set[str]] = {}
+
+    # ── Diário ──────────────────────────────────────────────────────────────
+
+    @property
+    def journal(self) -> Path:
+        return self.diretorio / JOURNAL
+
+    def registrar(self, evento: str, **dados: Any) -> None:
+        """Acrescenta um evento ao diário (a pasta e o cabeçalho são criados no primeiro)."""
+        with self._lock:
+            novo = not self.journal.exists()
+            if novo:
+                self.diretorio.mkdir(parents=True, exist_ok=True)
+            with open(self.journal, "a", encoding="utf-8") as f:
+                if novo:
+                    f.write(json.dumps({"ev": "inicio", "em": time.time(), "meta": self.meta}, ensure_ascii=False) + "\n")
+                f.write(json.dumps({"ev": evento, **dados}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._aplicar({"ev": evento, **dados})
+
+    def _aplicar(self, e: Dict[str, Any]) -> None:
+        ev = e.get("ev")
+        if ev == "inicio":
+            self.meta = dict(e.get("meta", {}))
+            self.estado["iniciada_em"] = e.get("em", 0.0)
+        elif ev == "pagina":
+            self._etapas.setdefault(e["etapa"], []).append(e["id"])
+            self._etapa_de[e["id"]] = e["etapa"]
+            self._tamanhos[e["id"]] = tuple(e.get("size", (0, 0)))  # type: ignore[assignment]
+            self._extensoes[e["id"]] = e.get("ext", ".jpg")
+            if e.get("dhash") is not None:
+                self._indexar_hash(e["id"], int(e["dhash"]))
+        elif ev == "remover":
+            ids = self._etapas.get(e["etapa"], [])
+            if e["id"] in ids:
+                ids.remove(e["id"])
+            if self._etapa_de.get(e["id"]) == e["etapa"]:
+                del self._etapa_de[e["id"]]
+            h = self._hashes.get(e["id"])
+            if h is not None:
+                for faixa in _faixas(h):
+                    self._faixas.get(faixa, set()).discard(e["id"])
+        elif ev == "etapa":
+            self.estado["etapa_atual_index"] = int(e["indice"])
+        elif ev == "cpf":
+            self.estado["cpfs"][e["etapa"]] = e["cpf"]
+        elif ev == "finalizada":
+            self.estado["finalizada"] = True
+
+    @classmethod
+    def abrir(cls, diretorio: Path, max_decodificadas: int = DEFAULT_MAX_DECODIFICADAS) -> "PageStore":
+        """Reabre uma sessão gravada reproduzindo o diário (ex: após o app cair)."""
+        store = cls(diretorio, max_decodificadas)
+        valido = 0
+        with open(store.journal, "rb") as f:
+            for linha in f:
+                try:
+                    evento = json.loads(linha)
+                except ValueError:
+                    break  # Última linha incompleta (queda durante a escrita)
+                store._aplicar(evento)
+                valido += len(linha)
+        if valido < store.journal.stat().st_size:
+            # Corta o resto para que os próximos eventos não fiquem depois do lixo
+            with open(store.journal, "r+b") as f:
+                f.truncate(valido)
+        # Ignora páginas cujo arquivo não chegou a ser gravado
+        for ids in store._etapas.values():
+            ids[:] = [i for i in ids if store.pagina(i).arquivo.exists()]
+        store._etapa_de = {i: etapa for etapa, ids in store._etapas.items() for i in ids}
+        return store
+
+    @property
+    def total_paginas(self) -> int:
+        with self._lock:
+            return sum(len(ids) for ids in self._etapas.values())
+
+    # ── Páginas ─────────────────────────────────────────────────────────────
+
+    def adicionar(self, img: Image.Image, etapa_id: str) -> Pagina:
+        """Grava a página no disco imediatamente, anota no diário e devolve sua referência."""
+        pagina = self.gravar(img)
+        self.anotar(pagina, etapa_id)
+        return pagina
+
+    def gravar(self, img: Image.Image, miniatura: Optional[tuple[int, int]] = None) -> Pagina:
+        """
+        Grava só o arquivo da página (pode rodar fora da thread da UI); a página passa
+        a fazer parte da etapa com anotar(). `miniatura` já gera e guarda a miniatura.
+        """
+        data = jpeg_original(img)
+        extensao = ".jpg"
+        if data is None:
+            # Sem JPEG de origem (TIFF/BMP do scanner, PNG importado, página otimizada):
+            # PNG sem perda, para a única recodificação com perda ser a do PDF final
+            buf = io.BytesIO()
+            modo = img.mode if img.mode in ("1", "L", "RGB") else "RGB"
+            img.convert(modo).save(buf, format="PNG", compress_level=_PNG_COMPRESSAO)
+            data = buf.getvalue()
+            extensao = ".png"
+            # O que fica em memória é exatamente o que será lido do disco depois
+            img = abrir_imagem(data)
+
+        pagina = Pagina(uuid.uuid4().hex, self, img.size)
+        with self._lock:
+            self._extensoes[pagina.id] = extensao
+        # fsync antes do rename (e bem antes de anotar() pôr a página no diário): após
+        # uma queda, o diário nunca aponta para um arquivo vazio ou truncado
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        tmp = pagina.arquivo.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, pagina.arquivo)
+        with self._lock:
+            self._tamanhos[pagina.id] = pagina.size
+            self._guardar(pagina.id, img)
+        h = dhash(img)
+        with self._lock:
+            self._hashes[pagina.id] = h
+        if miniatura is not None:
+            self._gerar_miniatura(pagina.id, img, miniatura)
+        return pagina
+
+    def anotar(self, pagina: Pagina, etapa_id: str) -> None:
+        """Registra no diário que a página (já gravada) pertence à etapa."""
+        self.registrar(
+            "pagina", etapa=etapa_id, id=pagina.id, size=list(pagina.size), dhash=self._hashes.get(pagina.id),
+            ext=self.extensao(pagina.id),
+        )
+
+    def extensao(self, id: str) -> str:
+        return self._extensoes.get(id, ".jpg")
+
+    def _indexar_hash(self, id: str, h: int) -> None:
+        self._hashes[id] = h
+        for faixa in _faixas(h):
+            self._faixas.setdefault(faixa, set()).add(id)
+
+    def semelhantes(
+        self,
+        pagina: Pagina,
+        limiar: int = LIMIAR_DUPLICATA,
+        limiar_outra_etapa: int = LIMIAR_OUTRA_ETAPA,
+    ) -> List[Duplicata]:
+        """
+        Outras páginas da transação quase iguais a `pagina` (mais parecidas primeiro):
+        até `limiar` bits na mesma etapa e até `limiar_outra_etapa` nas demais.
+        """
+        with self._lock:
+            h = self._hashes.get(pagina.id)
+            etapa = self._etapa_de.get(pagina.id)
+            if h is None or etapa is None:
+                return []
+            candidatos: Set[str] = set()
+            for faixa in _faixas(h):
+                candidatos |= self._faixas.get(faixa, set())
+            candidatos.discard(pagina.id)
+            achadas = []
+            for i in candidatos:
+                outra = self._etapa_de.get(i)
+                if outra is None:
+                    continue
+                d = distancia(h, self._hashes[i])
+                if d <= (limiar if outra == etapa else limiar_outra_etapa):
+                    achadas.append(Duplicata(outra, self.pagina(i), d))
+        return sorted(achadas, key=lambda dup: dup.distancia)
+
+    def miniatura(self, pagina: Pagina, tamanho: tuple[int, int]) -> Image.Image:
+        """Miniatura da página (gerada uma única vez por página e tamanho)."""
+        with self._lock:
+            thumb = self._miniaturas.get((pagina.id, tamanho))
+        if thumb is not None:
+            return thumb
+        # Decodifica o JPEG já reduzido (draft) em vez da página inteira
+        src = Image.open(io.BytesIO(pagina.dados()))
+        src.draft("RGB", (tamanho[0] * 2, tamanho[1] * 2))
+        return self._gerar_miniatura(pagina.id, src, tamanho)
+
+    def _gerar_miniatura(self, id: str, img: Image.Image, tamanho: tuple[int, int]) -> Image.Image:
+        thumb = img.convert("RGB") if img.mode != "RGB" else img.copy()
+        thumb.thumbnail(tamanho, Image.LANCZOS)
+        with self._lock:
+            self._miniaturas[(id, tamanho)] = thumb
+        return thumb
+
+    def remover(self, pagina: Pagina, etapa_id: str) -> None:
+        """
+        Tira a página da etapa e apaga o arquivo. Um instantâneo antigo que ainda a
+        referencie (ex: o do pipeline) falha ao lê-la, mas já seria descartado por
+        não bater mais com os ids da etapa.
+        """
+        self.registrar("remover", etapa=etapa_id, id=pagina.id)
+        with self._lock:
+            self._lru.pop(pagina.id, None)
+            for chave in [c for c in self._miniaturas if c[0] == pagina.id]:
+                del self._miniaturas[chave]
+            try:
+                pagina.arquivo.unlink(missing_ok=True)
+            except OSError:
+                pass  # Aberto por outro processo (Windows): sai no descarte da sessão
+
+    def imagem(self, pagina: Pagina) -> Image.Image:
+        with self._lock:
+            img = self._lru.get(pagina.id)
+            if img is not None:
+                self._lru.move_to_end(pagina.id)
+                return img
+        img = abrir_imagem(pagina.dados())
+        with self._lock:
+            self._guardar(pagina.id, img)
+        return img
+
+    def pagina(self, id: str) -> Pagina:
+        return Pagina(id, self, self._tamanhos.get(id, (0, 0)))
+
+    def paginas_da_etapa(self, etapa_id: str) -> List[Pagina]:
+        with self._lock:
+            return [self.pagina(i) for i in self._etapas.get(etapa_id, [])]
+
+    def _guardar(self, id: str, img: Image.Image) -> None:
+        self._lru[id] = img
+        self._lru.move_to_end(id)
+        while len(self._lru) > self.max_decodificadas:
+            self._lru.popitem(last=False)
+
+    def descartar(self) -> None:
+        """Apaga a sessão do disco (transação concluída ou cancelada)."""
+        with self._lock:
+            self._lru.clear()
+            self._miniaturas.clear()
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+
+
+def listar_sessoes() -> List[Path]:
+    """Sessões gravadas no disco, da mais recente para a mais antiga."""
+    if not SESSOES_DIR.exists():
+        return []
+    sessoes = [d for d in SESSOES_DIR.iterdir() if (d / JOURNAL).is_file()]
+    return sorted(sessoes, key=lambda d: (d / JOURNAL).stat().st_mtime, reverse=True)
+
+
+def sessao_pendente() -> Optional[PageStore]:
+    """A sessão não finalizada mais recente que tem páginas (candidata a retomar)."""
+    for d in listar_sessoes():
+        try:
+            store = PageStore.abrir(d)
+        except OSError:
+            continue
+        if not store.estado["finalizada"] and store.total_paginas > 0:
+            return store
+    return None
+
+
+def limpar_sessoes(max_dias: int = 7, manter: Optional[Path] = None) -> None:
+    """
+    Remove sessões finalizadas, mais antigas que `max_dias` ou vazias há mais de
+    SESSAO_VAZIA_RECENTE_S (exceto `manter`, a sessão em uso).
+    """
+    if not SESSOES_DIR.exists():
+        return
+    agora = time.time()
+    limite = agora - max_dias * 86400
+    for d in SESSOES_DIR.iterdir():
+        if not d.is_dir() or d == manter:
+            continue
+        try:
+            if (d / JOURNAL).is_file():
+                store = PageStore.abrir(d)
+                mtime = (d / JOURNAL).stat().st_mtime
+                vazia = store.total_paginas == 0 and mtime < agora - SESSAO_VAZIA_RECENTE_S
+                if not (store.estado["finalizada"] or vazia or mtime < limite):
+                    continue
+            elif d.stat().st_mtime >= limite:
+                continue  # Sessão recém-criada, ainda sem diário
+        except OSError:
+            pass
+        shutil.rmtree(d, ignore_errors=True)
+
+
+class ListaPaginas:
+    """
+    Sequência de páginas de uma etapa com interface de lista de imagens PIL:
+    indexar ou iterar decodifica sob demanda. Itens podem ser Pagina (em disco)
+    ou Image (quando não há PageStore, ex: auditoria retroativa de PDF).
+    """
+
+    def __init__(
+        self,
+        itens: Optional[Iterable[Union[Pagina, Image.Image]]] = None,
+        store: Optional[PageStore] = None,
+        etapa_id: str = "",
+    ) -> None:
+        self._itens: List[Union[Pagina, Image.Image]] = list(itens or [])
+        self.store = store
+        self.etapa_id = etapa_id
+
+    def vincular(self, store: PageStore, etapa_id: str) -> None:
+        """Passa a gravar as páginas desta lista no `store` (as já existentes também)."""
+        self.store = store
+        self.etapa_id = etapa_id
+        self._itens = [i if isinstance(i, Pagina) else store.adicionar(i, etapa_id) for i in self._itens]
+
+    @property
+    def paginas(self) -> List[Pagina]:
+        return [i for i in self._itens if isinstance(i, Pagina)]
+
+    @property
+    def ids(self) -> List[str]:
+        """Identificadores estáveis dos itens (mudam só quando a página muda)."""
+        return [i.id if isinstance(i, Pagina) else f"mem:{id(i)}" for i in self._itens]
+
+    def append(self, item: Union[Pagina, Image.Image]) -> None:
+        """Acrescenta uma imagem (gravada no store, se houver) ou uma Pagina já gravada."""
+        if self.store is None:
+            self._itens.append(item)
+        elif isinstance(item, Pagina):
+            self.store.anotar(item, self.etapa_id)
+            self._itens.append(item)
+        else:
+            self._itens.append(self.store.adicionar(item, self.etapa_id))
+
+    def item(self, index: int) -> Union[Pagina, Image.Image]:
+        """Item bruto (Pagina ou Image), sem decodificar."""
+        return self._itens[index]
+
+    def pop(self, index: int = -1) -> Union[Pagina, Image.Image]:
+        item = self._itens.pop(index)
+        if self.store is not None and isinstance(item, Pagina):
+            self.store.remover(item, self.etapa_id)
+        return item
+
+    def copia(self) -> "ListaPaginas":
+        """Instantâneo da lista (sem decodificar nem copiar páginas)."""
+        return ListaPaginas(self._itens)
+
+    def __add__(self, outra: "ListaPaginas") -> "ListaPaginas":
+        return ListaPaginas(self._itens + outra._itens)
+
+    @staticmethod
+    def _resolver(item: Union[Pagina, Image.Image]) -> Image.Image:
+        return item.imagem() if isinstance(item, Pagina) else item
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def __bool__(self) -> bool:
+        return bool(self._itens)
+
+    @overload
+    def __getitem__(self, index: int) -> Image.Image: ...
+    @overload
+    def __getitem__(self, index: slice) -> "ListaPaginas": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Image.Image, "ListaPaginas"]:
+        if isinstance(index, slice):
+            return ListaPaginas(self._itens[index])
+        return self._resolver(self._itens[index])
+
+    def __iter__(self) -> Iterator[Image.Image]:
+        for item in list(self._itens):
+            yield self._resolver(item)
+
+    def __repr__(self) -> str:
+        return f"ListaPaginas({len(self._itens)} página(s))"
@@ -1,35 +1,129 @@
 """
 pdf_converter.py - Converte PDFs em imagens PIL para auditoria IA.
+
+As páginas são produzidas uma a uma (iter_pdf_images), direto das amostras do
+pixmap, sem passar por PNG. Páginas que são apenas uma foto JPEG (ex: PDFs do
+próprio app ou de scanners) têm o JPEG extraído em vez de serem renderizadas.
 """
 
 from __future__ import annotations
+
 import io
-from typing import List
+from typing import Iterator, List, Optional, Tuple
+
 from PIL import Image
 
-def pdf_to_images(pdf_path: str) -> List[Image.Image]:
-    """
-    Converte todas as páginas de um PDF em uma lista de imagens PIL.
-    Usa a biblioteca fitz (PyMuPDF) por ser rápida e não depender de binários externos como poppler.
-    """
+# Resolução padrão de renderização (o antigo zoom 2.0 equivalia a 144 DPI)
+DEFAULT_DPI = 150
+
+# Fração mínima da página que a imagem deve ocupar para ser extraída como JPEG
+_JPEG_MIN_AREA = 0.5
+
+
+def _import_fitz():  # type: ignore[no-untyped-def]
     try:
-        import fitz # PyMuPDF
+        import fitz  # PyMuPDF
     except ImportError:
         raise ImportError("A biblioteca 'pymupdf' é necessária para auditar PDFs existentes. Instale com: pip install pymupdf")
+    return fitz
+
+
+def _zoom(largura_pt: float, altura_pt: float, dpi: int, max_dim: Optional[Tuple[int, int]]) -> float:
+    """Escala de renderização: `dpi`, limitada por max_dim = (lado maior, lado menor) em pixels."""
+    zoom = dpi / 72.0
+    if max_dim:
+        max_long, max_short = max_dim
+        zoom = min(zoom, max_long / max(largura_pt, altura_pt), max_short / min(largura_pt, altura_pt))
+    return max(zoom, 0.1)
+
+
+def _extrair_jpeg(doc, page, zoom: float, grayscale: bool) -> Optional[Image.Image]:  # type: ignore[no-untyped-def]
+    """
+    Se a página é essencialmente um único JPEG (sem máscara, sem rotação, cobrindo a
+    maior parte da página), devolve a imagem decodificada em resolução reduzida.
+    Sobreposições vetoriais (ex: o cabeçalho dos PDFs do app) são descartadas.
+    """
+    imagens = page.get_images(full=True)
+    if len(imagens) != 1 or page.rotation:
+        return None
+    xref, smask, _, _, _, colorspace, _, _, filtro = imagens[0][:9]
+    if filtro != "DCTDecode" or smask or colorspace not in ("DeviceRGB", "DeviceGray"):
+        return None
 
-    images = []
-    doc = fitz.open(pdf_path)
-    
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        # Aumentar a escala para melhor legibilidade (DPI 300 aprox)
-        zoom = 2.0 
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
-        
-        img_data = pix.tobytes("png")
-        img = Image.open(io.BytesIO(img_data))
-        images.append(img.convert("RGB"))
-        
-    doc.close()
-    return images
+    rects = page.get_image_rects(xref, transform=True)
+    if len(rects) != 1:
+        return None
+    rect, matriz = rects[0]
+    # Só aceita imagem sem rotação/espelhamento
+    if abs(matriz.b) > 1e-3 or abs(matriz.c) > 1e-3 or matriz.a <= 0 or matriz.d <= 0:
+        return None
+    area_pagina = page.rect.width * page.rect.height
+    if area_pagina <= 0 or (rect & page.rect).get_area() < _JPEG_MIN_AREA * area_pagina:
+        return None
+
+    img = Image.open(io.BytesIO(doc.xref_stream_raw(xref)))
+    if img.format != "JPEG":
+        return None
+
+    # Tamanho alvo = área que a imagem ocupa na página, na escala pedida
+    alvo = (max(1, int(rect.width * zoom)), max(1, int(rect.height * zoom)))
+    modo = "L" if grayscale else "RGB"
+    # draft() decodifica o JPEG direto em 1/2, 1/4 ou 1/8 da resolução (bem mais leve)
+    img.draft(modo, alvo)
+    img = img.convert(modo)
+    if img.width > alvo[0] or img.height > alvo[1]:
+        img.thumbnail(alvo, Image.LANCZOS)
+    return img
+
+
+def iter_pdf_images(
+    pdf_path: str,
+    dpi: int = DEFAULT_DPI,
+    max_dim: Optional[Tuple[int, int]] = None,
+    grayscale: bool = False,
+    extrair_jpeg: bool = True,
+) -> Iterator[Image.Image]:
+    """
+    Produz as páginas de um PDF como imagens PIL, uma de cada vez.
+    Usa a biblioteca fitz (PyMuPDF) por ser rápida e não depender de binários externos como poppler.
+
+    Args:
+        pdf_path: Caminho do PDF.
+        dpi: Resolução de renderização.
+        max_dim: (lado maior, lado menor) máximos em pixels, ex: ai_auditor.vision_profile();
+            não adianta renderizar acima do que o provedor vai usar.
+        grayscale: Produz imagens "L" (1/3 da memória de RGB).
+        extrair_jpeg: Extrai o JPEG embutido em páginas digitalizadas em vez de renderizar.
+    """
+    fitz = _import_fitz()
+    cor = fitz.csGRAY if grayscale else fitz.csRGB
+    modo = "L" if grayscale else "RGB"
+
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            zoom = _zoom(page.rect.width, page.rect.height, dpi, max_dim)
+
+            img = None
+            if extrair_jpeg:
+                try:
+                    img = _extrair_jpeg(doc, page, zoom, grayscale)
+                except Exception:
+                    img = None  # JPEG fora do padrão: renderiza normalmente
+            if img is None:
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=cor, alpha=False)
+                img = Image.frombytes(modo, (pix.width, pix.height), pix.samples)
+                del pix
+            yield img
+
+
+def pdf_to_images(
+    pdf_path: str,
+    dpi: int = DEFAULT_DPI,
+    max_dim: Optional[Tuple[int, int]] = None,
+    grayscale: bool = False,
+) -> List[Image.Image]:
+    """
+    Converte todas as páginas de um PDF em uma lista de imagens PIL.
+    Prefira iter_pdf_images quando as páginas puderem ser processadas uma a uma.
+    """
+    return list(iter_pdf_images(pdf_path, dpi=dpi, max_dim=max_dim, grayscale=grayscale))
@@ -7,7 +7,7 @@ from __future__ import annotations
 
 import io
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from PIL import Image as PILImage
 from reportlab.lib import colors
@@ -16,6 +16,9 @@ from reportlab.lib.units import mm
 from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 
+from core.blob_store import BlobStore
+from core.jpeg_passthrough import jpeg_bytes
+
 
 # Dimensões A4 em pontos
 PAGE_W, PAGE_H = A4
@@ -44,6 +47,7 @@ def gerar_pdf(
     autorizacao: str,
     data: str,
     output_folder: str,
+    blob_store: Optional[BlobStore] = None,
 ) -> Path:
     """
     Gera um arquivo PDF com todas as imagens, com cabeçalho em cada página.
@@ -53,6 +57,8 @@ def gerar_pdf(
         autorizacao: Número de autorização extraído pela IA.
         data: Data da transação extraída pela IA (ex: "01-01-2021").
         output_folder: Pasta onde o PDF será salvo.
+        blob_store: Se informado, anota quais páginas são documentos já guardados
+            na pasta CPFs (relatório de deduplicação). O PDF continua autocontido.
 
     Returns:
         Path do arquivo PDF gerado.
@@ -68,6 +74,7 @@ def gerar_pdf(
     content_w = PAGE_W - 2 * MARGIN
 
     c = canvas.Canvas(str(output_path), pagesize=A4)
+    paginas_jpeg: List[bytes] = []
 
     for img in imagens:
         _draw_header(c, autorizacao, data)
@@ -80,13 +87,19 @@ def gerar_pdf(
         x = MARGIN + (content_w - draw_w) / 2
         y = content_top - draw_h
 
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format="JPEG", quality=85)
-        img_buffer.seek(0)
-        reader = ImageReader(img_buffer)
+        # JPEG original (scanner/arquivo) entra direto no PDF; só recodifica páginas alteradas
+        jpeg = jpeg_bytes(img, quality=85)
+        paginas_jpeg.append(jpeg)
+        reader = ImageReader(io.BytesIO(jpeg))
 
         c.drawImage(reader, x, y, width=draw_w, height=draw_h)
         c.showPage()
 
     c.save()
+
+    if blob_store is not None:
+        try:
+            blob_store.registrar_pdf(output_path, paginas_jpeg)
+        except Exception as e:
+            print(f"[PDF] Falha ao registrar páginas no blob store: {e}")
     return output_path
@@ -0,0 +1,77 @@
+"""
+preview_cache.py - Previews reduzidos de imagens em disco (ex: páginas da pasta CPFs).
+
+O JPEG é decodificado já na escala do preview (Image.draft, 1/2 a 1/8 da
+resolução) e o bitmap resultante fica em um LRU em memória, chaveado por
+(caminho, data de modificação, largura). Pensado para rodar fora da thread da UI.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# Previews mantidos em memória (700 px de largura ≈ 1,5 MB cada em RGB)
+DEFAULT_MAX_PREVIEWS = 24
+
+_Chave = Tuple[str, float, int]
+
+
+class PreviewCache:
+    """LRU de previews já reduzidos para uma largura fixa."""
+
+    def __init__(self, max_previews: int = DEFAULT_MAX_PREVIEWS) -> None:
+        self.max_previews = max_previews
+        self._lru: "OrderedDict[_Chave, Image.Image]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chave(path: str, largura: int) -> _Chave:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = 0.0
+        return (os.path.abspath(path), mtime, largura)
+
+    def obter(self, path: str, largura: int) -> Optional[Image.Image]:
+        """Preview já em memória, sem tocar no disco além do stat; None se não houver."""
+        chave = self._chave(path, largura)
+        with self._lock:
+            img = self._lru.get(chave)
+            if img is not None:
+                self._lru.move_to_end(chave)
+            return img
+
+    def carregar(self, path: str, largura: int) -> Image.Image:
+        """Preview da imagem com `largura` px (proporção mantida), do LRU ou do disco."""
+        img = self.obter(path, largura)
+        if img is not None:
+            return img
+
+        with Image.open(path) as src:
+            # Altura proporcional usada só para o draft escolher a escala do decodificador
+            alvo = (largura, max(1, round(src.height * largura / max(src.width, 1))))
+            src.draft("RGB", alvo)
+            img = ImageOps.exif_transpose(src).convert("RGB")
+        if img.width != largura:
+            altura = max(1, round(img.height * largura / img.width))
+            img = img.resize((largura, altura), Image.LANCZOS)
+
+        chave = self._chave(path, largura)
+        with self._lock:
+            self._lru[chave] = img
+            while len(self._lru) > self.max_previews:
+                self._lru.popitem(last=False)
+        return img
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+
+# Compartilhado pelas telas: reabrir o mesmo CPF não decodifica de novo
+previews = PreviewCache()
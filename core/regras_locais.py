@@ -0,0 +1,253 @@
+"""
+regras_locais.py - Verificações determinísticas do master_prompt.md, feitas localmente.
+
+Regras que não dependem de julgamento visual são conferidas aqui, em milissegundos,
+a partir do que já se sabe sem IA:
+
+    - documentos obrigatórios de cada tipo de transação (etapas com páginas);
+    - dígitos verificadores dos CPFs digitados (cpf_manager.validate_cpf) e, no modo
+      duas fases, do CPF lido do documento (e se bate com o digitado);
+    - formato da autorização (XXX.XXX.XXX.XXX.XXX) e data da venda válida e não futura;
+    - validade da receita na data da venda (REGRA 5.5: 180 dias, 365 para anticoncepcional,
+      emissão não posterior à venda);
+    - fraldas geriátricas (REGRA 6): 60 anos ou mais na data da venda, ou CID informado.
+
+Falhas "bloqueantes" reprovam o dossiê sem chamar a IA. As demais (vindas do OCR
+local, que pode ler errado) só entram como contexto. O resultado também vai para o
+prompt de consolidação, para o modelo não refazer essas contas.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from core.ai_auditor import AuditResult
+from core.cpf_manager import validate_cpf
+
+# REGRA 5.5
+VALIDADE_RECEITA_DIAS = 180
+VALIDADE_ANTICONCEPCIONAL_DIAS = 365
+# REGRA 6.1
+IDADE_MINIMA_FRALDA = 60
+
+_RE_AUTORIZACAO = re.compile(r"^\d{3}\.\d{3}\.\d{3}\.\d{3}\.\d{3}$")
+
+
+@dataclass
+class Verificacao:
+    regra: str
+    ok: bool
+    mensagem: str
+    bloqueante: bool = False
+
+
+@dataclass
+class RelatorioRegras:
+    verificacoes: List[Verificacao] = field(default_factory=list)
+
+    def adicionar(self, regra: str, ok: bool, mensagem: str, bloqueante: bool = False) -> None:
+        self.verificacoes.append(Verificacao(regra, ok, mensagem, bloqueante and not ok))
+
+    @property
+    def falhas(self) -> List[Verificacao]:
+        return [v for v in self.verificacoes if not v.ok]
+
+    @property
+    def reprovado(self) -> bool:
+        """True se alguma verificação confiável falhou: não adianta chamar a IA."""
+        return any(v.bloqueante for v in self.verificacoes)
+
+    def como_resultado(self, autorizacao: str = "", data: str = "") -> AuditResult:
+        """AuditResult reprovado com as falhas locais (sem chamada à IA)."""
+        result = AuditResult({
+            "aprovado": False,
+            "autorizacao": autorizacao,
+            "data": data,
+            "erros": [v.mensagem for v in self.falhas],
+            "observacoes": "Reprovado pelas verificações locais, antes da análise da IA.",
+        })
+        result.metricas = {"modo": "regras_locais", "verificacoes": len(self.verificacoes)}
+        return result
+
+    def texto_prompt(self) -> str:
+        """Bloco para o prompt: o que já foi conferido e não precisa ser refeito pelo modelo."""
+        if not self.verificacoes:
+            return ""
+        linhas = [f"- [{'OK' if v.ok else 'FALHA'}] {v.regra}: {v.mensagem}" for v in self.verificacoes]
+        return (
+            "VERIFICAÇÕES JÁ FEITAS LOCALMENTE (não refaça estes cálculos; "
+            "inclua as falhas em \"erros\"):\n" + "\n".join(linhas)
+        )
+
+
+def parse_data(texto: Any) -> Optional[date]:
+    """Data em DD-MM-AAAA (ou com / ou .); None se vazia/inválida."""
+    if not isinstance(texto, str):
+        return None
+    m = re.search(r"(\d{2})[-/.](\d{2})[-/.](\d{4})", texto)
+    if not m:
+        return None
+    try:
+        return datetime(int(m.group(3)), int(m.group(2)), int(m.group(1))).date()
+    except ValueError:
+        return None
+
+
+def _idade(nascimento: date, em: date) -> int:
+    return em.year - nascimento.year - ((em.month, em.day) < (nascimento.month, nascimento.day))
+
+
+def _dados(extraidos: Dict[str, Dict[str, Any]], prefixo: str) -> List[Dict[str, Any]]:
+    return [d for etapa_id, d in extraidos.items() if etapa_id.startswith(prefixo) and isinstance(d, dict)]
+
+
+# ─── Regras ──────────────────────────────────────────────────────────────────
+
+def _documentos_obrigatorios(rel: RelatorioRegras, transacao: Any) -> None:
+    faltando = [e.titulo for e in transacao.etapas if not e.tem_imagens]
+    rel.adicionar(
+        "Documentos obrigatórios",
+        not faltando,
+        "Documentos obrigatórios presentes." if not faltando
+        else f"Documento obrigatório ausente para {transacao.nome_tipo}: {', '.join(faltando)}.",
+        bloqueante=True,
+    )
+
+
+def _cpfs_digitados(rel: RelatorioRegras, transacao: Any) -> None:
+    for etapa in transacao.etapas:
+        if not etapa.require_cpf:
+            continue
+        ok = validate_cpf(etapa.cpf)
+        rel.adicionar(
+            "CPF",
+            ok,
+            f"CPF de \"{etapa.titulo}\" válido." if ok
+            else f"CPF informado em \"{etapa.titulo}\" é inválido ({etapa.cpf or 'vazio'}).",
+            bloqueante=True,
+        )
+
+
+def _cpfs_extraidos(rel: RelatorioRegras, transacao: Any, extraidos: Dict[str, Dict[str, Any]]) -> None:
+    for etapa in transacao.etapas:
+        dados = extraidos.get(etapa.id)
+        if not etapa.require_cpf or not isinstance(dados, dict) or not dados.get("cpf"):
+            continue
+        lido = str(dados["cpf"])
+        digitos = "".join(c for c in lido if c.isdigit())
+        if not validate_cpf(lido):
+            rel.adicionar("CPF", False, f"CPF no documento de \"{etapa.titulo}\" não confere ({lido}).")
+        elif etapa.cpf and digitos != "".join(c for c in etapa.cpf if c.isdigit()):
+            rel.adicionar(
+                "CPF", False,
+                f"CPF do documento de \"{etapa.titulo}\" ({lido}) difere do informado ({etapa.cpf}).",
+            )
+
+
+def _autorizacao_e_data(rel: RelatorioRegras, autorizacao: str, venda_txt: str, hoje: date, confiavel: bool) -> Optional[date]:
+    if autorizacao:
+        # Aceita com ou sem pontos: o que importa são os 15 dígitos
+        ok = bool(_RE_AUTORIZACAO.match(autorizacao)) or len(re.sub(r"\D", "", autorizacao)) == 15
+        rel.adicionar(
+            "Autorização", ok,
+            "Número de autorização no formato XXX.XXX.XXX.XXX.XXX." if ok
+            else f"Número de autorização fora do formato XXX.XXX.XXX.XXX.XXX ({autorizacao}).",
+            bloqueante=confiavel,
+        )
+    venda = parse_data(venda_txt)
+    if venda_txt and venda is None:
+        rel.adicionar("Data da venda", False, f"Data da venda inválida ({venda_txt}).", bloqueante=confiavel)
+    elif venda is not None:
+        ok = venda <= hoje
+        rel.adicionar(
+            "Data da venda", ok,
+            f"Data da venda {venda:%d-%m-%Y}." if ok else f"Data da venda no futuro ({venda:%d-%m-%Y}).",
+            bloqueante=confiavel,
+        )
+    return venda
+
+
+def _validade_receita(rel: RelatorioRegras, receitas: List[Dict[str, Any]], venda: Optional[date]) -> None:
+    if venda is None:
+        return
+    for receita in receitas:
+        emissao = parse_data(receita.get("data_emissao"))
+        if emissao is None:
+            continue  # sem data legível: fica para o modelo
+        dias = VALIDADE_ANTICONCEPCIONAL_DIAS if receita.get("anticoncepcional") else VALIDADE_RECEITA_DIAS
+        if emissao > venda:
+            rel.adicionar(
+                "Validade da receita", False,
+                f"Receita emitida em {emissao:%d-%m-%Y}, depois da venda ({venda:%d-%m-%Y}).",
+                bloqueante=True,
+            )
+        elif venda > emissao + timedelta(days=dias):
+            rel.adicionar(
+                "Validade da receita", False,
+                f"Receita vencida: emitida em {emissao:%d-%m-%Y}, validade de {dias} dias, venda em {venda:%d-%m-%Y}.",
+                bloqueante=True,
+            )
+        else:
+            rel.adicionar("Validade da receita", True, f"Receita de {emissao:%d-%m-%Y} dentro da validade ({dias} dias).")
+
+
+def _fralda_geriatrica(rel: RelatorioRegras, receitas: List[Dict[str, Any]], ids: List[Dict[str, Any]], venda: Optional[date]) -> None:
+    if venda is None or not any(r.get("fralda_geriatrica") for r in receitas):
+        return
+    if any(r.get("cid") for r in receitas):
+        rel.adicionar("Fraldas geriátricas", True, "CID informado na prescrição.")
+        return
+    nascimentos = [n for n in (parse_data(d.get("data_nascimento")) for d in ids[:1]) if n is not None]
+    if not nascimentos:
+        return  # idade não legível: fica para o modelo
+    idade = _idade(nascimentos[0], venda)
+    rel.adicionar(
+        "Fraldas geriátricas", idade >= IDADE_MINIMA_FRALDA,
+        f"Paciente com {idade} anos." if idade >= IDADE_MINIMA_FRALDA
+        else f"Fralda geriátrica para paciente com {idade} anos sem CID na prescrição.",
+        bloqueante=True,
+    )
+
+
+# ─── Entrada ─────────────────────────────────────────────────────────────────
+
+def avaliar(
+    transacao: Any,
+    extraidos: Optional[Dict[str, Dict[str, Any]]] = None,
+    ocr: Any = None,
+    hoje: Optional[date] = None,
+) -> RelatorioRegras:
+    """
+    Avalia as regras determinísticas de uma transação.
+
+    Args:
+        transacao: Transaction (etapas, CPFs digitados).
+        extraidos: etapa.id -> dados extraídos pela fase 1 do modo duas fases (opcional).
+        ocr: core.ocr_local.ResultadoOCR do cupom (opcional; não bloqueia, pode ler errado).
+        hoje: Data de referência (padrão: hoje).
+    """
+    hoje = hoje or date.today()
+    extraidos = extraidos or {}
+    rel = RelatorioRegras()
+
+    if hasattr(transacao, "etapas"):
+        _documentos_obrigatorios(rel, transacao)
+        _cpfs_digitados(rel, transacao)
+        _cpfs_extraidos(rel, transacao, extraidos)
+
+    cupons = _dados(extraidos, "cupom")
+    if cupons:
+        autorizacao, venda_txt, confiavel = cupons[0].get("autorizacao", ""), cupons[0].get("data", ""), True
+    elif ocr is not None:
+        autorizacao, venda_txt, confiavel = ocr.autorizacao, ocr.data, False
+    else:
+        autorizacao, venda_txt, confiavel = "", "", False
+    venda = _autorizacao_e_data(rel, str(autorizacao or ""), str(venda_txt or ""), hoje, confiavel)
+
+    receitas = _dados(extraidos, "receita")
+    _validade_receita(rel, receitas, venda)
+    _fralda_geriatrica(rel, receitas, _dados(extraidos, "id_"), venda)
+    return rel
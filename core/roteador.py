@@ -0,0 +1,326 @@
+"""
+roteador.py - Auditoria com failover e "hedging" entre provedores de IA.
+
+Usa as chaves já salvas em settings["api_keys"]: cada provedor com chave vira um
+candidato. O primário é escolhido pela saúde recente de cada um (latência e taxa
+de falhas em média móvel exponencial, persistidas em saude_provedores.json).
+
+    - Se o primário falha (429/5xx/timeout esgotados), o próximo assume na hora.
+    - Se o primário passa de `ai_hedge_s` sem responder, o próximo é disparado em
+      paralelo; vale o primeiro resultado válido e o outro é cancelado — a
+      requisição dele é abortada e o resultado não entra no cache nem nas estatísticas.
+    - Erros de configuração (ValueError: chave ausente, provedor desconhecido) não
+      fazem failover: sobem na hora, como em auditar_transacao.
+
+Com ai_failover desligado (padrão) ou apenas uma chave, equivale a auditar_transacao.
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image as PILImage
+
+from core.ai_auditor import (
+    CAMPO_REINICIAR,
+    AuditoriaCancelada,
+    AuditResult,
+    CancelToken,
+    ImagemPreparada,
+    auditar_transacao,
+)
+from core.config import APP_DATA_DIR, AVAILABLE_MODELS
+
+SAUDE_FILE = APP_DATA_DIR / "saude_provedores.json"
+
+# Peso da amostra nova na média móvel exponencial
+ALFA_EWMA = 0.3
+# Latência assumida para provedores ainda sem histórico (s)
+LATENCIA_PADRAO_S = 15.0
+# Quanto uma taxa de falhas de 100% multiplica a latência na pontuação
+PESO_FALHAS = 4.0
+# Desconto na pontuação do provedor escolhido nas configurações (desempate a favor dele)
+PREFERENCIA_CONFIGURADO = 0.75
+# Após 429/sobrecarga, o provedor vai para o fim da fila por este tempo (s)
+ESPERA_SOBRECARGA_S = 60.0
+# Espera padrão antes de disparar o segundo provedor (s)
+DEFAULT_HEDGE_S = 20.0
+# Máximo de provedores rodando ao mesmo tempo para a mesma auditoria
+MAX_SIMULTANEOS = 2
+
+_SOBRECARGA = (429, 503, 529)
+
+
+def _status(e: BaseException) -> Optional[int]:
+    """Status HTTP do erro original (auditar_transacao embrulha em RuntimeError)."""
+    atual: Optional[BaseException] = e
+    while atual is not None:
+        code = getattr(atual, "status_code", None) or getattr(atual, "code", None)
+        if isinstance(code, int):
+            return code
+        atual = atual.__cause__
+    return None
+
+
+def _definitivo(e: BaseException) -> bool:
+    """Erro de configuração (ValueError que não é JSON inválido): outro provedor não resolve."""
+    atual: Optional[BaseException] = e
+    while atual is not None:
+        if isinstance(atual, ValueError) and not isinstance(atual, json.JSONDecodeError):
+            return True
+        atual = atual.__cause__
+    return False
+
+
+class SaudeProvedores:
+    """Latência e taxa de falhas (EWMA) por provedor, compartilhadas pelo processo."""
+
+    def __init__(self, arquivo=SAUDE_FILE) -> None:
+        self.arquivo = arquivo
+        self._lock = threading.Lock()
+        self._dados: Dict[str, Dict[str, float]] = {}
+        try:
+            dados = json.loads(self.arquivo.read_text(encoding="utf-8"))
+            if isinstance(dados, dict):
+                self._dados = {p: dict(v) for p, v in dados.items() if isinstance(v, dict)}
+        except (OSError, ValueError):
+            pass
+
+    def _item(self, provider: str) -> Dict[str, float]:
+        return self._dados.setdefault(
+            provider, {"latencia_s": LATENCIA_PADRAO_S, "falhas": 0.0, "amostras": 0, "espera_ate": 0.0}
+        )
+
+    def _salvar(self) -> None:
+        try:
+            self.arquivo.write_text(json.dumps(self._dados, indent=2), encoding="utf-8")
+        except OSError:
+            pass  # estatística é só uma otimização
+
+    def registrar_sucesso(self, provider: str, latencia_s: float) -> None:
+        with self._lock:
+            item = self._item(provider)
+            if item["amostras"]:
+                item["latencia_s"] += ALFA_EWMA * (latencia_s - item["latencia_s"])
+            else:
+                item["latencia_s"] = latencia_s
+            item["falhas"] *= 1 - ALFA_EWMA
+            item["amostras"] += 1
+            self._salvar()
+
+    def registrar_lentidao(self, provider: str, decorrido_s: float) -> None:
+        """Tentativa cancelada por ter perdido a corrida: conta só como latência (mínima)."""
+        with self._lock:
+            item = self._item(provider)
+            if decorrido_s > item["latencia_s"]:
+                item["latencia_s"] += ALFA_EWMA * (decorrido_s - item["latencia_s"])
+                self._salvar()
+
+    def registrar_falha(self, provider: str, erro: BaseException) -> None:
+        with self._lock:
+            item = self._item(provider)
+            item["falhas"] += ALFA_EWMA * (1 - item["falhas"])
+            item["amostras"] += 1
+            if _status(erro) in _SOBRECARGA:
+                item["espera_ate"] = time.time() + ESPERA_SOBRECARGA_S
+            self._salvar()
+
+    def pontuacao(self, provider: str, preferido: str = "") -> float:
+        """Menor é melhor: latência esperada inflada pela taxa de falhas."""
+        with self._lock:
+            item = self._item(provider)
+            pontos = item["latencia_s"] * (1 + PESO_FALHAS * item["falhas"])
+            if item["espera_ate"] > time.time():
+                pontos += 1e6
+        return pontos * (PREFERENCIA_CONFIGURADO if provider == preferido else 1.0)
+
+    def ordenar(self, providers: List[str], preferido: str = "") -> List[str]:
+        return sorted(providers, key=lambda p: self.pontuacao(p, preferido))
+
+    def resumo(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {p: dict(v) for p, v in self._dados.items()}
+
+
+_saude: Optional[SaudeProvedores] = None
+_saude_lock = threading.Lock()
+
+
+def get_saude() -> SaudeProvedores:
+    global _saude
+    with _saude_lock:
+        if _saude is None:
+            _saude = SaudeProvedores()
+        return _saude
+
+
+def candidatos(settings: dict[str, Any]) -> List[Tuple[str, str]]:
+    """(provedor, modelo) de cada provedor com chave, do mais saudável para o menos."""
+    configurado = settings.get("ai_provider", "gemini")
+    chaves = settings.get("api_keys", {})
+    providers = [p for p in AVAILABLE_MODELS if chaves.get(p)]
+    if not settings.get("ai_failover", False) or len(providers) < 2:
+        return [(configurado, settings.get("ai_model", "gemini-2.0-flash"))]
+
+    modelos = settings.get("ai_modelos", {})
+    resultado = []
+    for p in get_saude().ordenar(providers, configurado):
+        if p == configurado:
+            modelo = settings.get("ai_model", "")
+        else:
+            modelo = modelos.get(p) or AVAILABLE_MODELS[p][0]
+        resultado.append((p, modelo))
+    return resultado
+
+
+def auditar(
+    images: List[PILImage.Image],
+    tipo_transacao: str,
+    settings: dict[str, Any],
+    usar_cache: bool = True,
+    cancel: CancelToken | None = None,
+    on_campo: Callable[[str, Any], None] | None = None,
+    preparadas: List[ImagemPreparada] | None = None,
+    contexto: str = "",
+) -> AuditResult:
+    """
+    Mesma interface (e erros) de auditar_transacao, com failover/hedging entre os
+    provedores que têm chave. `preparadas` só é usada pelo provedor configurado
+    (a codificação das imagens depende do provedor).
+    """
+    lista = candidatos(settings)
+    if len(lista) == 1:
+        return auditar_transacao(
+            images, tipo_transacao, settings, usar_cache=usar_cache, cancel=cancel,
+            on_campo=on_campo, preparadas=preparadas, contexto=contexto,
+        )
+
+    saude = get_saude()
+    hedge_s = float(settings.get("ai_hedge_s", DEFAULT_HEDGE_S))
+    fila: "queue.Queue[Tuple[int, Optional[AuditResult], Optional[BaseException], float]]" = queue.Queue()
+    tokens: List[CancelToken] = []
+    inicios: Dict[int, float] = {}
+    # Tentativa cujos campos aparecem na tela; se ela falhar, a próxima que
+    # transmitir assume e a tela é limpa antes (CAMPO_REINICIAR)
+    stream: Dict[str, Any] = {"dono": None, "falhos": set()}
+    lock = threading.Lock()
+
+    def repassar(indice: int) -> Optional[Callable[[str, Any], None]]:
+        if on_campo is None:
+            return None
+
+        def _on_campo(campo: str, valor: Any) -> None:
+            reiniciar = False
+            with lock:
+                if stream["dono"] is None and indice not in stream["falhos"]:
+                    stream["dono"] = indice
+                    reiniciar = bool(stream["falhos"])
+                if stream["dono"] != indice:
+                    return
+            if reiniciar and campo != CAMPO_REINICIAR:
+                on_campo(CAMPO_REINICIAR, None)
+            on_campo(campo, valor)
+
+        return _on_campo
+
+    def iniciar(indice: int) -> None:
+        provider, model = lista[indice]
+        token = CancelToken()
+        # Cliente próprio: cancelar a tentativa perdedora derruba a requisição dela
+        token.cliente_proprio = True
+        tokens.append(token)
+        inicios[indice] = time.perf_counter()
+        config = {**settings, "ai_provider": provider, "ai_model": model}
+        if provider != settings.get("ai_provider"):
+            # Os modelos da cascata configurados são do provedor principal; os demais
+            # usam os pares de MODELOS_CASCATA
+            config.update(ai_modelo_rapido="", ai_modelo_premium="")
+        print(f"[Roteador] tentativa {indice + 1}: {provider}/{model}")
+
+        def run() -> None:
+            t0 = time.perf_counter()
+            try:
+                result = auditar_transacao(
+                    images, tipo_transacao, config, usar_cache=usar_cache, cancel=token,
+                    on_campo=repassar(indice),
+                    preparadas=preparadas if provider == settings.get("ai_provider") else None,
+                    contexto=contexto,
+                )
+                fila.put((indice, result, None, time.perf_counter() - t0))
+            except Exception as e:
+                fila.put((indice, None, e, time.perf_counter() - t0))
+
+        threading.Thread(target=run, daemon=True, name=f"roteador-{provider}").start()
+
+    def cancelar_todos() -> None:
+        for token in tokens:
+            token.cancel()
+
+    inicio = time.perf_counter()
+    iniciar(0)
+    proximo = 1
+    pendentes = {0}
+    prazo = time.monotonic() + hedge_s
+    erros: List[BaseException] = []
+    historico: List[dict[str, Any]] = []
+
+    while True:
+        if cancel is not None and cancel.cancelado:
+            cancelar_todos()
+            cancel.verificar()
+        try:
+            indice, result, erro, decorrido = fila.get(timeout=0.2)
+        except queue.Empty:
+            if proximo < len(lista) and len(pendentes) < MAX_SIMULTANEOS and time.monotonic() >= prazo:
+                print(f"[Roteador] sem resposta em {hedge_s:.0f}s, disparando {lista[proximo][0]} em paralelo")
+                iniciar(proximo)
+                pendentes.add(proximo)
+                proximo += 1
+                prazo = time.monotonic() + hedge_s
+            continue
+
+        pendentes.discard(indice)
+        provider, model = lista[indice]
+        if erro is not None:
+            with lock:
+                stream["falhos"].add(indice)
+                if stream["dono"] == indice:
+                    stream["dono"] = None
+            if _definitivo(erro):
+                cancelar_todos()
+                raise erro
+        if erro is None and result is not None:
+            if not result.do_cache:
+                saude.registrar_sucesso(provider, decorrido)
+            historico.append({"provedor": provider, "modelo": model, "ok": True, "s": round(decorrido, 3)})
+            cancelar_todos()
+            agora = time.perf_counter()
+            for i in pendentes:
+                saude.registrar_lentidao(lista[i][0], agora - inicios[i])
+            result.metricas["roteamento"] = {
+                "provedor": provider,
+                "modelo": model,
+                "tentativas": historico,
+                "total_s": round(agora - inicio, 3),
+            }
+            return result
+
+        if not isinstance(erro, AuditoriaCancelada):
+            saude.registrar_falha(provider, erro)
+            historico.append({"provedor": provider, "modelo": model, "ok": False, "erro": str(erro)})
+            erros.append(erro)
+            print(f"[Roteador] {provider} falhou: {erro}")
+        if proximo < len(lista):
+            # Falhou antes do prazo: o próximo assume na hora
+            iniciar(proximo)
+            pendentes.add(proximo)
+            proximo += 1
+            prazo = time.monotonic() + hedge_s
+        elif not pendentes:
+            if erros:
+                raise erros[0]
+            raise AuditoriaCancelada("Auditoria cancelada pelo usuário.")
@@ -6,12 +6,13 @@ Fallback: importar imagens de arquivos locais.
 
 from __future__ import annotations
 
-import io
 from typing import List, Optional
 
 import pythoncom  # type: ignore[import-untyped]
 from PIL import Image
 
+from core.jpeg_passthrough import abrir_arquivo, abrir_imagem, preservar
+
 
 def list_scanners() -> List[str]:
     """
@@ -96,8 +97,8 @@ def scan_page(device_name: str, dpi: int = 200) -> tuple[Optional[Image.Image],
         # JPEG GUID
         image_file = scan_item.Transfer("{B96B3CAB-0728-11D3-9D7B-0000F81EF32E}")
         data = bytes(image_file.FileData.BinaryData)
-        img = Image.open(io.BytesIO(data))
-        return img.convert("RGB"), None
+        # Guarda o JPEG do scanner para ir ao PDF sem recodificar
+        return abrir_imagem(data), None
 
     except Exception as e:
         error_msg = str(e)
@@ -126,8 +127,7 @@ def scan_with_dialog() -> Optional[Image.Image]:
         )
         if image_file:
             data = bytes(image_file.FileData.BinaryData)
-            img = Image.open(io.BytesIO(data))
-            return img.convert("RGB")
+            return abrir_imagem(data)
     except Exception as e:
         print(f"[Scanner] Erro no diálogo WIA: {e}")
     return None
@@ -163,8 +163,7 @@ def import_from_file(parent_window: object = None) -> Optional[Image.Image]:
 
     if filepath:
         try:
-            img = Image.open(filepath)
-            return img.convert("RGB")
+            return abrir_arquivo(filepath)
         except Exception as e:
             print(f"[Scanner] Erro ao importar arquivo: {e}")
 
@@ -174,15 +173,17 @@ def import_from_file(parent_window: object = None) -> Optional[Image.Image]:
 def optimize_image(img: Image.Image, max_size: int = 2480) -> Image.Image:
     """
     Otimiza a imagem para o PDF: redimensiona mantendo proporção se necessário.
+    Se não precisar redimensionar, mantém os bytes JPEG originais (pass-through).
     """
+    original = img
     img = img.convert("RGB")
     w, h = img.size
-    if max(w, h) > max_size:
-        if w > h:
-            new_w = max_size
-            new_h = int(h * max_size / w)
-        else:
-            new_h = max_size
-            new_w = int(w * max_size / h)
-        img = img.resize((new_w, new_h), Image.LANCZOS)
-    return img
+    if max(w, h) <= max_size:
+        return preservar(original, img)
+    if w > h:
+        new_w = max_size
+        new_h = int(h * max_size / w)
+    else:
+        new_h = max_size
+        new_w = int(w * max_size / h)
+    return img.resize((new_w, new_h), Image.LANCZOS)
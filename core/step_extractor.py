@@ -0,0 +1,248 @@
+"""
+step_extractor.py - Auditoria em duas fases (modo opcional).
+
+Fase 1: cada ScanStep é enviado isoladamente, em paralelo, com um prompt curto
+de extração (cupom → autorização/data; receita → CRM/data/medicamento;
+identificação → CPF/nome). Cada resultado é cacheado por etapa, então
+redigitalizar uma etapa só refaz a extração dela.
+
+Fase 2: uma auditoria apenas textual aplica as regras do master_prompt.md
+sobre os dados extraídos de todas as etapas.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+from core import limitador, regras_locais
+from core.ai_auditor import (
+    ESQUEMA_AUDITORIA,
+    AuditResult,
+    AuditoriaCancelada,
+    CancelToken,
+    chamar_provedor,
+    preparar_imagens,
+    prompt_de_sistema,
+)
+from core.audit_cache import AuditCache, build_cache_key
+from core.config import get_active_api_key, get_master_prompt
+from core.transaction import ScanStep, Transaction
+
+
+# Máximo de chamadas de extração simultâneas
+MAX_WORKERS = 4
+
+_CAMPOS_COMUNS = """
+  "legivel": true ou false,
+  "rasuras": true ou false,
+  "observacoes": "qualquer irregularidade visível (rasura, carimbo de fornecido, etc.)"
+"""
+
+# Prompt de extração por tipo de etapa (chave = prefixo do ScanStep.id)
+PROMPTS_EXTRACAO: dict[str, str] = {
+    "cupom": """Você está lendo o Cupom Fiscal e o Cupom Vinculado de uma venda do Programa Farmácia Popular.
+Extraia os dados e responda APENAS com JSON válido, sem markdown:
+{
+  "cupom_fiscal_presente": true ou false,
+  "cupom_vinculado_presente": true ou false,
+  "autorizacao": "número de autorização (ex: 111.222.333.444.555) ou vazio",
+  "data": "data da venda DD-MM-AAAA ou vazio",
+  "endereco_beneficiario_preenchido": true ou false,
+  "assinado": true ou false,
+  "impressao_digital": true ou false,
+  "nome_beneficiario": "nome ou vazio",
+  "medicamentos": ["itens vendidos"],""" + _CAMPOS_COMUNS + "}",
+
+    "receita": """Você está lendo uma Receita Médica, Laudo ou Atestado.
+Extraia os dados e responda APENAS com JSON válido, sem markdown:
+{
+  "nome_paciente": "nome completo ou vazio",
+  "endereco_paciente": "endereço ou vazio",
+  "data_emissao": "DD-MM-AAAA ou vazio",
+  "medicamentos": ["medicamentos prescritos"],
+  "anticoncepcional": true ou false,
+  "fralda_geriatrica": true ou false,
+  "cid": "código CID ou vazio",
+  "medico_nome": "nome ou vazio",
+  "crm": "número do CRM ou vazio",
+  "assinatura_medico": true ou false,
+  "carimbo_legivel": true ou false,
+  "endereco_consultorio": "endereço completo ou vazio",
+  "carimbo_fornecido": true ou false,""" + _CAMPOS_COMUNS + "}",
+
+    "id": """Você está lendo um documento de identificação (RG, CNH, Certidão de Nascimento ou similar).
+Extraia os dados e responda APENAS com JSON válido, sem markdown:
+{
+  "tipo_documento": "RG, CNH, Certidão de Nascimento, etc.",
+  "oficial_com_foto": true ou false,
+  "nome": "nome completo ou vazio",
+  "cpf": "CPF ou vazio",
+  "data_nascimento": "DD-MM-AAAA ou vazio",
+  "filiacao": ["nomes dos pais"],
+  "possui_assinatura": true ou false,""" + _CAMPOS_COMUNS + "}",
+
+    "procuracao": """Você está lendo um documento de representação legal (procuração ou sentença judicial).
+Extraia os dados e responda APENAS com JSON válido, sem markdown:
+{
+  "tipo": "procuração pública, procuração particular, sentença judicial ou outro",
+  "firma_reconhecida": true ou false,
+  "outorgante": "nome ou vazio",
+  "outorgado": "nome ou vazio",
+  "poderes_programa": true ou false,""" + _CAMPOS_COMUNS + "}",
+}
+
+
+def _prompt_para_etapa(etapa: ScanStep) -> str:
+    chave = "id" if etapa.id.startswith("id_") else etapa.id
+    base = PROMPTS_EXTRACAO.get(chave)
+    if base is None:
+        base = (
+            "Descreva o conteúdo relevante deste documento para auditoria do PFPB.\n"
+            "Responda APENAS com JSON válido, sem markdown: {\"resumo\": \"...\","
+            + _CAMPOS_COMUNS + "}"
+        )
+    return f"Etapa: {etapa.titulo}\n\n{base}"
+
+
+def extrair_etapa(
+    etapa: ScanStep,
+    settings: dict[str, Any],
+    cache: AuditCache | None = None,
+    usar_cache: bool = True,
+    cancel: CancelToken | None = None,
+) -> dict[str, Any]:
+    """Executa (ou recupera do cache) a extração de uma única etapa."""
+    provider: str = settings.get("ai_provider", "gemini")
+    model: str = settings.get("ai_model", "gemini-2.0-flash")
+    api_key: str = get_active_api_key(settings)
+    prompt = _prompt_para_etapa(etapa)
+    limitador.configurar(settings)
+
+    key = ""
+    if cache is not None:
+        key = build_cache_key(etapa.imagens, f"etapa:{etapa.id}", prompt, provider, model)
+        if usar_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+    preparadas = preparar_imagens(etapa.imagens, provider, model, settings)
+    dados = chamar_provedor(provider, preparadas, prompt, api_key, model, cancel=cancel)
+
+    if cache is not None:
+        cache.put(key, dados, meta={"etapa": etapa.id, "provider": provider, "model": model})
+    return dados
+
+
+def _build_consolidation_prompt(
+    tipo_transacao: str,
+    extraidos: List[dict[str, Any]],
+    verificacoes: str = "",
+) -> str:
+    """Parte variável da consolidação; as regras vão no prompt de sistema (ai_auditor.prompt_de_sistema)."""
+    dados = json.dumps(extraidos, ensure_ascii=False, indent=2)
+    return f"""
+INSTRUÇÕES ADICIONAIS PARA ESTA ANÁLISE:
+
+Você está auditando um dossiê de transação do tipo: **{tipo_transacao}**
+Os documentos já foram lidos individualmente; abaixo estão os dados extraídos de cada etapa.
+Aplique as regras das instruções de sistema SOMENTE com base nesses dados. Quando uma
+verificação depender de comparação visual não disponível (ex: semelhança de assinaturas),
+registre em "observacoes".
+
+DADOS EXTRAÍDOS:
+{dados}
+{chr(10) + verificacoes if verificacoes else ""}
+""".strip()
+
+
+def auditar_em_duas_fases(
+    transacao: Transaction,
+    settings: dict[str, Any],
+    usar_cache: bool = True,
+    cancel: CancelToken | None = None,
+) -> AuditResult:
+    """
+    Audita a transação em duas fases (extração paralela por etapa + consolidação textual).
+    Mesma interface de erros de auditar_transacao().
+    """
+    provider: str = settings.get("ai_provider", "gemini")
+    model: str = settings.get("ai_model", "gemini-2.0-flash")
+    api_key: str = get_active_api_key(settings)
+
+    if not api_key:
+        raise ValueError(f"Chave de API não configurada para o provedor '{provider}'.")
+
+    etapas = [e for e in transacao.etapas if e.tem_imagens]
+    if not etapas:
+        raise ValueError("Nenhuma imagem para auditar.")
+
+    cache: AuditCache | None = None
+    if settings.get("audit_cache_enabled", True):
+        cache = AuditCache.from_settings(settings)
+
+    try:
+        t0 = time.perf_counter()
+        workers = max(1, min(MAX_WORKERS, len(etapas)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futuros = [
+                pool.submit(extrair_etapa, etapa, settings, cache, usar_cache, cancel)
+                for etapa in etapas
+            ]
+            extraidos = [
+                {"etapa": etapa.id, "titulo": etapa.titulo, "dados": fut.result()}
+                for etapa, fut in zip(etapas, futuros)
+            ]
+        t1 = time.perf_counter()
+
+        # Regras determinísticas sobre os dados extraídos: se já reprovam, a consolidação é dispensada
+        relatorio = regras_locais.avaliar(transacao, {e["etapa"]: e["dados"] for e in extraidos})
+        if relatorio.reprovado:
+            cupom = next((e["dados"] for e in extraidos if e["etapa"].startswith("cupom")), {})
+            cupom = cupom if isinstance(cupom, dict) else {}
+            result = relatorio.como_resultado(str(cupom.get("autorizacao") or ""), str(cupom.get("data") or ""))
+            result.metricas.update({"etapas": len(etapas), "extracao_s": round(t1 - t0, 3)})
+            return result
+
+        sistema = prompt_de_sistema(get_master_prompt())
+        prompt = _build_consolidation_prompt(transacao.nome_tipo, extraidos, relatorio.texto_prompt())
+
+        key = ""
+        raw: dict[str, Any] | None = None
+        uso: dict[str, int] = {}
+        if cache is not None:
+            key = build_cache_key([], transacao.nome_tipo, f"{sistema}\n{prompt}", provider, model)
+            if usar_cache:
+                raw = cache.get(key)
+        do_cache = raw is not None
+        if raw is None:
+            raw = chamar_provedor(
+                provider, [], prompt, api_key, model, cancel=cancel,
+                sistema=sistema, uso=uso, esquema=ESQUEMA_AUDITORIA,
+            )
+            if cache is not None:
+                cache.put(key, raw, meta={"fase": "consolidacao", "provider": provider, "model": model})
+        t2 = time.perf_counter()
+
+        result = AuditResult(raw)
+        result.do_cache = do_cache
+        result.metricas = {
+            "modo": "duas_fases",
+            "etapas": len(etapas),
+            "extracao_s": round(t1 - t0, 3),
+            "consolidacao_s": round(t2 - t1, 3),
+            **uso,
+        }
+        return result
+
+    except AuditoriaCancelada:
+        raise
+    except json.JSONDecodeError as e:
+        raise RuntimeError(
+            f"A IA retornou uma resposta inválida (não é JSON). Detalhes: {e}"
+        ) from e
+    except Exception as e:
+        raise RuntimeError(f"Erro durante a auditoria: {e}") from e
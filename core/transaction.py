@@ -1,14 +1,21 @@
 """
 transaction.py - Define os 3 tipos de transação e suas etapas de digitalização.
+
+As páginas ficam em disco (core.page_store) desde a captura; ScanStep.imagens e
+todas_imagens() decodificam sob demanda. Troca de etapa e CPF também vão para o
+diário da sessão, então uma transação interrompida pode ser retomada.
 """
 
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import List
+from pathlib import Path
+from typing import Callable, List, Optional, Union
 
 from PIL import Image
 
+from core.page_store import Duplicata, ListaPaginas, PageStore, Pagina
+
 
 @dataclass
 class ScanStep:
@@ -17,17 +24,34 @@ class ScanStep:
     titulo: str
     descricao: str
     icone: str = "📄"
-    imagens: List[Image.Image] = field(default_factory=list)
+    imagens: ListaPaginas = field(default_factory=ListaPaginas)
     require_cpf: bool = False
     cpf: str = ""
 
-    def adicionar_imagem(self, imagem: Image.Image) -> None:
+    def __post_init__(self) -> None:
+        if not isinstance(self.imagens, ListaPaginas):
+            self.imagens = ListaPaginas(self.imagens)
+
+    def adicionar_imagem(self, imagem: Union[Image.Image, Pagina]) -> List[Duplicata]:
+        """
+        Acrescenta uma imagem ou uma Pagina já gravada com PageStore.gravar().
+        Retorna as páginas da transação que parecem ser a mesma folha (hash perceptual).
+        """
         self.imagens.append(imagem)
+        store = self.imagens.store
+        if store is None:
+            return []
+        return store.semelhantes(self.imagens.paginas[-1])
 
     def remover_imagem(self, index: int) -> None:
         if 0 <= index < len(self.imagens):
             self.imagens.pop(index)
 
+    def definir_cpf(self, cpf: str) -> None:
+        self.cpf = cpf
+        if self.imagens.store is not None:
+            self.imagens.store.registrar("cpf", etapa=self.id, cpf=cpf)
+
     @property
     def tem_imagens(self) -> bool:
         return len(self.imagens) > 0
@@ -44,6 +68,49 @@ class Transaction:
     nome_tipo: str
     etapas: List[ScanStep]
     etapa_atual_index: int = 0
+    # Páginas gravadas em disco (criado automaticamente)
+    store: Optional[PageStore] = field(default=None, repr=False, compare=False)
+    # Callbacks chamados com a etapa recém-concluída (ex: pipeline de auditoria em background)
+    _ouvintes: List[Callable[[ScanStep], None]] = field(
+        default_factory=list, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        if self.store is None:
+            self.store = PageStore()
+        self.store.meta["tipo"] = self.tipo
+        for etapa in self.etapas:
+            etapa.imagens.vincular(self.store, etapa.id)
+
+    def usar_store(self, store: PageStore) -> None:
+        """Adota uma sessão gravada (páginas, etapa atual e CPFs), ex: após queda do app."""
+        self.store = store
+        store.meta["tipo"] = self.tipo
+        for etapa in self.etapas:
+            etapa.imagens = ListaPaginas(store.paginas_da_etapa(etapa.id), store, etapa.id)
+            etapa.cpf = store.estado["cpfs"].get(etapa.id, "")
+        self.etapa_atual_index = min(int(store.estado["etapa_atual_index"]), self.total_etapas)
+
+    def finalizar(self) -> None:
+        """Marca a sessão como concluída (PDF gerado): não será oferecida para recuperação."""
+        if self.store is not None and self.store.journal.exists():
+            self.store.registrar("finalizada")
+
+    def descartar(self) -> None:
+        """Apaga as páginas gravadas desta transação."""
+        if self.store is not None:
+            self.store.descartar()
+
+    def on_etapa_concluida(self, callback: Callable[[ScanStep], None]) -> None:
+        """Registra um callback chamado sempre que uma etapa é concluída em avancar_etapa()."""
+        self._ouvintes.append(callback)
+
+    def _notificar_etapa_concluida(self, etapa: ScanStep) -> None:
+        for callback in list(self._ouvintes):
+            try:
+                callback(etapa)
+            except Exception as e:
+                print(f"[Transaction] Falha no ouvinte de etapa: {e}")
 
     @property
     def etapa_atual(self) -> ScanStep:
@@ -63,17 +130,25 @@ class Transaction:
 
     def avancar_etapa(self) -> bool:
         """Avança para a próxima etapa. Retorna False se já está na última."""
+        if self.etapa_atual_index < self.total_etapas:
+            self._notificar_etapa_concluida(self.etapa_atual)
         if self.etapa_atual_index < self.total_etapas - 1:
             self.etapa_atual_index += 1
+            self._registrar_etapa()
             return True
         self.etapa_atual_index = self.total_etapas  # marca como concluída
+        self._registrar_etapa()
         return False
 
-    def todas_imagens(self) -> List[Image.Image]:
-        """Retorna todas as imagens de todas as etapas, em ordem."""
-        todas: List[Image.Image] = []
+    def _registrar_etapa(self) -> None:
+        if self.store is not None:
+            self.store.registrar("etapa", indice=self.etapa_atual_index)
+
+    def todas_imagens(self) -> ListaPaginas:
+        """Retorna todas as imagens de todas as etapas, em ordem (decodificadas sob demanda)."""
+        todas = ListaPaginas()
         for etapa in self.etapas:
-            todas.extend(etapa.imagens)
+            todas = todas + etapa.imagens
         return todas
 
     def resumo_etapas(self) -> List[dict]:  # type: ignore[type-arg]
@@ -264,3 +339,18 @@ def criar_transacao(tipo: int) -> Transaction:
     if tipo not in FABRICAS_TRANSACAO:
         raise ValueError(f"Tipo de transação inválido: {tipo}")
     return FABRICAS_TRANSACAO[tipo]()
+
+
+def recuperar_transacao(diretorio: Path) -> Transaction:
+    """Recria a transação de uma sessão gravada em disco (core.page_store.listar_sessoes)."""
+    return transacao_da_sessao(PageStore.abrir(diretorio))
+
+
+def transacao_da_sessao(store: PageStore) -> Transaction:
+    """Recria a transação a partir de uma sessão já aberta (ex: core.page_store.sessao_pendente)."""
+    tipo = store.meta.get("tipo")
+    if tipo not in FABRICAS_TRANSACAO:
+        raise ValueError(f"Sessão sem tipo de transação válido: {store.diretorio}")
+    transacao = FABRICAS_TRANSACAO[tipo]()
+    transacao.usar_store(store)
+    return transacao
@@ -37,6 +37,10 @@ class UsageManager:
             self._save()
         return self.data.get("count", 0)
 
+    def limite_atingido(self, limite: int) -> bool:
+        """True se as auditorias de hoje já chegaram ao `limite` da licença (0 = sem limite)."""
+        return limite > 0 and self.get_count() >= limite
+
     def increment(self) -> None:
         """Incrementa o contador de hoje."""
         self.get_count() # Garante que a data está atualizada
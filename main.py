@@ -5,6 +5,7 @@ Verifica licença antes de abrir a aplicação principal.
 
 from __future__ import annotations
 
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -69,4 +70,6 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos da auditoria em lote no executável (PyInstaller)
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,59 @@
+"""Testes da deduplicação de páginas da pasta CPFs (BlobStore.guardar)."""
+
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from core.blob_store import BlobStore, dhash
+
+
+def _formulario(texto: str) -> Image.Image:
+    """Página branca com o mesmo "modelo" (moldura) e um conteúdo pequeno variável."""
+    img = Image.new("L", (400, 560), 255)
+    desenho = ImageDraw.Draw(img)
+    desenho.rectangle((20, 20, 380, 540), outline=0, width=6)
+    desenho.rectangle((20, 20, 380, 90), fill=0)
+    desenho.text((40, 300), texto, fill=0)
+    return img
+
+
+def _bytes(img: Image.Image, **opcoes) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", **opcoes)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / "CPFs", caminho=tmp_path / "blobs.sqlite")
+
+
+def _blobs(store: BlobStore) -> int:
+    return len(list(store.diretorio.rglob("*.jpg")))
+
+
+def test_mesmos_bytes_reaproveitam_o_blob(store):
+    img = _formulario("111.222.333-44")
+    data = _bytes(img)
+    assert store.guardar(img, data) == store.guardar(img, data)
+    assert _blobs(store) == 1
+
+
+def test_mesmos_pixels_em_outra_codificacao_reaproveitam_o_blob(store):
+    img = _formulario("111.222.333-44")
+    a, b = _bytes(img, compress_level=1), _bytes(img, compress_level=9)
+    assert a != b
+    assert store.guardar(img, a) == store.guardar(img, b)
+    assert _blobs(store) == 1
+
+
+def test_mesmo_modelo_com_conteudo_diferente_nao_deduplica(store):
+    img_a, img_b = _formulario("111.222.333-44"), _formulario("555.666.777-88")
+    # O hash perceptual não enxerga a diferença; a deduplicação não pode depender dele
+    assert dhash(img_a) == dhash(img_b)
+    sha_a = store.guardar(img_a, _bytes(img_a))
+    sha_b = store.guardar(img_b, _bytes(img_b))
+    assert sha_a != sha_b
+    assert _blobs(store) == 2
+    assert store.relatorio().semelhantes == 2
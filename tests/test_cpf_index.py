@@ -0,0 +1,38 @@
+"""Testes de normalização de CPF e da pasta em shards da pasta CPFs."""
+
+import pytest
+
+from core.cpf_index import interpretar_nome, normalizar_cpf, pasta_shard
+
+
+@pytest.mark.parametrize("cpf", ["529.982.247-25", "52998224725", " 529 982 247 25 "])
+def test_normalizar_cpf(cpf):
+    assert normalizar_cpf(cpf) == "52998224725"
+
+
+def test_pasta_shard():
+    assert pasta_shard("529.982.247-25") == "52/99"
+    assert pasta_shard("00000000191") == "00/00"
+
+
+@pytest.mark.parametrize("cpf", ["", "abc.def.ghi-jk", "529.982.247", "-"])
+def test_pasta_shard_recusa_cpf_incompleto(cpf):
+    # Com menos de 11 dígitos o shard sairia "/" (raiz do disco)
+    with pytest.raises(ValueError):
+        pasta_shard(cpf)
+
+
+def test_interpretar_nome():
+    assert interpretar_nome("529.982.247-25_pag2.jpg") == ("52998224725", 2)
+    assert interpretar_nome("52998224725.JPG") == ("52998224725", 0)
+    assert interpretar_nome("leia-me.txt") is None
+
+
+def test_save_cpf_document_valida_antes_de_gravar(tmp_path):
+    from PIL import Image
+
+    from core.cpf_manager import save_cpf_document
+
+    with pytest.raises(ValueError):
+        save_cpf_document("529.982.247", Image.new("RGB", (8, 8)), {"output_folder": str(tmp_path)})
+    assert list(tmp_path.iterdir()) == []
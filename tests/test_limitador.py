@@ -0,0 +1,128 @@
+"""Testes do balde de requisições/tokens compartilhado (core.limitador)."""
+
+import json
+import time
+
+import pytest
+
+from core import limitador
+from core.ai_auditor import AuditoriaCancelada, CancelToken
+from core.limitador import CONCORRENCIA_INICIAL, Limitador
+
+
+class _Erro429(Exception):
+    status_code = 429
+
+    class response:
+        headers = {"Retry-After": "30", "x-ratelimit-remaining-tokens": "100"}
+
+
+def _estado(lim: Limitador) -> dict:
+    return json.loads(lim.caminho.read_text(encoding="utf-8"))
+
+
+def _cancelado() -> CancelToken:
+    token = CancelToken()
+    token.cancel()
+    return token
+
+
+def test_balde_de_requisicoes(tmp_path):
+    lim = Limitador(tmp_path / "l.json", rpm=2, tpm=0)
+    for _ in range(2):
+        lim.liberar(lim.adquirir(0))
+    inicio = time.monotonic()
+    with pytest.raises(AuditoriaCancelada):
+        lim.adquirir(0, _cancelado())
+    assert time.monotonic() - inicio < 1
+
+
+def test_tokens_sao_corrigidos_pelo_uso_real(tmp_path):
+    lim = Limitador(tmp_path / "l.json", rpm=0, tpm=10_000)
+    reserva = lim.adquirir(4_000)
+    assert _estado(lim)["tok"] == pytest.approx(6_000, abs=5)
+    lim.liberar(reserva, tokens_reais=1_000)
+    assert _estado(lim)["tok"] == pytest.approx(9_000, abs=5)
+    # Pedido maior que o balde inteiro espera só pelo balde cheio, não para sempre
+    with pytest.raises(AuditoriaCancelada):
+        lim.adquirir(50_000, _cancelado())
+    cheio = Limitador(tmp_path / "cheio.json", rpm=0, tpm=10_000)
+    assert cheio.adquirir(50_000, _cancelado()).tokens == 10_000
+
+
+def test_concorrencia_limitada(tmp_path):
+    lim = Limitador(tmp_path / "l.json", rpm=1000, tpm=0)
+    reservas = [lim.adquirir(0) for _ in range(int(CONCORRENCIA_INICIAL))]
+    with pytest.raises(AuditoriaCancelada):
+        lim.adquirir(0, _cancelado())
+    lim.liberar(reservas.pop())
+    reservas.append(lim.adquirir(0, _cancelado()))
+
+
+def test_429_reduz_concorrencia_e_pausa(tmp_path):
+    lim = Limitador(tmp_path / "l.json", rpm=1000, tpm=100_000)
+    lim.liberar(lim.adquirir(10), _Erro429())
+    estado = _estado(lim)
+    assert estado["limite"] == CONCORRENCIA_INICIAL / 2
+    assert estado["pausa_ate"] - time.time() == pytest.approx(30, abs=2)
+    assert estado["tok"] <= 100
+    with pytest.raises(AuditoriaCancelada):
+        lim.adquirir(0, _cancelado())
+
+
+def test_cabecalhos_de_sucesso_ajustam_o_balde(tmp_path):
+    lim = Limitador(tmp_path / "l.json", rpm=1000, tpm=100_000)
+    lim.liberar(lim.adquirir(10), cabecalhos={
+        "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "20s",
+        "x-ratelimit-remaining-tokens": "500",
+    })
+    estado = _estado(lim)
+    assert estado["req"] <= 0
+    assert estado["tok"] <= 500
+    assert estado["pausa_ate"] - time.time() == pytest.approx(20, abs=2)
+
+
+def test_reserva_volta_mesmo_sem_excecao_comum(tmp_path, monkeypatch):
+    from core import ai_auditor
+
+    lim = Limitador(tmp_path / "l.json", rpm=1000, tpm=0)
+    monkeypatch.setattr(limitador, "limitador_para", lambda *a: lim)
+    with pytest.raises(KeyboardInterrupt):
+        with ai_auditor._com_limite("openai", "gpt-4o", "chave", [], None):
+            raise KeyboardInterrupt
+    assert _estado(lim)["reservas"] == {}
+
+
+def test_estado_compartilhado_pelo_arquivo(tmp_path):
+    # Duas instâncias (como dois processos) dividem a mesma cota
+    a = Limitador(tmp_path / "l.json", rpm=1, tpm=0)
+    b = Limitador(tmp_path / "l.json", rpm=1, tpm=0)
+    a.liberar(a.adquirir(0))
+    with pytest.raises(AuditoriaCancelada):
+        b.adquirir(0, _cancelado())
+
+
+@pytest.mark.parametrize("texto, segundos", [("20", 20.0), ("1.5s", 1.5), ("6m0s", 360.0), ("250ms", 0.25)])
+def test_duracao(texto, segundos):
+    assert limitador._duracao(texto) == pytest.approx(segundos)
+
+
+def test_limitador_para(tmp_path, monkeypatch):
+    monkeypatch.setattr(limitador, "LIMITES_DIR", tmp_path)
+    monkeypatch.setattr(limitador, "_ajustes", {"ativo": True, "limites": {}})
+    monkeypatch.setattr(limitador, "_limitadores", {})
+    assert limitador.limitador_para("gemini", "gemini-2.0-flash", "chave") is None
+    lim = limitador.limitador_para("openai", "gpt-4o", "chave")
+    assert lim is not None and lim.caminho.parent == tmp_path
+    assert "chave" not in lim.caminho.name
+    assert limitador.limitador_para("openai", "gpt-4o", "chave") is lim
+
+    # Cota ajustada só vale para o provedor dela (o failover usa outros planos)
+    limitador.configurar({"ai_limites": {"gemini": [60, 0]}})
+    lim = limitador.limitador_para("gemini", "gemini-2.0-flash", "chave")
+    assert lim is not None and (lim.rpm, lim.tpm) == (60, 0)
+    lim = limitador.limitador_para("openai", "gpt-4o", "chave")
+    assert (lim.rpm, lim.tpm) == limitador.LIMITES_PADRAO["openai"]
+
+    limitador.configurar({"ai_limitador": False})
+    assert limitador.limitador_para("openai", "gpt-4o", "chave") is None
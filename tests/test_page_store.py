@@ -0,0 +1,79 @@
+"""Testes do armazenamento das páginas da sessão (core.page_store)."""
+
+import pytest
+from PIL import Image, ImageDraw
+
+from core.page_store import PageStore
+
+
+def _folha(deslocamento: int = 0) -> Image.Image:
+    img = Image.new("RGB", (400, 560), "white")
+    desenho = ImageDraw.Draw(img)
+    desenho.rectangle((40 + deslocamento, 60, 360, 200), fill="black")
+    desenho.ellipse((80, 300, 300, 500), fill="gray")
+    return img
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PageStore(tmp_path / "sessao")
+
+
+def test_folha_repetida_na_mesma_etapa(store):
+    original = store.adicionar(_folha(), "receita")
+    repetida = store.adicionar(_folha(), "receita")
+    achadas = store.semelhantes(repetida)
+    assert [(d.etapa_id, d.pagina.id) for d in achadas] == [("receita", original.id)]
+
+
+def test_folha_repetida_em_outra_etapa(store):
+    cupom = store.adicionar(_folha(), "cupom")
+    de_novo = store.adicionar(_folha(), "receita")
+    assert [(d.etapa_id, d.pagina.id) for d in store.semelhantes(de_novo)] == [("cupom", cupom.id)]
+
+
+def test_outra_etapa_usa_limiar_mais_estrito(store):
+    store.adicionar(_folha(), "cupom")
+    parecida = store.adicionar(_folha(), "receita")
+    assert store.semelhantes(parecida, limiar_outra_etapa=-1) == []
+    assert store.semelhantes(parecida, limiar=-1)
+
+
+def test_pagina_removida_nao_e_comparada(store):
+    original = store.adicionar(_folha(), "receita")
+    repetida = store.adicionar(_folha(), "receita")
+    store.remover(original, "receita")
+    assert store.semelhantes(repetida) == []
+    assert not original.arquivo.exists()
+
+
+def test_reabrir_sessao(store, tmp_path):
+    pagina = store.adicionar(_folha(), "cupom")
+    store.registrar("cpf", etapa="doc", cpf="529.982.247-25")
+    reaberta = PageStore.abrir(tmp_path / "sessao")
+    assert [p.id for p in reaberta.paginas_da_etapa("cupom")] == [pagina.id]
+    assert reaberta.estado["cpfs"] == {"doc": "529.982.247-25"}
+    # Sem JPEG de origem a página é guardada sem perda
+    assert pagina.arquivo.suffix == ".png"
+    assert reaberta.pagina(pagina.id).imagem().tobytes() == _folha().tobytes()
+
+
+def test_limpeza_preserva_sessao_vazia_recente(tmp_path, monkeypatch):
+    import os
+    import time
+
+    from core import page_store
+
+    monkeypatch.setattr(page_store, "SESSOES_DIR", tmp_path)
+    recente = PageStore(tmp_path / "recente")
+    recente.registrar("cpf", etapa="receita", cpf="12345678901")  # acabou de começar, sem páginas
+    velha = PageStore(tmp_path / "velha")
+    velha.registrar("cpf", etapa="receita", cpf="12345678901")
+    ontem = time.time() - page_store.SESSAO_VAZIA_RECENTE_S - 60
+    os.utime(velha.journal, (ontem, ontem))
+    em_uso = PageStore(tmp_path / "em_uso")
+    em_uso.registrar("cpf", etapa="receita", cpf="12345678901")
+    os.utime(em_uso.journal, (ontem, ontem))
+
+    page_store.limpar_sessoes(manter=em_uso.diretorio)
+    assert sorted(d.name for d in tmp_path.iterdir()) == ["em_uso", "recente"]
@@ -0,0 +1,27 @@
+"""Testes da geração do PDF final."""
+
+import io
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("reportlab")
+fitz = pytest.importorskip("fitz")
+
+from core.jpeg_passthrough import abrir_imagem  # noqa: E402
+from core.pdf_generator import gerar_pdf  # noqa: E402
+
+
+def _jpeg(cor: str) -> Image.Image:
+    buf = io.BytesIO()
+    Image.new("RGB", (300, 400), cor).save(buf, format="JPEG")
+    return abrir_imagem(buf.getvalue())
+
+
+def test_cabecalho_em_todas_as_paginas(tmp_path):
+    caminho = gerar_pdf([_jpeg("white"), _jpeg("gray")], "111.222.333.444.555", "01-02-2025", str(tmp_path))
+    assert caminho.name == "AUTORIZAÇÃO 111.222.333.444.555 - DATA 01-02-2025.pdf"
+    with fitz.open(caminho) as pdf:
+        assert pdf.page_count == 2
+        for pagina in pdf:
+            assert "AUTORIZAÇÃO 111.222.333.444.555 - DATA 01-02-2025" in pagina.get_text()
@@ -0,0 +1,77 @@
+"""Testes da interpretação tolerante das respostas da IA (saída estruturada)."""
+
+import json
+
+from core.ai_auditor import (
+    ESQUEMA_AUDITORIA,
+    _parse_json_response,
+    _reparar_json,
+    _resultado_lote,
+    interpretar_resposta,
+)
+
+COMPLETA = {
+    "aprovado": True,
+    "autorizacao": "111.222.333.444.555",
+    "data": "01-02-2025",
+    "erros": [],
+    "observacoes": "",
+}
+
+
+def test_reparar_json_objeto_truncado():
+    texto = '{"aprovado": false, "erros": ["Receita venc'
+    assert json.loads(_reparar_json(texto)) == {"aprovado": False, "erros": ["Receita venc"]}
+
+
+def test_reparar_json_chave_pendente_e_virgulas():
+    texto = '{"aprovado": true, "erros": ["a",], "data":'
+    assert json.loads(_reparar_json(texto)) == {"aprovado": True, "erros": ["a"]}
+
+
+def test_reparar_json_literais_python_e_aspas_tipograficas():
+    texto = "{“aprovado”: True, \"obs\": None, \"nome\": \"True\"}"
+    assert json.loads(_reparar_json(texto)) == {"aprovado": True, "obs": None, "nome": "True"}
+
+
+def test_parse_tolera_markdown_e_texto_em_volta():
+    texto = f"Segue a análise:\n```json\n{json.dumps(COMPLETA)}\n```\nQualquer dúvida, pergunte."
+    assert _parse_json_response(texto) == COMPLETA
+
+
+def test_parse_com_dois_objetos_usa_o_primeiro():
+    texto = json.dumps(COMPLETA) + "\n" + json.dumps({"aprovado": False})
+    assert _parse_json_response(texto) == COMPLETA
+
+
+def test_interpretar_resposta_valida():
+    assert interpretar_resposta(json.dumps(COMPLETA), ESQUEMA_AUDITORIA) == (COMPLETA, [])
+
+
+def test_interpretar_resposta_aponta_campos_com_tipo_errado_ou_ausentes():
+    dados = {**COMPLETA, "aprovado": "sim", "erros": "nenhum"}
+    del dados["data"]
+    validos, invalidos = interpretar_resposta(json.dumps(dados), ESQUEMA_AUDITORIA)
+    assert set(invalidos) == {"aprovado", "erros", "data"}
+    assert validos == {"autorizacao": "111.222.333.444.555", "observacoes": ""}
+
+
+def test_interpretar_resposta_recupera_campos_de_texto_quebrado():
+    texto = 'lixo {"aprovado": true, "autorizacao": "123" }} "erros": ["x"] ]'
+    validos, invalidos = interpretar_resposta(texto, ESQUEMA_AUDITORIA)
+    assert validos["aprovado"] is True
+    assert validos["autorizacao"] == "123"
+    assert "data" in invalidos
+
+
+def test_resultado_lote_com_objetos_repetidos():
+    texto = json.dumps(COMPLETA) + json.dumps({"aprovado": False})
+    custom_id, resultado, erro = _resultado_lote("t1", texto)
+    assert (custom_id, erro) == ("t1", "")
+    assert resultado is not None and resultado["aprovado"] is True
+
+
+def test_resultado_lote_sem_json():
+    assert _resultado_lote("t2", "não consegui ler as imagens")[1:] == (
+        None, "A IA retornou uma resposta inválida (nenhum campo do JSON aproveitável).",
+    )
@@ -0,0 +1,50 @@
+"""Testes do failover entre provedores (core.roteador), sem chamar API."""
+
+import pytest
+
+from core import roteador
+from core.ai_auditor import CAMPO_REINICIAR, AuditResult
+
+SETTINGS = {
+    "ai_provider": "gemini",
+    "ai_model": "gemini-2.0-flash",
+    "ai_failover": True,
+    "ai_hedge_s": 60,
+    "api_keys": {"gemini": "g", "openai": "o"},
+}
+
+
+@pytest.fixture(autouse=True)
+def _saude(tmp_path, monkeypatch):
+    saude = roteador.SaudeProvedores(tmp_path / "saude.json")
+    monkeypatch.setattr(roteador, "get_saude", lambda: saude)
+
+
+def test_dono_do_stream_passa_para_a_proxima_tentativa(monkeypatch):
+    def falso(images, tipo, config, on_campo=None, **kwargs):
+        if config["ai_provider"] == "gemini":
+            on_campo("autorizacao", "123")
+            raise RuntimeError("Erro durante a auditoria: 500")
+        on_campo("autorizacao", "456")
+        return AuditResult({"aprovado": True, "autorizacao": "456"})
+
+    monkeypatch.setattr(roteador, "auditar_transacao", falso)
+    campos = []
+    result = roteador.auditar([], "receita", SETTINGS, on_campo=lambda c, v: campos.append((c, v)))
+
+    assert result.autorizacao == "456"
+    assert campos == [("autorizacao", "123"), (CAMPO_REINICIAR, None), ("autorizacao", "456")]
+    assert result.metricas["roteamento"]["provedor"] == "openai"
+
+
+def test_erro_de_configuracao_nao_faz_failover(monkeypatch):
+    chamados = []
+
+    def falso(images, tipo, config, **kwargs):
+        chamados.append(config["ai_provider"])
+        raise RuntimeError("Erro durante a auditoria") from ValueError("Provedor desconhecido: x")
+
+    monkeypatch.setattr(roteador, "auditar_transacao", falso)
+    with pytest.raises(RuntimeError):
+        roteador.auditar([], "receita", SETTINGS)
+    assert chamados == ["gemini"]
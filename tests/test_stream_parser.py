@@ -0,0 +1,53 @@
+"""Testes do IncrementalJSONParser (streaming da resposta da IA)."""
+
+import pytest
+
+from core.ai_auditor import IncrementalJSONParser
+
+RESPOSTA = (
+    '```json\n{"aprovado": false, "autorizacao": "111.222.333.444.555", "data": "01-02-2025", '
+    '"erros": ["Receita vencida", "CPF com \\"aspas\\", e vírgula"], "observacoes": "ok"}\n```'
+)
+
+
+def _eventos(chunks):
+    parser = IncrementalJSONParser()
+    eventos = []
+    for chunk in chunks:
+        eventos.extend(parser.feed(chunk))
+    return parser, eventos
+
+
+@pytest.mark.parametrize("tamanho", [1, 3, 7, len(RESPOSTA)])
+def test_eventos_independem_da_quebra_dos_pedacos(tamanho):
+    chunks = [RESPOSTA[i:i + tamanho] for i in range(0, len(RESPOSTA), tamanho)]
+    parser, eventos = _eventos(chunks)
+    assert eventos == [
+        ("aprovado", False),
+        ("autorizacao", "111.222.333.444.555"),
+        ("data", "01-02-2025"),
+        ("erros[]", "Receita vencida"),
+        ("erros[]", 'CPF com "aspas", e vírgula'),
+        ("erros", ["Receita vencida", 'CPF com "aspas", e vírgula']),
+        ("observacoes", "ok"),
+    ]
+    assert parser.completo
+    assert parser.resultado()["erros"][1] == 'CPF com "aspas", e vírgula'
+
+
+def test_campo_so_sai_quando_completo():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"autorizacao": "111.2') == []
+    assert parser.feed('22", "da') == [("autorizacao", "111.222")]
+    assert not parser.completo
+
+
+def test_objetos_aninhados_nao_geram_eventos_internos():
+    _, eventos = _eventos(['{"meta": {"a": 1, "b": [1, 2]}, "aprovado": true}'])
+    assert eventos == [("meta", {"a": 1, "b": [1, 2]}), ("aprovado", True)]
+
+
+def test_ignora_texto_depois_do_objeto():
+    parser, eventos = _eventos(['{"aprovado": true}', ' {"aprovado": false}'])
+    assert eventos == [("aprovado", True)]
+    assert parser.completo
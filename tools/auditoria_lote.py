@@ -0,0 +1,101 @@
+"""
+auditoria_lote.py - Auditoria retroativa em lote de uma pasta de PDFs (sem interface).
+Execute via terminal:
+
+    python tools/auditoria_lote.py "C:/Users/.../Documents/FarmaPop" --csv relatorio.csv
+
+Usa as configurações de IA salvas no app. Pode ser interrompido (Ctrl+C) e
+executado de novo: os PDFs já auditados e inalterados são pulados.
+
+Com --batch, usa a API de lote do provedor (OpenAI/Anthropic): mais barato e fora
+da cota do balcão, mas o resultado pode levar horas. Ideal para rodar à noite.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sys
+from pathlib import Path
+
+# Garante que o módulo core seja encontrado
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core.ai_auditor import CancelToken
+from core.batch_audit import AuditoriaEmLote, RelatorioLote
+from core.config import load_settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Auditoria retroativa em lote (FarmaPop IA)")
+    parser.add_argument("pasta", nargs="?", help="Pasta com os PDFs (padrão: pasta de saída configurada)")
+    parser.add_argument("--relatorio", help="Arquivo SQLite do relatório (padrão: <pasta>/auditoria_lote.sqlite)")
+    parser.add_argument("--csv", help="Exporta o relatório para CSV ao final")
+    parser.add_argument("--recursivo", action="store_true", help="Inclui subpastas")
+    parser.add_argument("--concorrencia", type=int, default=3, help="Auditorias simultâneas (padrão: 3)")
+    parser.add_argument("--rpm", type=int, default=20, help="Requisições por minuto (padrão: 20, 0 = sem limite)")
+    parser.add_argument("--processos", type=int, default=2, help="Processos de conversão de PDF (padrão: 2)")
+    parser.add_argument("--batch", action="store_true", help="Usa a API de lote do provedor (OpenAI/Anthropic)")
+    parser.add_argument("--base-url", default="", help="Servidor alternativo da API de lote (ex: tools/servidor_lote_falso.py)")
+    parser.add_argument("--intervalo", type=float, default=60.0, help="Segundos entre consultas aos jobs de lote (padrão: 60)")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    pasta = Path(args.pasta or settings.get("output_folder", "."))
+    if not pasta.is_dir():
+        print(f"❌  Pasta não encontrada: {pasta}")
+        sys.exit(1)
+
+    lote = AuditoriaEmLote(
+        pasta,
+        settings,
+        relatorio=Path(args.relatorio) if args.relatorio else None,
+        recursivo=args.recursivo,
+        max_concorrencia=args.concorrencia,
+        rpm=args.rpm,
+        processos=args.processos,
+    )
+
+    def on_progresso(feitos: int, total: int, pdf: Path, status: str) -> None:
+        print(f"  [{feitos}/{total}] {status:<10} {pdf.name}")
+
+    print(f"⚙️  Auditando {pasta} ...")
+    cancel = CancelToken()
+    try:
+        if args.batch:
+            resumo = lote.executar_batch(
+                on_progresso=on_progresso, cancel=cancel, base_url=args.base_url, intervalo_s=args.intervalo
+            )
+        else:
+            resumo = lote.executar(on_progresso=on_progresso, cancel=cancel)
+    except ValueError as e:
+        print(f"❌  {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        cancel.cancel()
+        print("\n⏸️  Interrompido. Execute novamente para continuar de onde parou.")
+        sys.exit(130)
+
+    print("\n" + "═" * 58)
+    print(f"  Total      : {resumo.total}  (já auditados antes: {resumo.pulados})")
+    print(f"  Aprovados  : {resumo.aprovados}")
+    print(f"  Reprovados : {resumo.reprovados}")
+    print(f"  Falhas     : {resumo.falhas}")
+    print(f"  Relatório  : {lote.relatorio_path}")
+    print("═" * 58)
+    if resumo.interrompido and args.batch:
+        print("⏳  Há jobs de lote pendentes. Execute novamente mais tarde para coletar os resultados.")
+
+    if args.csv:
+        relatorio = RelatorioLote(lote.relatorio_path)
+        try:
+            destino = relatorio.exportar_csv(Path(args.csv))
+        finally:
+            relatorio.fechar()
+        print(f"📄  CSV exportado: {destino}")
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,54 @@
+"""
+deduplicar_cpfs.py - Deduplica a pasta CPFs e mostra o espaço economizado.
+Execute via terminal:
+
+    python tools/deduplicar_cpfs.py            # converte e mostra o relatório
+    python tools/deduplicar_cpfs.py --relatorio  # só mostra o relatório
+
+Páginas idênticas (mesmo documento salvo de novo, ou para outro CPF) passam a ser
+hardlinks para um único blob em CPFs/.blobs. Usa a pasta de saída configurada no app.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+# Garante que o módulo core seja encontrado
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core.blob_store import store_para
+from core.config import load_settings
+from core.cpf_manager import deduplicar_cpfs, get_cpfs_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deduplicação da pasta CPFs (FarmaPop IA)")
+    parser.add_argument("--relatorio", action="store_true", help="Só mostra o relatório, sem converter")
+    parser.add_argument("--coletar", action="store_true", help="Apaga blobs que nenhuma página usa mais")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    blobs = store_para(get_cpfs_dir(settings))
+    if not blobs.ativo:
+        print("⚠️  O volume da pasta CPFs não aceita hardlinks: deduplicação indisponível.")
+
+    if args.relatorio:
+        relatorio = blobs.relatorio()
+    else:
+        def progresso(feitos: int, total: int) -> None:
+            print(f"\r{feitos}/{total} página(s)", end="", flush=True)
+
+        relatorio = deduplicar_cpfs(settings, on_progresso=progresso)
+        print()
+
+    if args.coletar:
+        print(f"{blobs.coletar()} blob(s) órfão(s) apagado(s).")
+        relatorio = blobs.relatorio()
+
+    print(relatorio.texto())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+estatisticas_cascata.py - Mostra a taxa de escalonamento do modo cascata.
+Execute via terminal:
+
+    python tools/estatisticas_cascata.py
+
+Ajuda a calibrar ai_cascata_confianca: se quase tudo escala, o limiar está alto
+(ou o modelo rápido não serve); se o premium raramente discorda do rápido, dá para
+baixar o limiar e escalar menos.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+# Garante que o módulo core seja encontrado
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from core.ai_auditor import estatisticas_cascata
+
+
+def main() -> None:
+    r = estatisticas_cascata.resumo()
+    if not r["total"]:
+        print("Nenhuma auditoria em cascata registrada ainda.")
+        return
+    print(f"Auditorias:        {r['total']}")
+    print(f"Escaladas:         {r['escalados']} ({r['taxa_escalonamento']:.0%})")
+    for motivo, n in sorted(r["motivos"].items(), key=lambda x: -x[1]):
+        print(f"  - {motivo}: {n}")
+    print(f"Premium discordou: {r['discordancias']} de {r['escalados']}")
+    print(f"Latência média:    rápido {r['rapido_medio_s']}s, premium {r['premium_medio_s']}s")
+
+
+if __name__ == "__main__":
+    main()
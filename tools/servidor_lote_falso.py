@@ -0,0 +1,299 @@
+"""
+servidor_lote_falso.py - Servidor local que imita as APIs de lote da OpenAI e da Anthropic.
+Permite testar o modo batch da auditoria em lote sem gastar créditos:
+
+    python tools/servidor_lote_falso.py --porta 8765 --atraso 5
+    python tools/auditoria_lote.py "C:/.../FarmaPop" --batch --base-url http://127.0.0.1:8765
+
+Cada requisição recebe a mesma resposta simulada (ou o JSON de --resposta), e o job
+fica "em andamento" por --atraso segundos antes de ser concluído.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+RESPOSTA_PADRAO: Dict[str, Any] = {
+    "aprovado": True,
+    "autorizacao": "000.000.000.000.000",
+    "data": "01-01-2025",
+    "erros": [],
+    "observacoes": "Resposta simulada pelo servidor de lote local.",
+}
+
+
+class Estado:
+    def __init__(self, resposta: Dict[str, Any], atraso: float) -> None:
+        self.resposta = resposta
+        self.atraso = atraso
+        self.lock = threading.Lock()
+        self.arquivos: Dict[str, bytes] = {}
+        self.jobs_openai: Dict[str, Dict[str, Any]] = {}
+        self.jobs_anthropic: Dict[str, Dict[str, Any]] = {}
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class Handler(BaseHTTPRequestHandler):
+    estado: Estado
+
+    # ── Utilitários ─────────────────────────────────────────────────────────
+
+    def _corpo(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _json(self, dados: Any, status: int = 200) -> None:
+        self._bytes(json.dumps(dados).encode("utf-8"), "application/json", status)
+
+    def _bytes(self, dados: bytes, tipo: str, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _nao_encontrado(self) -> None:
+        self._json({"error": {"type": "not_found_error", "message": f"Não encontrado: {self.path}"}}, 404)
+
+    def _pronto(self, job: Dict[str, Any]) -> bool:
+        return time.time() >= job["_pronto_em"]
+
+    def _texto_resposta(self) -> str:
+        return json.dumps(self.estado.resposta, ensure_ascii=False)
+
+    # ── Rotas ───────────────────────────────────────────────────────────────
+
+    def do_POST(self) -> None:
+        if self.path == "/v1/files":
+            self._openai_upload()
+        elif self.path == "/v1/batches":
+            self._openai_criar_job()
+        elif self.path == "/v1/messages/batches":
+            self._anthropic_criar_job()
+        else:
+            self._nao_encontrado()
+
+    def do_GET(self) -> None:
+        partes = self.path.strip("/").split("/")
+        if partes[:2] == ["v1", "batches"] and len(partes) == 3:
+            self._openai_job(partes[2])
+        elif partes[:2] == ["v1", "files"] and len(partes) == 4 and partes[3] == "content":
+            self._openai_conteudo(partes[2])
+        elif partes[:3] == ["v1", "messages", "batches"] and len(partes) == 4:
+            self._anthropic_job(partes[3])
+        elif partes[:3] == ["v1", "messages", "batches"] and len(partes) == 5 and partes[4] == "results":
+            self._anthropic_resultados(partes[3])
+        else:
+            self._nao_encontrado()
+
+    # ── OpenAI ──────────────────────────────────────────────────────────────
+
+    def _openai_upload(self) -> None:
+        cabecalho = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("latin-1")
+        msg = BytesParser(policy=HTTP).parsebytes(cabecalho + self._corpo())
+        conteudo = b""
+        nome = "arquivo.jsonl"
+        for parte in msg.iter_parts():
+            if parte.get_param("name", header="content-disposition") == "file":
+                conteudo = parte.get_payload(decode=True) or b""
+                nome = parte.get_filename() or nome
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with self.estado.lock:
+            self.estado.arquivos[file_id] = conteudo
+        self._json({
+            "id": file_id,
+            "object": "file",
+            "bytes": len(conteudo),
+            "created_at": int(time.time()),
+            "filename": nome,
+            "purpose": "batch",
+            "status": "processed",
+        })
+
+    def _openai_criar_job(self) -> None:
+        pedido = json.loads(self._corpo())
+        entrada = self.estado.arquivos.get(pedido.get("input_file_id", ""))
+        if entrada is None:
+            self._json({"error": {"message": "input_file_id inválido"}}, 400)
+            return
+        linhas = [json.loads(l) for l in entrada.decode("utf-8").splitlines() if l.strip()]
+        agora = time.time()
+        job = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": pedido.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": pedido["input_file_id"],
+            "completion_window": pedido.get("completion_window", "24h"),
+            "status": "in_progress",
+            "created_at": int(agora),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(linhas), "completed": 0, "failed": 0},
+            "_pronto_em": agora + self.estado.atraso,
+            "_custom_ids": [l["custom_id"] for l in linhas],
+            "_modelo": linhas[0]["body"].get("model", "") if linhas else "",
+        }
+        with self.estado.lock:
+            self.estado.jobs_openai[job["id"]] = job
+        self._json(self._publico(job))
+
+    def _openai_job(self, job_id: str) -> None:
+        with self.estado.lock:
+            job = self.estado.jobs_openai.get(job_id)
+            if job is None:
+                self._nao_encontrado()
+                return
+            if job["status"] == "in_progress" and self._pronto(job):
+                self._openai_concluir(job)
+        self._json(self._publico(job))
+
+    def _openai_concluir(self, job: Dict[str, Any]) -> None:
+        saida: List[str] = []
+        for custom_id in job["_custom_ids"]:
+            saida.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": custom_id,
+                "response": {
+                    "status_code": 200,
+                    "request_id": uuid.uuid4().hex,
+                    "body": {
+                        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": job["_modelo"],
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": self._texto_resposta()},
+                            "finish_reason": "stop",
+                        }],
+                    },
+                },
+                "error": None,
+            }, ensure_ascii=False))
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        self.estado.arquivos[file_id] = "\n".join(saida).encode("utf-8")
+        job["status"] = "completed"
+        job["output_file_id"] = file_id
+        job["request_counts"]["completed"] = len(saida)
+
+    def _openai_conteudo(self, file_id: str) -> None:
+        conteudo = self.estado.arquivos.get(file_id)
+        if conteudo is None:
+            self._nao_encontrado()
+            return
+        self._bytes(conteudo, "application/octet-stream")
+
+    # ── Anthropic ───────────────────────────────────────────────────────────
+
+    def _anthropic_criar_job(self) -> None:
+        pedido = json.loads(self._corpo())
+        requisicoes = pedido.get("requests", [])
+        agora = time.time()
+        job = {
+            "id": f"msgbatch_{uuid.uuid4().hex[:24]}",
+            "type": "message_batch",
+            "processing_status": "in_progress",
+            "request_counts": {
+                "processing": len(requisicoes), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0,
+            },
+            "created_at": _iso(agora),
+            "expires_at": _iso(agora + 24 * 3600),
+            "ended_at": None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": None,
+            "_pronto_em": agora + self.estado.atraso,
+            "_custom_ids": [r["custom_id"] for r in requisicoes],
+            "_modelo": requisicoes[0]["params"].get("model", "") if requisicoes else "",
+        }
+        with self.estado.lock:
+            self.estado.jobs_anthropic[job["id"]] = job
+        self._json(self._publico(job))
+
+    def _anthropic_job(self, job_id: str) -> None:
+        with self.estado.lock:
+            job = self.estado.jobs_anthropic.get(job_id)
+            if job is None:
+                self._nao_encontrado()
+                return
+            if job["processing_status"] == "in_progress" and self._pronto(job):
+                total = len(job["_custom_ids"])
+                job["processing_status"] = "ended"
+                job["ended_at"] = _iso(time.time())
+                job["request_counts"].update(processing=0, succeeded=total)
+                host = self.headers.get("Host", f"127.0.0.1:{self.server.server_address[1]}")
+                job["results_url"] = f"http://{host}/v1/messages/batches/{job_id}/results"
+        self._json(self._publico(job))
+
+    def _anthropic_resultados(self, job_id: str) -> None:
+        job = self.estado.jobs_anthropic.get(job_id)
+        if job is None or job["processing_status"] != "ended":
+            self._nao_encontrado()
+            return
+        linhas = [
+            json.dumps({
+                "custom_id": custom_id,
+                "result": {
+                    "type": "succeeded",
+                    "message": {
+                        "id": f"msg_{uuid.uuid4().hex[:24]}",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": job["_modelo"],
+                        "content": [{"type": "text", "text": self._texto_resposta()}],
+                        "stop_reason": "end_turn",
+                        "stop_sequence": None,
+                        "usage": {"input_tokens": 0, "output_tokens": 0},
+                    },
+                },
+            }, ensure_ascii=False)
+            for custom_id in job["_custom_ids"]
+        ]
+        self._bytes("\n".join(linhas).encode("utf-8"), "application/x-jsonl")
+
+    # ────────────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _publico(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in job.items() if not k.startswith("_")}
+
+    def log_message(self, format: str, *args: Any) -> None:
+        print(f"  {self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor local de APIs de lote (OpenAI/Anthropic) para testes")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--atraso", type=float, default=5.0, help="Segundos até cada job ficar pronto (padrão: 5)")
+    parser.add_argument("--resposta", help="Arquivo JSON com a resposta simulada da auditoria")
+    args = parser.parse_args()
+
+    resposta = RESPOSTA_PADRAO
+    if args.resposta:
+        with open(args.resposta, encoding="utf-8") as f:
+            resposta = json.load(f)
+
+    Handler.estado = Estado(resposta, args.atraso)
+    servidor = ThreadingHTTPServer(("127.0.0.1", args.porta), Handler)
+    print(f"🧪  Servidor de lote falso em http://127.0.0.1:{args.porta}  (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -23,15 +23,21 @@ class App(ctk.CTk):
 
         self.settings = load_settings()
         self.current_transaction = None
+        self.audit_pipeline = None  # Pré-processamento da auditoria em background
         self._update_zip_url: str = ""  # URL do ZIP da nova versão (preenchido ao detectar update)
         self._license_cache: dict | None = None  # Cache global para evitar lag na UI (v1.1.7)
 
         self._build_layout()
         self.show_home()
 
+        # Oferece retomar uma transação interrompida (queda do app, falta de energia...)
+        self.after(200, self._verificar_sessao_pendente)
+
         # Verificações em background após 1 segundo
         self.after(1000, self._iniciar_verificacao_update)
         self.after(1500, self._verificar_expiracao_proxima)
+        # Move a pasta CPFs antiga (plana) para o layout em shards, aos poucos
+        self.after(3000, self._iniciar_migracao_cpfs)
 
     # ── Layout ───────────────────────────────────────────────────────────────────
 
@@ -375,9 +381,75 @@ class App(ctk.CTk):
 
     def show_scan(self, transaction: object) -> None:
         from ui.screens.scan_screen import ScanScreen
+        if transaction is not self.current_transaction:
+            self._iniciar_pipeline(transaction)
         self.current_transaction = transaction
         self._show_screen(ScanScreen, transaction=transaction)
 
+    def _iniciar_pipeline(self, transaction: object) -> None:
+        """Descarta o pipeline da transação anterior e começa um novo para esta."""
+        from core.audit_pipeline import PipelineAuditoria
+        if self.audit_pipeline is not None:
+            self.audit_pipeline.encerrar()
+            # Nova transação substitui a anterior (concluída ou abandonada): libera as páginas
+            self.audit_pipeline.transacao.descartar()
+        self.audit_pipeline = PipelineAuditoria(
+            transaction, self.settings, dentro_do_limite=self._dentro_do_limite_diario  # type: ignore[arg-type]
+        )
+
+    def _dentro_do_limite_diario(self) -> bool:
+        """Mesma verificação da ResultScreen: a licença ainda permite auditar hoje?"""
+        from core.usage_manager import UsageManager
+        limite = int((self._license_cache or {}).get("auditorias_limite", 0))
+        return not UsageManager().limite_atingido(limite)
+
+    def _verificar_sessao_pendente(self) -> None:
+        import threading
+        import time
+        from tkinter import messagebox
+        from core.page_store import limpar_sessoes, sessao_pendente
+        from core.transaction import transacao_da_sessao
+
+        manter = None
+        store = sessao_pendente()
+        if store is not None:
+            try:
+                transacao = transacao_da_sessao(store)
+            except ValueError:
+                transacao = None
+            if transacao is not None:
+                etapa = min(transacao.etapa_atual_index + 1, transacao.total_etapas)
+                hora = time.strftime("%d/%m %H:%M", time.localtime(store.estado["iniciada_em"]))
+                if messagebox.askyesno(
+                    "Transação não concluída",
+                    f"Encontramos uma transação interrompida ({transacao.nome_tipo}, iniciada em {hora}).\n"
+                    f"{store.total_paginas} página(s) digitalizada(s), etapa {etapa} de {transacao.total_etapas}.\n\n"
+                    "Deseja retomar de onde parou?",
+                ):
+                    manter = store.diretorio
+                    self._retomar_transacao(transacao)
+                else:
+                    transacao.descartar()
+
+        # Páginas de transações concluídas/antigas gravadas em disco
+        threading.Thread(target=limpar_sessoes, kwargs={"manter": manter}, daemon=True).start()
+
+    def _iniciar_migracao_cpfs(self) -> None:
+        try:
+            from core.cpf_manager import get_cpfs_dir
+            from core.cpf_migracao import iniciar_migracao
+            iniciar_migracao(get_cpfs_dir(self.settings))
+        except Exception as e:
+            print(f"[App] Migração da pasta CPFs não iniciada: {e}")
+
+    def _retomar_transacao(self, transacao: object) -> None:
+        if getattr(transacao, "concluida", False):
+            self._iniciar_pipeline(transacao)
+            self.current_transaction = transacao
+            self.show_result(transacao)
+        else:
+            self.show_scan(transacao)
+
     def show_result(self, transaction: object) -> None:
         from ui.screens.result_screen import ResultScreen
         self._show_screen(ResultScreen, transaction=transaction)
@@ -397,6 +469,11 @@ class App(ctk.CTk):
         self._set_active_btn(self.btn_retro_audit)
         self._show_screen(RetroAuditScreen)
 
+    def show_batch_audit(self) -> None:
+        from ui.screens.batch_audit_screen import BatchAuditScreen
+        self._set_active_btn(self.btn_retro_audit)
+        self._show_screen(BatchAuditScreen)
+
     def show_help(self) -> None:
         from ui.screens.help_screen import HelpScreen
         self._set_active_btn(self.btn_help)
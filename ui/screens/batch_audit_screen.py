@@ -0,0 +1,248 @@
+"""
+batch_audit_screen.py - Tela de auditoria retroativa em lote (pasta inteira de PDFs).
+"""
+
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from tkinter import filedialog, messagebox
+from typing import TYPE_CHECKING, Optional
+
+import customtkinter as ctk
+
+from core.ai_auditor import BATCH_PROVIDERS, CancelToken
+from core.batch_audit import AuditoriaEmLote, RelatorioLote
+from core.usage_manager import UsageManager
+
+if TYPE_CHECKING:
+    from ui.app import App
+
+
+class BatchAuditScreen(ctk.CTkFrame):
+    def __init__(self, parent: ctk.CTkFrame, app: "App", **kwargs: object) -> None:
+        super().__init__(parent, fg_color="transparent", **kwargs)
+        self.app = app
+        self.usage_manager = UsageManager()
+        self._cancel: Optional[CancelToken] = None
+        self._lote: Optional[AuditoriaEmLote] = None
+        self._build()
+
+    def _build(self) -> None:
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(3, weight=1)
+
+        header = ctk.CTkFrame(self, fg_color="transparent")
+        header.grid(row=0, column=0, padx=40, pady=(32, 16), sticky="ew")
+
+        ctk.CTkLabel(
+            header,
+            text="Auditoria em Lote",
+            font=ctk.CTkFont(size=28, weight="bold"),
+            text_color="#E3F2FD",
+        ).pack(anchor="w")
+
+        ctk.CTkLabel(
+            header,
+            text="Audita todos os PDFs de uma pasta. Se for interrompida, continua de onde parou.",
+            font=ctk.CTkFont(size=13),
+            text_color="#78909C",
+        ).pack(anchor="w")
+
+        # ── Pasta ────────────────────────────────────────────────────────────
+        folder_row = ctk.CTkFrame(self, fg_color="#0D1B2A", corner_radius=12)
+        folder_row.grid(row=1, column=0, padx=40, pady=8, sticky="ew")
+        folder_row.grid_columnconfigure(0, weight=1)
+
+        self.folder_var = ctk.StringVar(value=self.app.settings.get("output_folder", ""))
+        ctk.CTkEntry(
+            folder_row,
+            textvariable=self.folder_var,
+            font=ctk.CTkFont(size=12),
+            height=38,
+        ).grid(row=0, column=0, sticky="ew", padx=(16, 8), pady=16)
+
+        ctk.CTkButton(
+            folder_row,
+            text="📂  Alterar",
+            width=110,
+            height=38,
+            fg_color="#1E3A5F",
+            hover_color="#1565C0",
+            command=self._escolher_pasta,
+        ).grid(row=0, column=1, padx=(0, 16), pady=16)
+
+        self.recursivo_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(
+            folder_row,
+            text="Incluir subpastas",
+            variable=self.recursivo_var,
+            font=ctk.CTkFont(size=12),
+        ).grid(row=1, column=0, sticky="w", padx=16, pady=(0, 16))
+
+        # API de lote: só OpenAI e Anthropic oferecem
+        self.batch_var = ctk.BooleanVar(value=False)
+        batch_ok = self.app.settings.get("ai_provider", "gemini") in BATCH_PROVIDERS
+        ctk.CTkCheckBox(
+            folder_row,
+            text="Usar API de lote do provedor (mais barato; resultado em até 24h)",
+            variable=self.batch_var,
+            font=ctk.CTkFont(size=12),
+            state="normal" if batch_ok else "disabled",
+        ).grid(row=2, column=0, columnspan=2, sticky="w", padx=16, pady=(0, 16))
+
+        # ── Controles e progresso ───────────────────────────────────────────
+        controls = ctk.CTkFrame(self, fg_color="transparent")
+        controls.grid(row=2, column=0, padx=40, pady=8, sticky="ew")
+        controls.grid_columnconfigure(0, weight=1)
+
+        self.progress_bar = ctk.CTkProgressBar(controls, height=10)
+        self.progress_bar.grid(row=0, column=0, sticky="ew", padx=(0, 16))
+        self.progress_bar.set(0)
+
+        self.btn_start = ctk.CTkButton(
+            controls,
+            text="▶   Iniciar",
+            font=ctk.CTkFont(size=13, weight="bold"),
+            height=40,
+            width=130,
+            fg_color="#2E7D32",
+            hover_color="#388E3C",
+            command=self._iniciar,
+        )
+        self.btn_start.grid(row=0, column=1, padx=4)
+
+        self.btn_stop = ctk.CTkButton(
+            controls,
+            text="⏸   Parar",
+            font=ctk.CTkFont(size=13),
+            height=40,
+            width=110,
+            fg_color="#B71C1C",
+            hover_color="#C62828",
+            state="disabled",
+            command=self._parar,
+        )
+        self.btn_stop.grid(row=0, column=2, padx=4)
+
+        self.btn_csv = ctk.CTkButton(
+            controls,
+            text="📄  Exportar CSV",
+            font=ctk.CTkFont(size=13),
+            height=40,
+            width=140,
+            fg_color="#1E3A5F",
+            hover_color="#1565C0",
+            command=self._exportar_csv,
+        )
+        self.btn_csv.grid(row=0, column=3, padx=4)
+
+        self.lbl_status = ctk.CTkLabel(
+            controls, text="", font=ctk.CTkFont(size=11), text_color="#546E7A"
+        )
+        self.lbl_status.grid(row=1, column=0, columnspan=4, sticky="w", pady=(6, 0))
+
+        # ── Log ──────────────────────────────────────────────────────────────
+        self.log = ctk.CTkTextbox(self, fg_color="#0D1B2A", corner_radius=12, font=ctk.CTkFont(size=11))
+        self.log.grid(row=3, column=0, padx=40, pady=(8, 32), sticky="nsew")
+        self.log.configure(state="disabled")
+
+    # ── Ações ──────────────────────────────────────────────────────────────────
+
+    def _escolher_pasta(self) -> None:
+        path = filedialog.askdirectory(title="Selecionar pasta com os PDFs")
+        if path:
+            self.folder_var.set(path)
+
+    def _log(self, texto: str) -> None:
+        self.log.configure(state="normal")
+        self.log.insert("end", texto + "\n")
+        self.log.see("end")
+        self.log.configure(state="disabled")
+
+    def _pode_auditar(self) -> bool:
+        """Respeita o limite diário do plano e contabiliza cada auditoria."""
+        cache = getattr(self.app, "_license_cache", None)
+        limite = int(cache.get("auditorias_limite", 0)) if cache else 0
+        if limite > 0 and self.usage_manager.get_count() >= limite:
+            self.after(0, lambda: self._log("⚠️  Limite diário de auditorias atingido. Lote pausado."))
+            return False
+        self.usage_manager.increment()
+        return True
+
+    def _iniciar(self) -> None:
+        pasta = Path(self.folder_var.get())
+        if not pasta.is_dir():
+            messagebox.showwarning("Pasta inválida", "Selecione uma pasta existente.")
+            return
+
+        self._lote = AuditoriaEmLote(pasta, self.app.settings, recursivo=self.recursivo_var.get())
+        self._cancel = CancelToken()
+        self.btn_start.configure(state="disabled")
+        self.btn_stop.configure(state="normal")
+        self.progress_bar.set(0)
+        self._log(f"⚙️  Iniciando auditoria de {pasta}")
+
+        lote, cancel = self._lote, self._cancel
+        usar_batch = self.batch_var.get()
+
+        def on_progresso(feitos: int, total: int, pdf: Path, status: str) -> None:
+            def ui() -> None:
+                self.progress_bar.set(feitos / total if total else 1)
+                self.lbl_status.configure(text=f"{feitos} de {total} PDF(s)")
+                emoji = {"aprovado": "✅", "reprovado": "❌"}.get(status, "⚠️")
+                self._log(f"{emoji}  {pdf.name}")
+            self.after(0, ui)
+
+        def run() -> None:
+            try:
+                executar = lote.executar_batch if usar_batch else lote.executar
+                resumo = executar(
+                    on_progresso=on_progresso, cancel=cancel, antes_de_auditar=self._pode_auditar
+                )
+                if usar_batch and resumo.interrompido and not cancel.cancelado:
+                    self.after(0, lambda: self._log("⏳  Jobs de lote pendentes no provedor; inicie novamente para coletar."))
+                msg = (
+                    f"{'⏸️  Interrompido' if resumo.interrompido else '🏁  Concluído'}: "
+                    f"{resumo.aprovados} aprovado(s), {resumo.reprovados} reprovado(s), "
+                    f"{resumo.falhas} falha(s), {resumo.pulados} já auditado(s) antes."
+                )
+            except Exception as e:
+                msg = f"❌  Erro na auditoria em lote: {e}"
+            self.after(0, lambda: self._finalizar(msg))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _parar(self) -> None:
+        if self._cancel is not None:
+            self._cancel.cancel()
+        self.btn_stop.configure(state="disabled")
+        self._log("⏳  Parando após as auditorias em andamento...")
+
+    def _finalizar(self, msg: str) -> None:
+        self._log(msg)
+        self.btn_start.configure(state="normal")
+        self.btn_stop.configure(state="disabled")
+
+    def _exportar_csv(self) -> None:
+        pasta = Path(self.folder_var.get())
+        lote = self._lote or AuditoriaEmLote(pasta, self.app.settings)
+        if not lote.relatorio_path.exists():
+            messagebox.showinfo("Relatório", "Nenhum relatório encontrado para esta pasta.")
+            return
+        destino = filedialog.asksaveasfilename(
+            title="Salvar relatório",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv")],
+            initialfile="auditoria_lote.csv",
+        )
+        if not destino:
+            return
+        relatorio = RelatorioLote(lote.relatorio_path)
+        try:
+            relatorio.exportar_csv(Path(destino))
+            messagebox.showinfo("Relatório", f"Relatório exportado:\n{destino}")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao exportar:\n{e}")
+        finally:
+            relatorio.fechar()
@@ -14,8 +14,12 @@ from typing import TYPE_CHECKING, List, Optional
 
 import customtkinter as ctk
 
-from core.ai_auditor import auditar_transacao, AuditResult
+from core import ocr_local, regras_locais, roteador
+from core.ai_auditor import CAMPO_REINICIAR, AuditoriaCancelada, AuditResult, CancelToken
+from core.step_extractor import auditar_em_duas_fases
 from core.usage_manager import UsageManager
+from core.blob_store import store_para
+from core.cpf_manager import get_cpfs_dir
 from core.pdf_generator import gerar_pdf
 from core.transaction import Transaction
 
@@ -37,8 +41,12 @@ class ResultScreen(ctk.CTkFrame):
         # self.auditor = AIAuditor()  # Removido: agora usamos a função diretamente
         self.usage_manager = UsageManager()
         self.audit_result = None
+        self._cancel_token: Optional[CancelToken] = None
         # Estado da auditoria manual: True=confirmado erro, False=falso positivo
         self._manual_votes: List[Optional[bool]] = []
+        # OCR local do cupom (opcional): roda junto com a IA ou para preencher o modo manual
+        self._ocr_thread: Optional[threading.Thread] = None
+        self._ocr_resultado: Optional[ocr_local.ResultadoOCR] = None
         
         # Tenta pegar dados da licença do App pai
         self.license_data = None
@@ -51,10 +59,7 @@ class ResultScreen(ctk.CTkFrame):
         self.limite_excedido = False
         if self.license_data:
             limite = int(self.license_data.get("auditorias_limite", 0))
-            if limite > 0:
-                consumo = self.usage_manager.get_count()
-                if consumo >= limite:
-                    self.limite_excedido = True
+            self.limite_excedido = self.usage_manager.limite_atingido(limite)
         
         if self.limite_excedido:
             self.after(100, self._show_limit_warning)
@@ -126,6 +131,30 @@ class ResultScreen(ctk.CTkFrame):
         self.progress.pack(pady=12)
         self.progress.start()
 
+        # Campos recebidos em streaming (preenchidos conforme a IA responde)
+        self._lbl_stream_arquivo = ctk.CTkLabel(
+            frame, text="", font=ctk.CTkFont(size=12, weight="bold"), text_color="#A5D6A7"
+        )
+        self._lbl_stream_arquivo.pack(pady=(0, 2))
+        self._stream_erros_frame = ctk.CTkFrame(frame, fg_color="transparent")
+        self._stream_erros_frame.pack(pady=(0, 4))
+        self._stream_campos: dict[str, str] = {}
+
+        ctk.CTkButton(
+            frame,
+            text="✕   Cancelar",
+            font=ctk.CTkFont(size=12),
+            height=34,
+            width=140,
+            corner_radius=8,
+            fg_color="transparent",
+            border_width=1,
+            border_color="#37474F",
+            hover_color="#3E1C1C",
+            text_color="#78909C",
+            command=self._cancelar_auditoria_ia,
+        ).pack(pady=(4, 0))
+
     # ── Auditoria IA ────────────────────────────────────────────────────────────
 
     def _show_limit_warning(self) -> None:
@@ -138,20 +167,52 @@ class ResultScreen(ctk.CTkFrame):
         )
         self._show_manual_input_form()
 
-    def _start_audit(self) -> None:
+    def _start_audit(self, usar_cache: bool = True) -> None:
         """Inicia o processo de auditoria por IA em uma thread separada."""
-        # Se chegou aqui, incrementa o uso
-        self.usage_manager.increment()
+        token = CancelToken()
+        self._cancel_token = token
+
+        self._iniciar_ocr()
 
         def run() -> None:
             try:
-                images = self.transacao.todas_imagens()
-                result = auditar_transacao(
-                    images=images,
-                    tipo_transacao=self.transacao.nome_tipo,
-                    settings=self.app.settings,
-                )
-                self.after(0, lambda: self._show_result(result))
+                settings = self.app.settings
+                # Aproveita o que o pipeline adiantou durante a digitalização
+                pipeline = getattr(self.app, "audit_pipeline", None)
+                preparadas = None
+                if pipeline is not None and pipeline.transacao is self.transacao:
+                    pipeline.aguardar(cancel=token)
+                    preparadas = pipeline.imagens_preparadas()
+
+                # Documentos faltando ou CPF inválido reprovam sem gastar uma chamada à IA
+                # (nem contar no limite diário do plano)
+                relatorio = regras_locais.avaliar(self.transacao)
+                if relatorio.reprovado:
+                    result = relatorio.como_resultado()
+                elif settings.get("audit_mode") == "duas_fases" and hasattr(self.transacao, "etapas"):
+                    result = auditar_em_duas_fases(
+                        self.transacao, settings, usar_cache=usar_cache, cancel=token
+                    )
+                    self._contar_uso(result, token)
+                else:
+                    result = roteador.auditar(
+                        images=self.transacao.todas_imagens(),
+                        tipo_transacao=self.transacao.nome_tipo,
+                        settings=settings,
+                        usar_cache=usar_cache,
+                        cancel=token,
+                        on_campo=lambda c, v: self.after(0, lambda: self._on_campo_stream(token, c, v)),
+                        preparadas=preparadas,
+                        contexto=relatorio.texto_prompt(),
+                    )
+                    self._contar_uso(result, token)
+                if self._ocr_thread is not None:
+                    self._ocr_thread.join()
+                    ocr_local.cruzar(result, self._ocr_resultado)
+                if not token.cancelado:
+                    self.after(0, lambda: self._show_result(result))
+            except AuditoriaCancelada:
+                pass  # A UI já saiu da tela de carregamento
             except ValueError as ve:
                 err_msg = str(ve)
                 # Geralmente erro de API Key ou Provedor não configurado
@@ -165,6 +226,67 @@ class ResultScreen(ctk.CTkFrame):
 
         threading.Thread(target=run, daemon=True).start()
 
+    def _contar_uso(self, result: AuditResult, token: CancelToken) -> None:
+        """Conta no limite diário só a auditoria que de fato chegou da API (sem cache nem cancelamento)."""
+        if not result.do_cache and not token.cancelado:
+            self.after(0, self.usage_manager.increment)
+
+    def _iniciar_ocr(self) -> None:
+        """Dispara o OCR local do cupom (se ligado nas configurações) em uma thread."""
+        if not self.app.settings.get("ocr_local") or self._ocr_thread is not None:
+            return
+
+        def run() -> None:
+            # Aproveita o OCR que o pipeline já fez quando a etapa do cupom foi concluída
+            pipeline = getattr(self.app, "audit_pipeline", None)
+            resultado = None
+            if pipeline is not None and pipeline.transacao is self.transacao:
+                resultado = pipeline.resultado_ocr()
+            if resultado is None:
+                try:
+                    resultado = ocr_local.extrair_da_transacao(self.transacao)
+                except Exception as e:
+                    print(f"[ResultScreen] OCR local indisponível: {e}")
+            self._ocr_resultado = resultado
+            # Se o formulário manual estiver aberto, preenche com o que foi lido
+            self.after(0, self._preencher_com_ocr)
+
+        self._ocr_thread = threading.Thread(target=run, daemon=True)
+        self._ocr_thread.start()
+
+    def _on_campo_stream(self, token: CancelToken, campo: str, valor: object) -> None:
+        """Mostra na tela de carregamento os campos que já chegaram da IA."""
+        if token.cancelado or token is not self._cancel_token:
+            return
+        if not self._lbl_stream_arquivo.winfo_exists():
+            return
+        if campo == CAMPO_REINICIAR:
+            # A cascata escalou para o modelo premium: o que o rápido leu não vale mais
+            self._stream_campos.clear()
+            self._lbl_stream_arquivo.configure(text="")
+            for filho in self._stream_erros_frame.winfo_children():
+                filho.destroy()
+        elif campo in ("autorizacao", "data") and isinstance(valor, str):
+            self._stream_campos[campo] = valor
+            autorizacao = self._stream_campos.get("autorizacao") or "..."
+            data = (self._stream_campos.get("data") or "...").replace("/", "-")
+            self._lbl_stream_arquivo.configure(text=f"📄  AUTORIZAÇÃO {autorizacao} - DATA {data}.pdf")
+        elif campo == "erros[]":
+            ctk.CTkLabel(
+                self._stream_erros_frame,
+                text=f"⚠️  {valor}",
+                font=ctk.CTkFont(size=11),
+                text_color="#FFCDD2",
+                wraplength=480,
+                justify="left",
+            ).pack(anchor="w")
+
+    def _cancelar_auditoria_ia(self) -> None:
+        """Interrompe a auditoria em andamento (a resposta, se chegar, é descartada)."""
+        if self._cancel_token is not None:
+            self._cancel_token.cancel()
+        self._show_error("Auditoria cancelada pelo usuário.")
+
     def _show_result(self, result: AuditResult) -> None:
         self.audit_result = result
         self._clear_center()
@@ -177,6 +299,29 @@ class ResultScreen(ctk.CTkFrame):
             )
             self._show_rejected(result)
 
+        if result.do_cache:
+            self._show_cache_badge()
+
+    def _show_cache_badge(self) -> None:
+        """Indica que o resultado veio do cache local e permite forçar nova auditoria."""
+        ctk.CTkButton(
+            self.center,
+            text="♻️  Resultado do cache — Reauditar",
+            font=ctk.CTkFont(size=11),
+            height=28,
+            corner_radius=6,
+            fg_color="transparent",
+            border_width=1,
+            border_color="#37474F",
+            hover_color="#1E3A5F",
+            text_color="#78909C",
+            command=self._reauditar_sem_cache,
+        ).place(relx=1.0, x=-16, y=16, anchor="ne")
+
+    def _reauditar_sem_cache(self) -> None:
+        self._show_loading()
+        self._start_audit(usar_cache=False)
+
     # ── Aprovado ─────────────────────────────────────────────────────────────────
 
     def _show_approved(self, result: AuditResult, manual: bool = False) -> None:
@@ -713,7 +858,12 @@ class ResultScreen(ctk.CTkFrame):
             text="📝 Entrada Manual",
             font=ctk.CTkFont(size=20, weight="bold"),
             text_color="#4FC3F7",
-        ).pack(pady=(0, 20))
+        ).pack(pady=(0, 8))
+
+        self._lbl_ocr = ctk.CTkLabel(
+            frame, text="", font=ctk.CTkFont(size=11), text_color="#FFB74D", wraplength=320
+        )
+        self._lbl_ocr.pack(pady=(0, 12))
 
         # Autorização
         ctk.CTkLabel(
@@ -777,6 +927,26 @@ class ResultScreen(ctk.CTkFrame):
             command=self._show_no_ia_warning,
         ).pack()
 
+        if self.app.settings.get("ocr_local"):
+            self._lbl_ocr.configure(text="🔎  Lendo o cupom com o OCR local...")
+            self._iniciar_ocr()
+            if not self._ocr_thread.is_alive():
+                self._preencher_com_ocr()
+
+    def _preencher_com_ocr(self) -> None:
+        """Preenche os campos vazios do formulário manual com o que o OCR local leu."""
+        if not hasattr(self, "_lbl_ocr") or not self._lbl_ocr.winfo_exists():
+            return
+        ocr = self._ocr_resultado
+        if ocr is None or ocr.vazio:
+            self._lbl_ocr.configure(text="")
+            return
+        if ocr.autorizacao and not self.var_auth.get():
+            self.var_auth.set(ocr.autorizacao)
+        if ocr.data and not self.var_date.get():
+            self.var_date.set(ocr.data)
+        self._lbl_ocr.configure(text="🔎  Campos preenchidos pelo OCR local. Confira com o cupom antes de salvar.")
+
     def _salvar_manual(self) -> None:
         """Valida entradas manuais usando Regex e gera o PDF."""
         auth = self.entry_auth.get().strip()
@@ -974,7 +1144,12 @@ class ResultScreen(ctk.CTkFrame):
 
         try:
             images = self.transacao.todas_imagens()
-            path = gerar_pdf(images, autorizacao, data, output_folder)
+            path = gerar_pdf(
+                images, autorizacao, data, output_folder,
+                blob_store=store_para(get_cpfs_dir(settings)),
+            )
+            if isinstance(self.transacao, Transaction):
+                self.transacao.finalizar()
             mb.showinfo(
                 "PDF Salvo",
                 f"Arquivo salvo com sucesso:\n{path}",
@@ -988,4 +1163,6 @@ class ResultScreen(ctk.CTkFrame):
             "Cancelar transação",
             "Tem certeza? Todas as imagens digitalizadas serão descartadas.",
         ):
+            if isinstance(self.transacao, Transaction):
+                self.transacao.descartar()
             self.app.show_home()
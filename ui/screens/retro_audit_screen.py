@@ -9,7 +9,7 @@ from tkinter import filedialog, messagebox
 import customtkinter as ctk
 from PIL import Image
 
-from core.ai_auditor import auditar_transacao
+from core.ai_auditor import auditar_transacao, vision_profile
 from core.pdf_converter import pdf_to_images
 from core.usage_manager import UsageManager
 from ui.screens.result_screen import ResultScreen
@@ -130,6 +130,16 @@ class RetroAuditScreen(ctk.CTkFrame):
             command=self._escolher_arquivo
         ).pack(pady=30)
 
+        ctk.CTkButton(
+            self.main_container,
+            text="📁  Auditar uma pasta inteira (em lote)",
+            font=ctk.CTkFont(size=13),
+            height=38,
+            fg_color="#1E3A5F",
+            hover_color="#1565C0",
+            command=self.app.show_batch_audit
+        ).pack(anchor="e", pady=(6, 0))
+
     def _escolher_arquivo(self):
         path = filedialog.askopenfilename(
             title="Selecionar Transação em PDF",
@@ -164,7 +174,12 @@ class RetroAuditScreen(ctk.CTkFrame):
             try:
                 # 1. Converter PDF em Imagens
                 self.after(0, lambda: self.status_lbl.configure(text="Conversão: Extraindo imagens do PDF..."))
-                images = pdf_to_images(pdf_path)
+                # Renderiza só até a resolução que o provedor configurado aproveita
+                settings = self.app.settings
+                max_dim = vision_profile(
+                    settings.get("ai_provider", "gemini"), settings.get("ai_model", "gemini-2.0-flash")
+                )
+                images = pdf_to_images(pdf_path, max_dim=max_dim)
                 
                 if not images:
                     raise ValueError("Não foi possível extrair imagens deste PDF.")
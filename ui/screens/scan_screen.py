@@ -10,6 +10,8 @@ import tkinter.messagebox as mb
 from core import scanner as scan_module
 from core.transaction import Transaction
 from core.cpf_manager import find_all_documents_by_cpf, save_cpf_documents, validate_cpf
+from core.jpeg_passthrough import abrir_arquivo
+from core.page_store import Pagina
 
 
 THUMB_SIZE = (120, 120)
@@ -182,7 +184,10 @@ class ScanScreen(ctk.CTkFrame):
         )
         self.btn_next.grid(row=0, column=2, padx=8, sticky="ew")
 
-        self._thumb_refs = []  # evita garbage collection das imagens
+        # id da página -> (frame, label "Pág. N", CTkImage); a referência evita o GC da imagem
+        self._thumbs: dict = {}
+        self._duplicadas: set = set()  # páginas que parecem repetidas (borda laranja)
+        self._capturas_pendentes = 0
 
     # ── Atualização do estado visual ──────────────────────────────────────────
 
@@ -239,66 +244,93 @@ class ScanScreen(ctk.CTkFrame):
         if cpf_valido:
             self.btn_scan.configure(state="normal")
             self.btn_import.configure(state="normal")
-            self.btn_next.configure(state="normal" if etapa.tem_imagens else "disabled")
+            pronto = etapa.tem_imagens and not self._capturas_pendentes
+            self.btn_next.configure(state="normal" if pronto else "disabled")
         else:
             self.btn_scan.configure(state="disabled")
             self.btn_import.configure(state="disabled")
             self.btn_next.configure(state="disabled")
 
     def _render_thumbs(self, imagens):
-        """Renderiza miniaturas das imagens atuais."""
-        for widget in self.thumb_scroll.winfo_children():
-            widget.destroy()
-        self._thumb_refs.clear()
-
-        if not imagens:
-            self.lbl_empty = ctk.CTkLabel(
-                self.thumb_scroll,
-                text="Nenhuma página digitalizada ainda.",
-                font=ctk.CTkFont(size=12),
-                text_color="#37474F",
-            )
+        """
+        Sincroniza as miniaturas com as páginas da etapa: cria só as novas, destrói só
+        as removidas e renumera. As miniaturas vêm prontas do PageStore (geradas na captura).
+        """
+        ids = imagens.ids
+        atuais = set(ids)
+        for pid in [pid for pid in self._thumbs if pid not in atuais]:
+            self._thumbs.pop(pid)[0].destroy()
+
+        if not ids:
+            if not hasattr(self, "lbl_empty") or not self.lbl_empty.winfo_exists():
+                self.lbl_empty = ctk.CTkLabel(
+                    self.thumb_scroll,
+                    text="Nenhuma página digitalizada ainda.",
+                    font=ctk.CTkFont(size=12),
+                    text_color="#37474F",
+                )
             self.lbl_empty.pack(pady=30)
             return
+        if hasattr(self, "lbl_empty"):
+            self.lbl_empty.pack_forget()
+
+        # Páginas novas sempre entram no fim; se a ordem mudou (ex: outra etapa), reempacota
+        ordem_atual = [pid for pid in ids if pid in self._thumbs]
+        if list(self._thumbs) != ordem_atual:
+            for frame, _, _ in self._thumbs.values():
+                frame.pack_forget()
+            self._thumbs = {pid: self._thumbs[pid] for pid in ordem_atual}
+            for frame, _, _ in self._thumbs.values():
+                frame.pack(side="left", padx=6, pady=4)
+
+        for i, pid in enumerate(ids):
+            if pid not in self._thumbs:
+                self._thumbs[pid] = self._criar_thumb(pid, self._miniatura(imagens, i))
+            self._thumbs[pid][1].configure(text=f"Pág. {i + 1}")
+
+    def _miniatura(self, imagens, index: int):
+        item = imagens.item(index)
+        if isinstance(item, Pagina):
+            return item.store.miniatura(item, THUMB_SIZE)
+        thumb = item.copy()
+        thumb.thumbnail(THUMB_SIZE, Image.LANCZOS)
+        return thumb
+
+    def _criar_thumb(self, pid: str, thumb_img):
+        frame = ctk.CTkFrame(
+            self.thumb_scroll,
+            fg_color="#0D2137",
+            corner_radius=8,
+            border_width=2 if pid in self._duplicadas else 1,
+            border_color="#FF9800" if pid in self._duplicadas else "#1E3450",
+        )
+        frame.pack(side="left", padx=6, pady=4)
+
+        # Miniatura com CTkImage (HighDPI)
+        ctk_img = ctk.CTkImage(light_image=thumb_img, dark_image=thumb_img, size=THUMB_SIZE)
+        ctk.CTkLabel(frame, image=ctk_img, text="").pack(padx=6, pady=(6, 2))
 
-        for i, img in enumerate(imagens):
-            frame = ctk.CTkFrame(
-                self.thumb_scroll,
-                fg_color="#0D2137",
-                corner_radius=8,
-                border_width=1,
-                border_color="#1E3450",
-            )
-            frame.pack(side="left", padx=6, pady=4)
-
-            # Gera miniatura com CTkImage (HighDPI)
-            thumb_img = img.copy()
-            thumb_img.thumbnail(THUMB_SIZE, Image.LANCZOS)
-            ctk_img = ctk.CTkImage(light_image=thumb_img, dark_image=thumb_img, size=THUMB_SIZE)
-            self._thumb_refs.append(ctk_img)
-
-            lbl_img = ctk.CTkLabel(frame, image=ctk_img, text="")
-            lbl_img.pack(padx=6, pady=(6, 2))
-
-            ctk.CTkLabel(
-                frame,
-                text=f"Pág. {i + 1}",
-                font=ctk.CTkFont(size=10),
-                text_color="#546E7A",
-            ).pack(pady=(0, 2))
-
-            # Botão remover
-            ctk.CTkButton(
-                frame,
-                text="✕",
-                width=24,
-                height=20,
-                font=ctk.CTkFont(size=10),
-                fg_color="#B71C1C",
-                hover_color="#C62828",
-                corner_radius=4,
-                command=lambda idx=i: self._remover_imagem(idx),
-            ).pack(pady=(0, 6))
+        lbl_pag = ctk.CTkLabel(
+            frame,
+            text="",
+            font=ctk.CTkFont(size=10),
+            text_color="#546E7A",
+        )
+        lbl_pag.pack(pady=(0, 2))
+
+        # Botão remover
+        ctk.CTkButton(
+            frame,
+            text="✕",
+            width=24,
+            height=20,
+            font=ctk.CTkFont(size=10),
+            fg_color="#B71C1C",
+            hover_color="#C62828",
+            corner_radius=4,
+            command=lambda: self._remover_pagina(pid),
+        ).pack(pady=(0, 6))
+        return frame, lbl_pag, ctk_img
 
     # ── Ações ──────────────────────────────────────────────────────────────────
 
@@ -328,12 +360,73 @@ class ScanScreen(ctk.CTkFrame):
     def _on_image_captured(self, img):
         self.btn_scan.configure(state="normal", text="📷   Escanear Página")
         if img:
-            img = scan_module.optimize_image(img)
-            self.transaction.etapa_atual.adicionar_imagem(img)
-            # Ao adicionar a imagem, se precisou de CPF, a imagem principal será salva 
+            # Ao adicionar a imagem, se precisou de CPF, a imagem principal será salva
             # na hora de avançar a etapa
-            self._valida_estado_botoes()
+            self._adicionar_em_background([img], otimizar=True)
+
+    def _adicionar_em_background(self, imagens, otimizar: bool = False):
+        """
+        Otimiza, grava no disco e gera a miniatura fora da thread da UI; depois só
+        anota as páginas na etapa em que foram capturadas e atualiza a tela.
+        """
+        etapa = self.transaction.etapa_atual
+        store = self.transaction.store
+        self._capturas_pendentes += 1
+        self._valida_estado_botoes()
+
+        def run():
+            paginas, erro = [], None
+            try:
+                for img in imagens:
+                    if otimizar:
+                        img = scan_module.optimize_image(img)
+                    paginas.append(store.gravar(img, miniatura=THUMB_SIZE))
+            except Exception as e:
+                erro = e
+            self.after(0, lambda: self._on_paginas_gravadas(etapa, paginas, erro))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _on_paginas_gravadas(self, etapa, paginas, erro):
+        self._capturas_pendentes -= 1
+        repetidas = []
+        for pagina in paginas:
+            duplicatas = etapa.adicionar_imagem(pagina)
+            if duplicatas:
+                self._duplicadas.add(pagina.id)
+                repetidas.append((pagina, duplicatas[0]))
+        if erro is not None:
+            mb.showerror("Erro", f"Não foi possível adicionar a página:\n{erro}")
+        if self.winfo_exists() and not self.transaction.concluida:
             self._refresh()
+        for pagina, duplicata in repetidas:
+            self._confirmar_repetida(etapa, pagina, duplicata)
+
+    def _confirmar_repetida(self, etapa, pagina, duplicata):
+        """Avisa que a página parece já ter sido digitalizada e permite descartá-la."""
+        outra = next((e for e in self.transaction.etapas if e.id == duplicata.etapa_id), None)
+        if outra is None or pagina.id not in etapa.imagens.ids:
+            return
+        num = etapa.imagens.ids.index(pagina.id) + 1
+        num_outra = outra.imagens.ids.index(duplicata.pagina.id) + 1
+        onde = "nesta etapa" if outra is etapa else f"na etapa \"{outra.titulo}\""
+        manter = mb.askyesno(
+            "Página repetida?",
+            f"A página {num} parece ser a mesma folha da página {num_outra} {onde}.\n\n"
+            "Páginas repetidas aumentam o PDF e confundem a auditoria.\n"
+            "Deseja manter esta página mesmo assim?",
+            icon="warning",
+        )
+        if not manter and pagina.id in etapa.imagens.ids:
+            etapa.remover_imagem(etapa.imagens.ids.index(pagina.id))
+            if self.winfo_exists() and not self.transaction.concluida:
+                self._valida_estado_botoes()
+                self._refresh()
+
+    def _remover_pagina(self, pid: str):
+        ids = self.transaction.etapa_atual.imagens.ids
+        if pid in ids:
+            self._remover_imagem(ids.index(pid))
 
     def _remover_imagem(self, index: int):
         self.transaction.etapa_atual.remover_imagem(index)
@@ -346,7 +439,7 @@ class ScanScreen(ctk.CTkFrame):
         etapa = self.transaction.etapa_atual
         if etapa.require_cpf:
             cpf_salvo = self.var_cpf.get()
-            etapa.cpf = cpf_salvo
+            etapa.definir_cpf(cpf_salvo)
             try:
                 # Salva TODAS as imagens dessa etapa como o documento de identificação
                 if etapa.tem_imagens:
@@ -427,11 +520,7 @@ class ScanScreen(ctk.CTkFrame):
             if dialog.result == "use":
                 # Carregar o arquivo existente
                 try:
-                    for p in paths_existentes:
-                        img = Image.open(p)
-                        self.transaction.etapa_atual.adicionar_imagem(img.copy())
-                    self._valida_estado_botoes()
-                    self._refresh()
+                    self._adicionar_em_background([abrir_arquivo(p) for p in paths_existentes])
                 except Exception as e:
                     mb.showerror("Erro", f"Não foi possível carregar o arquivo:\n{e}")
             # Se for "new", apenas faz nada (deixa a lista de imagens vazia para escanear/importar novo)
@@ -1,31 +1,54 @@
 """
 search_document_screen.py - Tela de pesquisa avulsa para encontrar documentos na pasta CPFs (Validação + Download).
+
+A galeria é virtualizada: cada página começa como um placeholder e só as que estão
+visíveis (ou perto) são decodificadas, em threads, já na escala do preview
+(core.preview_cache). Páginas que saem de vista liberam o bitmap do widget.
 """
 
 from __future__ import annotations
 
 import os
 import shutil
-from typing import TYPE_CHECKING, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List
 from tkinter import filedialog
 import tkinter.messagebox as mb
 import customtkinter as ctk
 from PIL import Image
-
 from core.cpf_manager import find_all_documents_by_cpf, validate_cpf
+from core.preview_cache import previews
 
 if TYPE_CHECKING:
     from ui.app import App
 
 
+# Largura do preview de cada página na galeria
+PREVIEW_W = 700
+# Altura do placeholder até a página carregar (proporção A4)
+PLACEHOLDER_H = int(PREVIEW_W * 1.414)
+# Intervalo (ms) da checagem de quais páginas estão visíveis
+INTERVALO_VISIBILIDADE_MS = 150
+
+
 class SearchDocumentScreen(ctk.CTkFrame):
     def __init__(self, parent: ctk.CTkFrame, app: App, **kwargs: object) -> None:
         super().__init__(parent, fg_color="transparent", **kwargs)
         self.app = app
-        self._img_refs = []  # Lista para segurar referências de CTkImage e evitar GC
         self._found_paths = [] # Guardo os paths do último CPF buscado
+        # Estado de cada página da galeria: path, widgets, estado ("vazio"/"carregando"/"pronto")
+        self._paginas: List[Dict[str, Any]] = []
+        self._scroll_frame = None
+        # Incrementada a cada nova busca: resultados de buscas antigas são ignorados
+        self._geracao = 0
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preview")
         self._build()
 
+    def destroy(self) -> None:
+        self._geracao += 1
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
+
     def _build(self) -> None:
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(2, weight=1)
@@ -104,7 +127,9 @@ class SearchDocumentScreen(ctk.CTkFrame):
         self._show_empty_state("Digite um CPF válido e clique em Pesquisar.")
 
     def _show_empty_state(self, message: str) -> None:
-        self._img_refs = []
+        self._geracao += 1
+        self._paginas = []
+        self._scroll_frame = None
         self._found_paths = []
         for w in self.result_frame.winfo_children():
             w.destroy()
@@ -143,7 +168,8 @@ class SearchDocumentScreen(ctk.CTkFrame):
             self._show_empty_state(f"Nenhum documento encontrado para o CPF {cpf}.")
 
     def _show_result(self, cpf: str, image_paths: List[str]) -> None:
-        self._img_refs = []
+        self._geracao += 1
+        self._paginas = []
         for w in self.result_frame.winfo_children():
             w.destroy()
             
@@ -180,9 +206,10 @@ class SearchDocumentScreen(ctk.CTkFrame):
             command=self._download_files,
         ).pack(side="right")
 
-        # Container para imagens
+        # Container para imagens: só placeholders; as páginas carregam conforme aparecem
         scroll_frame = ctk.CTkScrollableFrame(self.result_frame, fg_color="#0D1B2A", corner_radius=12)
         scroll_frame.pack(padx=24, pady=(0, 24), fill="both", expand=True)
+        self._scroll_frame = scroll_frame
         
         for i, path in enumerate(image_paths, 1):
             page_label = ctk.CTkLabel(
@@ -195,24 +222,104 @@ class SearchDocumentScreen(ctk.CTkFrame):
             
             img_container = ctk.CTkFrame(scroll_frame, fg_color="transparent")
             img_container.pack(pady=(0, 12))
-            
+
+            pagina: Dict[str, Any] = {
+                "numero": i,
+                "path": path,
+                "container": img_container,
+                "widget": None,
+                "ctk_img": None,
+                "tamanho": (PREVIEW_W, PLACEHOLDER_H),
+                "estado": "vazio",
+            }
+            self._paginas.append(pagina)
+            self._mostrar_placeholder(pagina)
+
+        self._atualizar_visiveis(self._geracao)
+
+    # ── Galeria virtualizada ──────────────────────────────────────────────────
+
+    def _trocar_widget(self, pagina: Dict[str, Any], widget: ctk.CTkBaseClass) -> None:
+        if pagina["widget"] is not None:
+            pagina["widget"].destroy()
+        pagina["widget"] = widget
+        widget.pack(padx=16, pady=8)
+
+    def _mostrar_placeholder(self, pagina: Dict[str, Any], texto: str = "") -> None:
+        largura, altura = pagina["tamanho"]
+        self._trocar_widget(pagina, ctk.CTkLabel(
+            pagina["container"],
+            text=texto or f"⌛  Carregando página {pagina['numero']}...",
+            width=largura,
+            height=altura,
+            fg_color="#102338",
+            corner_radius=8,
+            font=ctk.CTkFont(size=12),
+            text_color="#546E7A",
+        ))
+        pagina["ctk_img"] = None
+
+    def _mostrar_preview(self, pagina: Dict[str, Any], img: Image.Image) -> None:
+        # CTkImage recebe o bitmap já reduzido, não a página inteira
+        pagina["tamanho"] = img.size
+        pagina["ctk_img"] = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
+        self._trocar_widget(pagina, ctk.CTkLabel(pagina["container"], image=pagina["ctk_img"], text=""))
+        pagina["estado"] = "pronto"
+
+    def _atualizar_visiveis(self, geracao: int) -> None:
+        """Carrega as páginas na área visível (mais uma tela de folga) e libera as distantes."""
+        if geracao != self._geracao or self._scroll_frame is None or not self.winfo_exists():
+            return
+        canvas = self._scroll_frame._parent_canvas
+        altura_tela = max(canvas.winfo_height(), 1)
+        topo = canvas.canvasy(0)
+        fim = topo + altura_tela
+
+        for pagina in self._paginas:
+            container = pagina["container"]
+            y0 = container.winfo_y()
+            y1 = y0 + max(container.winfo_height(), 1)
+            if y1 >= topo - altura_tela and y0 <= fim + altura_tela:
+                if pagina["estado"] == "vazio":
+                    self._carregar(pagina, geracao)
+            elif pagina["estado"] == "pronto" and (y1 < topo - 3 * altura_tela or y0 > fim + 3 * altura_tela):
+                # Fora de vista: volta ao placeholder (o preview segue no LRU do preview_cache)
+                self._mostrar_placeholder(pagina)
+                pagina["estado"] = "vazio"
+            elif pagina["estado"] == "carregando" and (y1 < topo - 3 * altura_tela or y0 > fim + 3 * altura_tela):
+                pagina["estado"] = "vazio"  # a thread ignora o pedido se ainda não começou
+
+        self.after(INTERVALO_VISIBILIDADE_MS, lambda: self._atualizar_visiveis(geracao))
+
+    def _carregar(self, pagina: Dict[str, Any], geracao: int) -> None:
+        img = previews.obter(pagina["path"], PREVIEW_W)
+        if img is not None:
+            self._mostrar_preview(pagina, img)
+            return
+        pagina["estado"] = "carregando"
+
+        def run() -> None:
+            if geracao != self._geracao or pagina["estado"] != "carregando":
+                return
             try:
-                img = Image.open(path)
-                orig_w, orig_h = img.size
-                
-                # Tamanho do preview no scroll
-                target_w = 700
-                ratio = target_w / orig_w
-                target_h = int(orig_h * ratio)
-                
-                # Novo objeto ctk.CTkImage preservando nitidez
-                ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=(target_w, target_h))
-                self._img_refs.append(ctk_img)
-                
-                lbl_preview = ctk.CTkLabel(img_container, image=ctk_img, text="")
-                lbl_preview.pack(padx=16, pady=8)
+                img, erro = previews.carregar(pagina["path"], PREVIEW_W), None
             except Exception as e:
-                ctk.CTkLabel(img_container, text=f"Erro ao carregar página {i}:\n{e}").pack()
+                img, erro = None, e
+            try:
+                self.after(0, lambda: self._on_preview_carregado(pagina, geracao, img, erro))
+            except RuntimeError:
+                pass  # janela já fechada
+
+        self._pool.submit(run)
+
+    def _on_preview_carregado(self, pagina: Dict[str, Any], geracao: int, img, erro) -> None:
+        if geracao != self._geracao or pagina["estado"] != "carregando":
+            return
+        if erro is not None:
+            self._mostrar_placeholder(pagina, f"Erro ao carregar página {pagina['numero']}:\n{erro}")
+            pagina["estado"] = "erro"
+            return
+        self._mostrar_preview(pagina, img)
 
     def _download_files(self) -> None:
         """Permite que o usuário salve os arquivos em um local escolhido."""
@@ -174,6 +174,94 @@ class SettingsScreen(ctk.CTkFrame):
         )
         self.lbl_test_result.grid(row=7, column=0, sticky="w", padx=4, pady=(4, 8))
 
+        # Modo de auditoria
+        self.two_phase_var = ctk.BooleanVar(value=self.settings.get("audit_mode") == "duas_fases")
+        ctk.CTkCheckBox(
+            section,
+            text="Auditoria em duas fases (lê cada etapa em paralelo e depois consolida)",
+            variable=self.two_phase_var,
+            font=ctk.CTkFont(size=12),
+        ).grid(row=8, column=0, sticky="w", padx=4, pady=(4, 8))
+
+        self.ocr_local_var = ctk.BooleanVar(value=bool(self.settings.get("ocr_local", False)))
+        ctk.CTkCheckBox(
+            section,
+            text="OCR local do cupom (confere autorização e data sem internet; requer rapidocr_onnxruntime)",
+            variable=self.ocr_local_var,
+            font=ctk.CTkFont(size=12),
+        ).grid(row=9, column=0, sticky="w", padx=4, pady=(0, 8))
+
+        self.failover_var = ctk.BooleanVar(value=bool(self.settings.get("ai_failover", False)))
+        ctk.CTkCheckBox(
+            section,
+            text="Failover entre provedores (usa as outras chaves salvas se o principal falhar ou demorar)",
+            variable=self.failover_var,
+            font=ctk.CTkFont(size=12),
+        ).grid(row=10, column=0, sticky="w", padx=4, pady=(0, 8))
+
+        self.cascata_var = ctk.BooleanVar(value=bool(self.settings.get("ai_cascata", False)))
+        ctk.CTkCheckBox(
+            section,
+            text="Cascata de modelos (modelo rápido primeiro; premium só para reprovados ou duvidosos)",
+            variable=self.cascata_var,
+            font=ctk.CTkFont(size=12),
+        ).grid(row=11, column=0, sticky="w", padx=4, pady=(0, 8))
+
+        # Modelos da cascata; substituem o "Modelo" acima quando ela está ligada
+        cascata_row = ctk.CTkFrame(section, fg_color="transparent")
+        cascata_row.grid(row=12, column=0, sticky="ew", padx=28, pady=(0, 8))
+        cascata_row.grid_columnconfigure((0, 1), weight=1)
+
+        self.modelo_rapido_var = ctk.StringVar(value=self.settings.get("ai_modelo_rapido", ""))
+        self.modelo_premium_var = ctk.StringVar(value=self.settings.get("ai_modelo_premium", ""))
+        self.cascata_confianca_var = ctk.StringVar(
+            value=str(self.settings.get("ai_cascata_confianca", 0.8))
+        )
+        for col, (variavel, rotulo, largura) in enumerate((
+            (self.modelo_rapido_var, "Modelo rápido:", 140),
+            (self.modelo_premium_var, "Modelo premium:", 140),
+            (self.cascata_confianca_var, "Confiança mínima (0-1):", 110),
+        )):
+            ctk.CTkLabel(cascata_row, text=rotulo, font=ctk.CTkFont(size=11), text_color="#90A4AE").grid(
+                row=0, column=col, sticky="w", padx=(0, 8)
+            )
+            ctk.CTkEntry(
+                cascata_row, textvariable=variavel, font=ctk.CTkFont(size=12), height=32, width=largura
+            ).grid(row=1, column=col, sticky="ew", padx=(0, 8))
+        ctk.CTkLabel(
+            section,
+            text="💡 Modelos vazios usam o par padrão do provedor. Com a cascata ligada, "
+                 "o modelo escolhido acima é ignorado na auditoria completa",
+            font=ctk.CTkFont(size=10),
+            text_color="#546E7A",
+        ).grid(row=13, column=0, sticky="w", padx=28, pady=(0, 8))
+
+        # Limite de requisições/tokens por minuto (compartilhado entre os terminais), por
+        # provedor: os campos mostram o do provedor selecionado acima
+        limite_row = ctk.CTkFrame(section, fg_color="transparent")
+        limite_row.grid(row=14, column=0, sticky="ew", padx=4, pady=(4, 8))
+
+        self._limites = {p: list(v) for p, v in self.settings.get("ai_limites", {}).items()}
+        rpm, tpm = self._limites.get(self.provider_var.get(), (0, 0))
+        self.rpm_var = ctk.StringVar(value=str(rpm))
+        self.tpm_var = ctk.StringVar(value=str(tpm))
+        for col, (variavel, rotulo) in enumerate((
+            (self.rpm_var, "Requisições/min:"),
+            (self.tpm_var, "Tokens de entrada/min:"),
+        )):
+            ctk.CTkLabel(limite_row, text=rotulo, font=ctk.CTkFont(size=11), text_color="#90A4AE").grid(
+                row=0, column=col, sticky="w", padx=(0, 8)
+            )
+            ctk.CTkEntry(
+                limite_row, textvariable=variavel, font=ctk.CTkFont(size=12), height=32, width=140
+            ).grid(row=1, column=col, sticky="w", padx=(0, 8))
+        ctk.CTkLabel(
+            section,
+            text="💡 Cota do plano do provedor selecionado; 0 = padrão do provedor (sem limite no Gemini)",
+            font=ctk.CTkFont(size=10),
+            text_color="#546E7A",
+        ).grid(row=15, column=0, sticky="w", padx=4, pady=(0, 8))
+
     # ── Seção Armazenamento ─────────────────────────────────────────────────────
 
     def _build_storage_section(self, parent):
@@ -310,12 +398,18 @@ class SettingsScreen(ctk.CTkFrame):
 
     def _on_provider_change(self):
         provider = self.provider_var.get()
+        old_provider = self.settings.get("ai_provider", "gemini")
         # Salva chave atual antes de trocar
         if hasattr(self, "api_key_var"):
-            old_provider = self.settings.get("ai_provider", "gemini")
             self.settings.setdefault("api_keys", {})[old_provider] = self.api_key_var.get()
 
         self.settings["ai_provider"] = provider
+        # Limites por minuto: guarda os do provedor anterior e mostra os do novo
+        if hasattr(self, "rpm_var"):
+            self._limites[old_provider] = [self.rpm_var.get().strip(), self.tpm_var.get().strip()]
+            rpm, tpm = self._limites.get(provider, (0, 0))
+            self.rpm_var.set(str(rpm))
+            self.tpm_var.set(str(tpm))
         # Atualiza campo de chave
         self.api_key_var.set(self.settings.get("api_keys", {}).get(provider, ""))
         # Atualiza modelos disponíveis
@@ -404,11 +498,43 @@ class SettingsScreen(ctk.CTkFrame):
     # ── Salvar ──────────────────────────────────────────────────────────────────
 
     def _salvar(self):
+        try:
+            confianca = float(self.cascata_confianca_var.get().replace(",", ".") or 0.8)
+        except ValueError:
+            confianca = -1.0
+        if not 0 <= confianca <= 1:
+            mb.showerror("Configurações", "Confiança mínima da cascata inválida (use um número entre 0 e 1).")
+            return
+        self._limites[self.provider_var.get()] = [self.rpm_var.get().strip(), self.tpm_var.get().strip()]
+        limites = {}
+        for provider, valores in self._limites.items():
+            try:
+                rpm, tpm = (int(str(v).strip() or 0) for v in valores)
+            except ValueError:
+                rpm = tpm = -1
+            if rpm < 0 or tpm < 0:
+                mb.showerror(
+                    "Configurações",
+                    f"Limites por minuto inválidos para {provider} (use números inteiros; 0 = padrão).",
+                )
+                return
+            if rpm or tpm:
+                limites[provider] = [rpm, tpm]
+
         # Captura valores atuais
         self.settings["ai_provider"] = self.provider_var.get()
         self.settings["ai_model"] = self.model_var.get()
         self.settings.setdefault("api_keys", {})[self.provider_var.get()] = self.api_key_var.get()
         self.settings["output_folder"] = self.folder_var.get()
+        self.settings["audit_mode"] = "duas_fases" if self.two_phase_var.get() else "completo"
+        self.settings["ocr_local"] = self.ocr_local_var.get()
+        self.settings["ai_failover"] = self.failover_var.get()
+        self.settings["ai_cascata"] = self.cascata_var.get()
+        self.settings["ai_modelo_rapido"] = self.modelo_rapido_var.get().strip()
+        self.settings["ai_modelo_premium"] = self.modelo_premium_var.get().strip()
+        self.settings["ai_cascata_confianca"] = confianca
+        self.settings["ai_limites"] = limites
+        self.settings.setdefault("ai_modelos", {})[self.provider_var.get()] = self.model_var.get()
         scanner_val = self.scanner_var.get()
         self.settings["scanner_name"] = scanner_val if "(Nenhum" not in scanner_val else ""
 